@@ -1,16 +1,62 @@
 #!/usr/bin/env python
+import argparse
+import os
 import sys
 from textgen._version import __version__
 
+def parseOptions(argv):
+    """
+    Parse the command line arguments
+    """
+    parser = argparse.ArgumentParser(description='LOFAR Imaging Text '+\
+             'Generator. Without arguments, the graphical interface is shown.')
+    parser.add_argument('--batch', metavar='TARGETS', help='generate text '+\
+                        'files for all observations in a CSV or JSON target '+\
+                        'list instead of showing the GUI')
+    parser.add_argument('--jobs', type=int, default=None, help='number of '+\
+                        'worker processes in batch mode (default: number of '+\
+                        'CPU cores)')
+    parser.add_argument('--outdir', default='.', help='directory to write '+\
+                        'the generated files to in batch mode')
+    parser.add_argument('--xml', action='store_true', help='also convert '+\
+                        'the text files to xml with xmlgen.py in batch mode')
+    parser.add_argument('--manifest', default=None, help='name of the JSON '+\
+                        'manifest written in batch mode (default: '+\
+                        '<outdir>/manifest.json)')
+    parser.add_argument('--startup-profile', action='store_true', \
+                        help='print the time taken by each start-up phase '+\
+                        'and module import of the GUI')
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
     print('LOFAR Imaging Text Generator')
     print('Version {}\n'.format(__version__))
-    
+
     # Check for python 3
     if sys.version_info.major != 3:
        raise Exception("You need Python 3 to run the LOFAR Imaging Text Generator")
-    
+
+    options = parseOptions(sys.argv[1:])
+    if options.batch:
+        from textgen.Batch import readTargets, runBatch
+        manifest = options.manifest
+        if manifest is None:
+            manifest = os.path.join(options.outdir, 'manifest.json')
+        results = runBatch(readTargets(options.batch), options.outdir, \
+                           options.jobs, options.xml, manifest)
+        sys.exit(int(any(item['status'] != 'ok' for item in results)))
+
+    profile = None
+    if options.startup_profile:
+        from textgen.StartupProfile import StartupProfile
+        profile = StartupProfile()
+        profile.start()
+
     from textgen.GUIWindow import *
-    
-    gui = GuiWindow()
+    if profile is not None:
+        profile.mark('GUI modules imported')
+
+    gui = GuiWindow(profile=profile)
+    if profile is not None:
+        profile.mark('window created')
     gui.root.mainloop()
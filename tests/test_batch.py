@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textgen.Batch import findDuplicateRows, runBatch, specFromRow
+
+POINTING = 'F1,10:00:00,50:00:00,'
+
+
+def row(startTime, pointing=POINTING, **fields):
+    result = {'projectName': 'LC14_004', 'mainName': 'test',
+              'startTime': startTime, 'subbands': '104..143',
+              'pointing': pointing, 'duration': '2'}
+    result.update(fields)
+    return result
+
+
+class DuplicateRowsTest(unittest.TestCase):
+    """
+    Rows that write the same text file should be found before they run
+    """
+
+    def testOutFileName(self):
+        self.assertEqual(specFromRow(row('2020-09-03-10-00-00')).\
+                         getOutFileName(), 'LC14_004_20200903_F1.txt')
+
+    def testSameDayAndTarget(self):
+        rows = [row('2020-09-03-10-00-00'), row('2020-09-03-22-00-00'),
+                row('2020-09-04-10-00-00'),
+                row('2020-09-03-10-00-00', 'F2,10:00:00,50:00:00,'),
+                row('2020-09-03-10-00-00', projectName='LC14_005'),
+                row('2020-09-03-10-00-00')]
+        self.assertEqual(findDuplicateRows(rows), \
+                         {1: (0, 'LC14_004_20200903_F1.txt'),
+                          5: (0, 'LC14_004_20200903_F1.txt')})
+
+    def testInvalidRowsAreLeftToFail(self):
+        rows = [row('not a date'), row('not a date'), row('2020-09-03', '')]
+        self.assertEqual(findDuplicateRows(rows), {})
+
+
+class RunBatchTest(unittest.TestCase):
+    """
+    A duplicate row should fail without touching the file of the first row
+    """
+
+    def setUp(self):
+        self.outDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outDir)
+
+    def testDuplicateRow(self):
+        manifest = os.path.join(self.outDir, 'manifest.json')
+        results = runBatch([row('2020-09-03-10-00-00'), \
+                            row('2020-09-03-22-00-00', duration='4')], \
+                           self.outDir, 1, manifest=manifest)
+        self.assertEqual([result['status'] for result in results], \
+                         ['ok', 'failed'])
+        self.assertIn('same text file as row 0', results[1]['error'])
+        self.assertEqual(sorted(os.listdir(self.outDir)), \
+                         ['LC14_004_20200903_F1.txt', 'manifest.json'])
+        with open(os.path.join(self.outDir, \
+                               'LC14_004_20200903_F1.txt')) as textFile:
+            self.assertIn('targetDuration_s=7200', textFile.read())
+        with open(manifest) as manifestFile:
+            summary = json.load(manifestFile)
+        self.assertEqual((summary['rows'], summary['failed']), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
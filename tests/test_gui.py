@@ -0,0 +1,83 @@
+import os
+import queue
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textgen.errors import JobCancelledError
+
+try:
+    from textgen import GUIWindow
+except ImportError:  # tkinter is not installed
+    GUIWindow = None
+
+
+@unittest.skipIf(GUIWindow is None, 'tkinter is not installed')
+class WorkerTest(unittest.TestCase):
+    """
+    The worker thread should run the submitted jobs in order, report how
+    each one ended and keep running when a job fails
+    """
+
+    def setUp(self):
+        # The worker does not use Tk, so the window itself is not created
+        self.window = GUIWindow.GuiWindow.__new__(GUIWindow.GuiWindow)
+        self.window.jobs = queue.Queue()
+        self.window.events = queue.Queue()
+        self.window.cancelJob = threading.Event()
+        threading.Thread(target=self.window._workerLoop, daemon=True).start()
+
+    def runJobs(self, *runs):
+        """
+        Run a job for each function in runs, in place of _runJob, and return
+        the events it posted
+        """
+        results = []
+        for run in runs:
+            with mock.patch.object(self.window, '_runJob', side_effect=run):
+                self.window.jobs.put(None)
+                events = []
+                while not events or events[-1][0] != 'finished':
+                    events.append(self.window.events.get(timeout=10))
+                results.append(events)
+        return results
+
+    def failingJob(self, spec):
+        raise RuntimeError('no luck')
+
+    def cancelledJob(self, spec):
+        raise JobCancelledError
+
+    def testFailedJob(self):
+        failed, finished = self.runJobs(self.failingJob, lambda spec: None)
+        self.assertEqual(failed, [('status', 'Failed'), \
+                                  ('warning', \
+                                   'Unexpected error: RuntimeError: no luck'), \
+                                  ('finished', None)])
+        self.assertEqual(finished, [('finished', None)])
+
+    def testCancelledJob(self):
+        with mock.patch('sys.stdout'):
+            cancelled, = self.runJobs(self.cancelledJob)
+        self.assertEqual(cancelled, [('status', 'Cancelled'), \
+                                     ('finished', None)])
+
+    def testImportError(self):
+        # A job that cannot load the astronomy modules fails with an error
+        with mock.patch.object(GUIWindow, '_loadImaging', \
+                               side_effect=ImportError('No module ephem')):
+            self.window.jobs.put(None)
+            events = []
+            while not events or events[-1][0] != 'finished':
+                events.append(self.window.events.get(timeout=10))
+        self.assertEqual(events[-3:], [('status', 'Failed'), \
+                                       ('error', \
+                                        'ImportError: No module ephem'), \
+                                       ('finished', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import xmlgen
+from textgen.Imaging import generateTextFile
+from textgen.ObservationSpec import ObservationSpec
+
+
+def spec(pointing='F1,10:00:00,50:00:00,'):
+    return ObservationSpec(projectName='LC14_004', mainName='test', \
+                           startTime='2020-09-03-10-00-00', \
+                           subbands='104..143', pointing=pointing, \
+                           duration='2')
+
+
+class GenerateTextFileTest(unittest.TestCase):
+    """
+    generateTextFile should write a text file that xmlgen converts, without
+    the GUI
+    """
+
+    def setUp(self):
+        self.outDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outDir)
+
+    def testWithoutTkinter(self):
+        script = 'import sys\n' \
+                 'sys.modules["tkinter"] = None\n' \
+                 'sys.path.insert(0, sys.argv[1])\n' \
+                 'from textgen.ObservationSpec import ObservationSpec\n' \
+                 'from textgen.Imaging import generateTextFile\n' \
+                 'spec = ObservationSpec(projectName="LC14_004", ' \
+                 'mainName="test", startTime="2020-09-03-10-00-00", ' \
+                 'subbands="104..143", pointing="F1,10:00:00,50:00:00,", ' \
+                 'duration="2")\n' \
+                 'print(generateTextFile(spec, sys.argv[2])[0])\n'
+        process = subprocess.run([sys.executable, '-c', script, ROOT, \
+                                  self.outDir], stdout=subprocess.PIPE, \
+                                 stderr=subprocess.STDOUT)
+        self.assertEqual(process.returncode, 0, process.stdout)
+        outFileName = os.path.join(self.outDir, 'LC14_004_20200903_F1.txt')
+        self.assertEqual(process.stdout.decode().splitlines()[-1], \
+                         outFileName)
+        with open(outFileName) as textFile:
+            text = textFile.read()
+        self.assertIn('targetDuration_s=7200', text)
+        xml = xmlgen.generate(text, log=io.StringIO())
+        self.assertIn('<name>F1/1/TO</name>', xml)
+
+    def testWarnings(self):
+        warnings = []
+        outFileName, img = generateTextFile(spec('F1,10:00:00,-20:00:00,'), \
+                                            self.outDir, warnings.append)
+        self.assertTrue(os.path.exists(outFileName))
+        self.assertEqual(img.warnings, warnings)
+        self.assertIn('below user specified elevation', warnings[0])
+
+    def testNoWarnings(self):
+        warnings = []
+        generateTextFile(spec(), self.outDir, warnings.append)
+        self.assertEqual(warnings, [])
+
+
+class LazyImportTest(unittest.TestCase):
+    """
+    The GUI should start without loading the astronomy modules
+    """
+
+    def testGuiWindow(self):
+        script = 'import sys\n' \
+                 'sys.path.insert(0, sys.argv[1])\n' \
+                 'import textgen.GUIWindow\n' \
+                 'print(sorted(set(sys.modules) & {"astropy", "ephem", ' \
+                 '"numpy", "textgen.Imaging"}))\n'
+        process = subprocess.run([sys.executable, '-c', script, ROOT], \
+                                 stdout=subprocess.PIPE, \
+                                 stderr=subprocess.STDOUT)
+        self.assertEqual(process.returncode, 0, process.stdout)
+        self.assertEqual(process.stdout.strip(), b'[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import xmlgen
+from textgen.Imaging import Imaging
+from textgen.ObservationSpec import ObservationSpec
+from textgen.SubbandSet import SubbandSet
+from textgen.errors import InvalidSubbandError, InvalidSubBandOrderError, \
+                           OutOfBoundsSubBandError
+
+
+class SubbandSetTest(unittest.TestCase):
+    """
+    The SubbandSet of textgen and the copy in xmlgen.py should parse, count
+    and check subband lists the same way
+    """
+
+    CLASSES = (SubbandSet, xmlgen.SubbandSet)
+
+    def testParse(self):
+        for cls in self.CLASSES:
+            subbands = cls('[104..107, 3*110,120]')
+            self.assertEqual(subbands.ranges, \
+                             [(104, 107, 1), (110, 110, 3), (120, 120, 1)])
+            self.assertEqual(len(subbands), 8)
+            self.assertEqual(list(subbands), \
+                             [104, 105, 106, 107, 110, 110, 110, 120])
+
+    def testEmpty(self):
+        for cls in self.CLASSES:
+            for text in ('', '[]', ' [ ] '):
+                self.assertEqual(len(cls(text)), 0)
+
+    def testInvalid(self):
+        for cls, error in zip(self.CLASSES, (ValueError, xmlgen.GenException)):
+            for text in ('104..', 'a', '1..2..3', '2*3*4', '104;105'):
+                with self.assertRaises(error):
+                    cls(text)
+
+    def testReversedRange(self):
+        for cls in self.CLASSES:
+            subbands = cls('110..104,120')
+            self.assertTrue(subbands.hasReversedRange())
+            self.assertEqual(len(subbands), 1)
+            self.assertFalse(cls('104..110').hasReversedRange())
+
+    def testWithinBounds(self):
+        for cls in self.CLASSES:
+            self.assertTrue(cls('64..100,448').withinBounds(64, 448))
+            self.assertFalse(cls('63..100').withinBounds(64, 448))
+            self.assertFalse(cls('100,449').withinBounds(64, 448))
+            # A reversed range has no subbands, so it is not out of bounds
+            self.assertTrue(cls('500..10').withinBounds(64, 448))
+
+    def testDuplicates(self):
+        for cls in self.CLASSES:
+            self.assertEqual(cls('104..143').duplicates(), [])
+            self.assertEqual(cls('104..110,108..112,120').duplicates(), \
+                             [108, 109, 110])
+            self.assertEqual(cls('2*105,104..106').duplicates(), [105])
+            self.assertEqual(cls('100..120,105..106,110..112').duplicates(), \
+                             [105, 106, 110, 111, 112])
+            self.assertEqual(cls('104,104,104').duplicates(), [104])
+
+    def testXmlgenWarnsAboutDuplicates(self):
+        self.assertEqual(xmlgen.parse_subband_list('104..106,106', 4), \
+                         [104, 105, 106, 106])
+        with self.assertRaises(xmlgen.GenException):
+            xmlgen.verifySubbandList('subbands', '104..106', 4)
+
+
+class ImagingSubbandsTest(unittest.TestCase):
+    """
+    Imaging should reject the subband lists that the GUI does not allow
+    """
+
+    def imaging(self, subbands, rcumode='110-190 MHz'):
+        return Imaging(ObservationSpec(projectName='LC14_004', \
+                       mainName='test', startTime='2020-09-03-10-00-00', \
+                       rcumode=rcumode, subbands=subbands, \
+                       pointing='F1,10:00:00,50:00:00,', duration='2'))
+
+    def testRejected(self):
+        for subbands, error in (('', InvalidSubbandError),
+                                ('2*104', InvalidSubbandError),
+                                ('104,1*105', InvalidSubbandError),
+                                ('104..', InvalidSubbandError),
+                                ('143..104', InvalidSubBandOrderError),
+                                ('40..50', OutOfBoundsSubBandError)):
+            with self.assertRaises(error, msg=subbands):
+                self.imaging(subbands)
+
+    def testFilterLimits(self):
+        with self.assertRaises(OutOfBoundsSubBandError):
+            self.imaging('449', '170-230 MHz')
+        self.assertEqual(self.imaging('104..143,150').nSubBands, 41)
+
+
+class StandaloneXmlgenTest(unittest.TestCase):
+    """
+    xmlgen.py should run as a script outside of the repository
+    """
+
+    def testLoadOutsideRepository(self):
+        # The same way as textgen.XmlConverter.loadXmlgen loads it from PATH
+        tmpDir = tempfile.mkdtemp()
+        try:
+            shutil.copy(os.path.join(ROOT, 'xmlgen.py'), tmpDir)
+            script = 'import importlib.util as util\n' \
+                     'spec = util.spec_from_file_location("xmlgen", ' \
+                     '"xmlgen.py")\n' \
+                     'module = util.module_from_spec(spec)\n' \
+                     'spec.loader.exec_module(module)\n' \
+                     'print(len(module.SubbandSet("1..4")))\n'
+            process = subprocess.run([sys.executable, '-I', '-c', script], \
+                                     cwd=tmpDir, stdout=subprocess.PIPE, \
+                                     stderr=subprocess.STDOUT)
+            self.assertEqual(process.returncode, 0, process.stdout)
+            self.assertEqual(process.stdout.strip(), b'4')
+        finally:
+            shutil.rmtree(tmpDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
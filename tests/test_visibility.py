@@ -0,0 +1,211 @@
+import datetime
+import os
+import sys
+import unittest
+from unittest import mock
+
+import ephem
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import textgen.Visibility as Visibility
+from textgen.Visibility import findVisibility, findCrossings, \
+                               rankCalibrators, minimumSeparations
+
+START = datetime.datetime(2020, 9, 3, 10, 0, 0)
+
+# 'RA;Dec' of a source that never sets, of 3C196 and of 3C295
+NCP = '00:00:00;89:00:00'
+CAL_3C196 = '08:13:36.0;48:13:03'
+CAL_3C295 = '14:11:20.5;52:12:10'
+CAL_3C48 = '01:37:41.3;33:09:35'
+TARGET = '10:00:00;50:00:00'
+
+
+def ephemObserver(time, horizon=0.):
+    """
+    The LOFAR core as an ephem observer, without refraction
+    """
+    lofar = ephem.Observer()
+    lofar.lon = '6.869882'
+    lofar.lat = '52.915129'
+    lofar.elevation = 15.
+    lofar.pressure = 0.
+    lofar.horizon = str(horizon)
+    lofar.date = time
+    return lofar
+
+
+def ephemBody(coord):
+    target = ephem.FixedBody()
+    target._epoch = '2000'
+    target._ra = coord.split(';')[0]
+    target._dec = coord.split(';')[1]
+    return target
+
+
+def ephemElevation(coord, time):
+    """
+    Elevation (in degrees) of coord at time at the LOFAR core computed with
+    ephem, without refraction
+    """
+    target = ephemBody(coord)
+    target.compute(ephemObserver(time))
+    return float(target.alt)*180./np.pi
+
+
+def ephemMinElevation(coord, startTime, duration):
+    """
+    Lowest elevation on a one minute grid, computed with ephem
+    """
+    return min(ephemElevation(coord, startTime + \
+                              datetime.timedelta(minutes=minute)) \
+               for minute in range(int(duration*60.) + 1))
+
+
+class FindVisibilityTest(unittest.TestCase):
+    """
+    findVisibility should agree with a sampled ephem calculation
+    """
+
+    def testMinElevation(self):
+        # The elevation at lower culmination (reached by the first source)
+        # ignores precession, which is good to about 0.2 degrees
+        coords = [NCP, CAL_3C196, CAL_3C295]
+        for coord, result in zip(coords, findVisibility(coords, START, 8., \
+                                                        20.)):
+            self.assertAlmostEqual(result.minElevation, \
+                                   ephemMinElevation(coord, START, 8.), \
+                                   delta=0.2)
+
+    def testAlwaysVisible(self):
+        result = findVisibility([NCP], START, 8., 20.)[0]
+        self.assertTrue(result.visible)
+        self.assertIsNone(result.setTime)
+
+    def testSetsDuringWindow(self):
+        result = findVisibility([CAL_3C196], START, 8., 40.)[0]
+        self.assertGreater(ephemElevation(CAL_3C196, START), 40.)
+        self.assertFalse(result.visible)
+        self.assertTrue(START < result.setTime < \
+                        START + datetime.timedelta(hours=8))
+        self.assertAlmostEqual(ephemElevation(CAL_3C196, result.setTime), \
+                               40., delta=0.05)
+
+    def testBelowAtStart(self):
+        self.assertLess(ephemElevation(CAL_3C295, START), 60.)
+        result = findVisibility([CAL_3C295], START, 1., 60.)[0]
+        self.assertFalse(result.visible)
+        self.assertEqual(result.setTime, START)
+
+
+class FindCrossingsTest(unittest.TestCase):
+    """
+    The refined crossings should agree with ephem and converge in a few steps
+    """
+
+    def countTransforms(self, *args):
+        with mock.patch.object(Visibility, '_pairwiseElevations', \
+                               wraps=Visibility._pairwiseElevations) as patch:
+            result = findCrossings(*args)
+        return result, patch.call_count
+
+    def testAgreesWithEphem(self):
+        coords = [CAL_3C196, CAL_3C295]
+        for coord, crossing in zip(coords, findCrossings(coords, START, 30.)):
+            lofar = ephemObserver(START, 30.)
+            rise = lofar.previous_rising(ephemBody(coord)).datetime()
+            setting = lofar.next_setting(ephemBody(coord)).datetime()
+            self.assertLess(abs((crossing.rise - rise).total_seconds()), 2.)
+            self.assertLess(abs((crossing.set - setting).total_seconds()), 2.)
+
+    def testNewtonConverges(self):
+        # The analytic estimate is close, so a few Newton steps are enough
+        coords = [CAL_3C196, CAL_3C295, '10:00:00;30:00:00']
+        crossings, nTransforms = self.countTransforms(coords, START, 30.)
+        self.assertLessEqual(nTransforms, 4)
+        for coord, crossing in zip(coords, crossings):
+            for time in (crossing.rise, crossing.set):
+                self.assertAlmostEqual(ephemElevation(coord, time), 30., \
+                                       delta=0.01)
+
+    def testNearCulmination(self):
+        # 3C196 culminates at about 85.3 degrees, where the elevation changes
+        # too slowly for Newton steps and the bracket is bisected
+        crossing, nTransforms = self.countTransforms([CAL_3C196], START, 85.2)
+        self.assertLess(nTransforms, Visibility.MAX_REFINE_STEPS)
+        for time in (crossing[0].rise, crossing[0].set):
+            self.assertAlmostEqual(ephemElevation(CAL_3C196, time), 85.2, \
+                                   delta=0.01)
+
+    def testNeverCrosses(self):
+        crossing, nTransforms = self.countTransforms( \
+            [NCP, '12:00:00;-60:00:00'], START, 30.)
+        self.assertTrue(crossing[0].alwaysUp)
+        self.assertTrue(crossing[1].neverUp)
+        self.assertEqual(nTransforms, 0)
+
+
+def ephemSeparation(body, other, time):
+    """
+    Separation (in degrees) between two ephem bodies seen from the LOFAR core
+    """
+    lofar = ephemObserver(time)
+    body.compute(lofar)
+    other.compute(lofar)
+    return float(ephem.separation(body, other))*180./np.pi
+
+
+class RankCalibratorsTest(unittest.TestCase):
+    """
+    rankCalibrators should order the calibrators by their elevation at the
+    start and agree with ephem
+    """
+
+    def testRanking(self):
+        calibrators = [('3C48', CAL_3C48), ('3C295', CAL_3C295), \
+                       ('3C196', CAL_3C196)]
+        end = START + datetime.timedelta(hours=4)
+        ranking = rankCalibrators(calibrators, START, end, TARGET)
+        self.assertEqual([item.name for item in ranking], \
+                         ['3C196', '3C295', '3C48'])
+        for item in ranking:
+            coord = dict(calibrators)[item.name]
+            self.assertAlmostEqual(item.startElevation, \
+                                   ephemElevation(coord, START), delta=0.01)
+            self.assertAlmostEqual(item.endElevation, \
+                                   ephemElevation(coord, end), delta=0.01)
+            self.assertAlmostEqual(item.minElevation, \
+                                   ephemMinElevation(coord, START, 4.), \
+                                   delta=0.01)
+            self.assertAlmostEqual(item.separation, ephemSeparation( \
+                ephemBody(coord), ephemBody(TARGET), START), delta=0.01)
+
+    def testWithoutTarget(self):
+        ranking = rankCalibrators([('3C196', CAL_3C196)], START, START)
+        self.assertIsNone(ranking[0].separation)
+        self.assertEqual(ranking[0].startElevation, ranking[0].endElevation)
+
+
+class MinimumSeparationsTest(unittest.TestCase):
+    """
+    minimumSeparations should agree with ephem on the same time grid
+    """
+
+    def testSunAndMoon(self):
+        coords = [CAL_3C196, TARGET]
+        separations = minimumSeparations(coords, START, 4.)
+        # astropy and ephem place the Moon about 0.1 degrees apart
+        for body, ephemClass, delta in (('sun', ephem.Sun, 0.01), \
+                                        ('moon', ephem.Moon, 0.2)):
+            self.assertEqual(len(separations[body]), len(coords))
+            for coord, separation in zip(coords, separations[body]):
+                expected = min(ephemSeparation(ephemBody(coord), \
+                    ephemClass(), START + datetime.timedelta(minutes=minute)) \
+                    for minute in range(0, 241, 15))
+                self.assertAlmostEqual(separation, expected, delta=delta)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xmlgen
+from textgen.XmlConverter import convertToXml, errorMessage, loadXmlgen, \
+                                 logWarnings
+from test_xmlgen import EXTERNAL_BLOCK, HEADER, LONGBASELINE_BLOCK, \
+                        removeKey
+
+
+class ConvertToXmlTest(unittest.TestCase):
+    """
+    convertToXml should convert a text file in-process, capturing the
+    messages of xmlgen instead of printing them
+    """
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def writeText(self, name, text):
+        textFileName = os.path.join(self.tmpDir, name)
+        with open(textFileName, 'w') as textFile:
+            textFile.write(text)
+        return textFileName
+
+    def testLoadOnce(self):
+        self.assertIs(loadXmlgen(), loadXmlgen())
+
+    def testConvert(self):
+        text = HEADER + EXTERNAL_BLOCK
+        textFileName = self.writeText('obs.txt', text)
+        with mock.patch('sys.stdout', io.StringIO()) as stdout:
+            xmlFileName, log = convertToXml(textFileName)
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertEqual(xmlFileName, os.path.join(self.tmpDir, 'obs.xml'))
+        with open(xmlFileName) as xmlFile:
+            self.assertEqual(xmlFile.read(), \
+                             xmlgen.generate(text, log=io.StringIO()))
+        self.assertIn('Processing BLOCK 1', log)
+
+    def testInvalid(self):
+        textFileName = self.writeText('obs.txt', \
+                                      HEADER + removeKey(EXTERNAL_BLOCK, \
+                                                         'clock'))
+        with self.assertRaises(xmlgen.GenException) as context:
+            convertToXml(textFileName)
+        message = errorMessage(context.exception)
+        self.assertIn('clock', message)
+        self.assertNotIn('\033[', message)
+        self.assertEqual(os.listdir(self.tmpDir), ['obs.txt'])
+
+    def testWarnings(self):
+        log = xmlgen.RED_COLOR + 'WARNING: first' + xmlgen.NO_COLOR + \
+              '\nsomething else\nWARNING: second\n'
+        self.assertEqual(logWarnings(log), ['first', 'second'])
+
+    def testThreads(self):
+        # Each conversion captures only its own messages
+        names = [self.writeText('external.txt', HEADER + EXTERNAL_BLOCK), \
+                 self.writeText('longbaseline.txt', \
+                                HEADER + LONGBASELINE_BLOCK)]
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            logs = [log for xmlFileName, log in \
+                    pool.map(convertToXml, names * 4)]
+        for index, log in enumerate(logs):
+            self.assertEqual(log, logs[index % 2])
+        self.assertIn('Prefactor', logs[0])
+        self.assertNotIn('Prefactor', logs[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
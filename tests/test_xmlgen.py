@@ -0,0 +1,753 @@
+import bz2
+import gzip
+import http.client
+import inspect
+import io
+import json
+import lzma
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xmlgen
+
+HEADER = """projectName=LC14_004
+mainFolderName=
+mainFolderDescription=
+"""
+
+# An external calibration with start times, which uses the time steps, the
+# calibrator duration and create_target_cal_beam
+EXTERNAL_BLOCK = """
+BLOCK
+packageName=PF
+packageDescription=Prefactor
+packageTag=PF
+startTimeUTC=2020-09-03 10:00:00
+timeStep1=60
+timeStep2=60
+targetDuration_s=3600
+calibratorDuration_s=600
+clock=200 MHz
+instrumentFilter=30-90 MHz
+antennaMode=LBA Outer
+stationList=all
+split_targets=F
+calibration=external
+create_calibrator_observations=T
+create_target_cal_beam=F
+processing=Preprocessing
+numberOfBitsPerSample=8
+integrationTime=1.0
+channelsPerSubband=64
+correlatedData=T
+coherentStokesData=F
+incoherentStokesData=F
+flysEye=F
+coherentDedisperseChannels=False
+Global_Subbands=154..163;10
+calibratorBeam=
+08:13:36.0;48:13:03;3C196;;;;;T;600
+BBS=3C196;;;T
+Demix=4;1;64;10;;;F
+targetBeams=
+10:00:00;50:00:00;F1;;;;;T;3600
+BBS=F1model;;;T
+Demix=4;1;64;10;;;F
+"""
+
+# An internal calibration with long baseline pipelines
+LONGBASELINE_BLOCK = """
+BLOCK
+packageName=LB
+packageDescription=LongBaseline
+targetDuration_s=3600
+clock=200 MHz
+instrumentFilter=110-190 MHz
+antennaMode=HBA Dual Inner
+stationList=core
+split_targets=F
+calibration=internal
+processing=LongBaseline
+numberOfBitsPerSample=8
+integrationTime=1.0
+channelsPerSubband=64
+correlatedData=T
+coherentStokesData=F
+incoherentStokesData=F
+flysEye=F
+coherentDedisperseChannels=False
+subbandsPerSubbandGroup=2
+subbandGroupsPerMS=1
+Global_Subbands=104..119;16
+calibratorBeam=
+08:13:36.0;48:13:03;3C196;;;;;T;3600
+BBS=3C196;;;T
+Demix=4;1;64;10;;;F
+targetBeams=
+10:00:00;50:00:00;F1;;;;;T;3600
+BBS=F1model;;;T
+Demix=4;1;64;10;;;F
+"""
+
+
+def generate(text):
+    return xmlgen.generate(text, log=io.StringIO())
+
+
+def removeKey(block, key):
+    return "\n".join(line for line in block.splitlines()
+                     if not line.startswith(key + "="))
+
+
+def blockKeys(block):
+    return [line.split("=")[0] for line in block.splitlines()
+            if re.match(r"^\w+=", line)]
+
+
+class MissingKeyTest(unittest.TestCase):
+    """
+    A BLOCK with a missing key should either be converted without a None in
+    the XML or be rejected with a GenException
+    """
+
+    def assertRejected(self, block, key):
+        with self.assertRaises(xmlgen.GenException,
+                               msg="missing %s was accepted" % key):
+            generate(HEADER + removeKey(block, key))
+
+    def assertNoneFree(self, block):
+        for key in blockKeys(block):
+            try:
+                xml = generate(HEADER + removeKey(block, key))
+            except xmlgen.GenException:
+                continue
+            self.assertIsNone(re.search(r">None<|\"None\"|None \(", xml),
+                              "missing %s wrote None to the XML" % key)
+
+    def testCompleteBlocks(self):
+        for block in (EXTERNAL_BLOCK, LONGBASELINE_BLOCK):
+            self.assertNotIn("None", generate(HEADER + block))
+
+    def testExternalBlock(self):
+        self.assertNoneFree(EXTERNAL_BLOCK)
+        for key in ("packageDescription", "clock", "correlatedData",
+                    "integrationTime", "coherentDedisperseChannels",
+                    "timeStep1", "timeStep2", "calibratorDuration_s",
+                    "create_target_cal_beam", "numberOfBitsPerSample"):
+            self.assertRejected(EXTERNAL_BLOCK, key)
+
+    def testLongBaselineBlock(self):
+        self.assertNoneFree(LONGBASELINE_BLOCK)
+        for key in ("subbandsPerSubbandGroup", "subbandGroupsPerMS"):
+            self.assertRejected(LONGBASELINE_BLOCK, key)
+
+    def testMissingPackageTag(self):
+        xml = generate(HEADER + removeKey(EXTERNAL_BLOCK, "packageTag"))
+        self.assertNotIn("PF/", xml)
+        self.assertIn("<name>3C196/1/CO</name>", xml)
+
+
+class StreamingTest(unittest.TestCase):
+    """
+    The input should be read one BLOCK at a time, so that a BLOCK is
+    processed before the lines of the next ones are read
+    """
+
+    def lines(self, text):
+        self.nRead = 0
+        for line in text.splitlines():
+            self.nRead += 1
+            yield line
+
+    def testIterBlocks(self):
+        blocks = xmlgen.iterBlocks(self.lines(HEADER + EXTERNAL_BLOCK +
+                                              "# comment\nBLOCK\n" +
+                                              LONGBASELINE_BLOCK))
+        self.assertEqual(next(blocks), HEADER.splitlines())
+        self.assertEqual(self.nRead, HEADER.count("\n") + 2)
+        self.assertEqual(next(blocks), [line for line in
+                                        EXTERNAL_BLOCK.splitlines() if line])
+        self.assertLess(self.nRead, (HEADER + EXTERNAL_BLOCK).count("\n") + 3)
+        with xmlgen.logTo(io.StringIO()) as log:
+            self.assertEqual(next(blocks)[:2], ["BLOCK", "packageName=LB"])
+        self.assertIn("BLOCK 2 was found to be empty", log.getvalue())
+        self.assertEqual(list(blocks), [])
+
+    def testErrorStopsReading(self):
+        text = HEADER + EXTERNAL_BLOCK + removeKey(EXTERNAL_BLOCK, "clock") + \
+               LONGBASELINE_BLOCK * 10
+        blocks = xmlgen.iterBlocks(self.lines(text))
+        header = next(blocks)
+        with self.assertRaises(xmlgen.GenException):
+            xmlgen.writeXML(io.StringIO(), header, blocks, log=io.StringIO())
+        # Reading stops at the BLOCK line after the one that failed
+        self.assertEqual(self.nRead, (HEADER + 2 * EXTERNAL_BLOCK).count("\n"))
+
+
+class RecordTest(unittest.TestCase):
+    """
+    The fields of a record that have not been set should read as their
+    defaults, and unknown fields should be rejected
+    """
+
+    def testDefaults(self):
+        settings = xmlgen.BlockSettings(packageName="PF")
+        self.assertEqual(settings.packageName, "PF")
+        self.assertEqual(settings.nrRepeats, 1)
+        self.assertIsNone(settings.clock)
+        self.assertEqual(xmlgen.Beam("10:00:00", "50:00:00").duration, 0)
+
+    def testListDefaultsAreCopied(self):
+        settings = xmlgen.BlockSettings()
+        settings.globalSubbands.append(104)
+        self.assertEqual(xmlgen.BlockSettings().globalSubbands, [])
+        self.assertEqual(xmlgen.BlockSettings.DEFAULTS["globalSubbands"], [])
+
+    def testUnknownField(self):
+        settings = xmlgen.BlockSettings()
+        with self.assertRaises(AttributeError):
+            settings.packagename
+        with self.assertRaises(AttributeError):
+            settings.packagename = "PF"
+
+
+class TaskGraphTest(unittest.TestCase):
+    """
+    TaskGraph.add should find the topologies in the arguments of a writer,
+    whether they are passed by position or by keyword, and validate should
+    find the cycles in the dependencies between them
+    """
+
+    ARGUMENTS = {"topo": "B0.1.CPC", "pred_topo": "B0.1.C, B0.1.X",
+                 "name": "3C196/1/CPC", "uvintopo": "B0.1.C.SAP000.uv.dps",
+                 "instrouttopo": "B0.1.CPC.inst.dps",
+                 "uvouttopo": "B0.1.CPC.uv.dps"}
+
+    def testArguments(self):
+        names = list(inspect.signature(xmlgen.writeXMLCalPipe).parameters)[1:]
+        values = [self.ARGUMENTS.get(name, name) for name in names]
+        for split in (len(names), 3, 0):
+            graph = xmlgen.TaskGraph(1)
+            node = graph.add(xmlgen.writeXMLCalPipe, *values[:split],
+                             **dict(zip(names[split:], values[split:])))
+            self.assertEqual(node.toDict(), {
+                "topology": "B0.1.CPC", "kind": "pipeline",
+                "name": "3C196/1/CPC", "predecessors": ["B0.1.C", "B0.1.X"],
+                "inputs": ["B0.1.C.SAP000.uv.dps"],
+                "outputs": ["B0.1.CPC.inst.dps", "B0.1.CPC.uv.dps"]})
+
+    def graph(self, *nodes):
+        graph = xmlgen.TaskGraph(1)
+        for topology, kind, predecessors, inputs in nodes:
+            graph.insert(xmlgen.TaskNode(topology, kind, topology, predecessors,
+                                         inputs, []))
+        return graph
+
+    def testEdges(self):
+        graph = self.graph(("B0.1.T.0", "observation", [], []),
+                           ("B0.1.T.1", "observation", [], []),
+                           ("B0.1.PT", "pipeline", ["B0.1.T", "B0.0.C"],
+                            ["B0.1.T.1.SAP000.uv.dps"]))
+        self.assertEqual(graph.edges(), [
+            ("B0.1.T.0", "B0.1.PT", "predecessor", "B0.1.T"),
+            ("B0.1.T.1", "B0.1.PT", "predecessor", "B0.1.T"),
+            (None, "B0.1.PT", "predecessor", "B0.0.C"),
+            ("B0.1.T.1", "B0.1.PT", "dataproduct", "B0.1.T.1.SAP000.uv.dps")])
+        # References outside the BLOCK are left to MoM
+        graph.validate()
+
+    def testCycle(self):
+        graph = self.graph(("B0.1.C", "observation", [], []),
+                           ("B0.1.P1", "pipeline", ["B0.1.C", "B0.1.P2"], []),
+                           ("B0.1.P2", "pipeline", [], ["B0.1.P1.uv.dps"]))
+        with self.assertRaises(xmlgen.GenException) as context:
+            graph.validate()
+        self.assertIn("B0.1.P1, B0.1.P2", context.exception.message)
+        self.assertNotIn("B0.1.C,", context.exception.message)
+
+
+class RepeatTemplateTest(unittest.TestCase):
+    """
+    The repeats of a BLOCK written from a RepeatTemplate should be the same
+    as the repeats written one by one
+    """
+
+    def render(self, text):
+        graphs = []
+        output = io.StringIO()
+        blocks = xmlgen.iterBlocks(text.splitlines())
+        header = next(blocks)
+        xmlgen.writeXML(output, header, blocks, graphs=graphs, log=io.StringIO())
+        return output.getvalue(), graphs
+
+    def testSameOutput(self):
+        for block in (EXTERNAL_BLOCK, LONGBASELINE_BLOCK):
+            text = HEADER + block.replace("\nBLOCK\n", "\nBLOCK\nrepeat=3\n")
+            templates = []
+            render = xmlgen.RepeatTemplate.render
+
+            def recordTemplate(*args):
+                templates.append(render(*args))
+                return templates[-1]
+
+            with mock.patch.object(xmlgen.RepeatTemplate, "render",
+                                   side_effect=recordTemplate):
+                templated = self.render(text)
+            self.assertEqual(len(templates), 1)
+            self.assertIsNotNone(templates[0])
+            with mock.patch.object(xmlgen.RepeatTemplate, "render",
+                                   return_value=None):
+                oneByOne = self.render(text)
+            self.assertEqual(templated, oneByOne)
+            self.assertIn("F1/3/TO</name>", templated[0])
+
+
+class TiedArrayBeamsTest(unittest.TestCase):
+    """
+    Invalid TAB lines should be rejected with a message that says what is
+    wrong with them
+    """
+
+    def assertRejected(self, line, message):
+        with self.assertRaises(xmlgen.GenException) as context:
+            xmlgen.readTiedArrayBeams(["TAB:", line])
+        self.assertTrue(context.exception.message.startswith(message))
+        self.assertTrue(context.exception.message.endswith(
+            "the TAB specification on line '%s'" % line))
+
+    def testValid(self):
+        tabs = xmlgen.readTiedArrayBeams(["TAB:", "i;12.5", "rings;2;0.01deg",
+                                          "grid;2;3;0.5deg;0.1;0.2"])
+        self.assertEqual(tabs[0], ["i", 12.5])
+        self.assertEqual(tabs[1][:2], ["rings", 2])
+        self.assertEqual(tabs[2][:3] + [tabs[2][4]], ["grid", 2, 3, (0.1, 0.2)])
+
+    def testInvalid(self):
+        self.assertRejected("rings;2", "wrong number of parameters")
+        self.assertRejected("grid;2;3;0.5deg;0.1", "wrong number of parameters")
+        self.assertRejected("rings;-1;0.01deg", "too few TABs")
+        self.assertRejected("grid;0;3;0.5deg", "too few TABs")
+        self.assertRejected("i", "An error occurred reading")
+        self.assertRejected("rings;two;0.01deg", "An error occurred reading")
+
+
+class TabExpansionTest(unittest.TestCase):
+    """
+    Rings and grid TAB lines should expand into the coherent TABs they
+    describe, with or without NumPy
+    """
+
+    def testCounts(self):
+        for nrRings in (0, 1, 3):
+            l, m = xmlgen.tabRingOffsets(nrRings, 0.01)
+            self.assertEqual(len(l), 1 + 3 * nrRings * (nrRings + 1))
+        l, m = xmlgen.tabGridOffsets(2, 3, 0.5)
+        self.assertEqual(list(zip(l, m)), [(-0.25, -0.5), (0.25, -0.5),
+                                           (-0.25, 0.0), (0.25, 0.0),
+                                           (-0.25, 0.5), (0.25, 0.5)])
+
+    def testRingDistances(self):
+        l, m = xmlgen.tabRingOffsets(2, 1.0)
+        # The corners of ring k are k * ringSize from the centre
+        for index, distance in ((1, 1), (4, 1), (7, 2), (9, 2)):
+            self.assertAlmostEqual(l[index] ** 2 + m[index] ** 2,
+                                   distance ** 2)
+
+    def testNumpy(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("NumPy is not installed")
+        for python, vectorized in ((xmlgen.tabRingOffsets(3, 0.01),
+                                    xmlgen.tabRingOffsets(3, 0.01, numpy)),
+                                   (xmlgen.tabGridOffsets(4, 3, 0.02),
+                                    xmlgen.tabGridOffsets(4, 3, 0.02, numpy))):
+            for expected, actual in zip(python, vectorized):
+                numpy.testing.assert_allclose(actual, expected, atol=1e-15)
+        offsets = ((1.0, 0.5), [0.0, 0.01], [0.0, -0.02])
+        angles = xmlgen.offsetsToAngles(*offsets)
+        numpy.testing.assert_allclose(xmlgen.offsetsToAngles(*offsets, numpy),
+                                      angles)
+        self.assertAlmostEqual(angles[0][0], 1.0)
+        self.assertAlmostEqual(angles[1][0], 0.5)
+
+    def testExpand(self):
+        TAB = [["i", 12.5], ["rings", 1, 0.01, None],
+               ["grid", 2, 2, 0.01, (0.1, 0.2)]]
+        expanded = xmlgen.expandTiedArrayBeams(TAB, 90.0, 45.0)
+        self.assertEqual(expanded[0], ["i", 12.5])
+        self.assertEqual([tab[0] for tab in expanded[1:]], ["c"] * 11)
+        self.assertAlmostEqual(expanded[1][1], xmlgen.deg2rad(90.0))
+        self.assertAlmostEqual(expanded[1][2], xmlgen.deg2rad(45.0))
+        incoherent = TAB[:1]
+        self.assertIs(xmlgen.expandTiedArrayBeams(incoherent, 90.0, 45.0),
+                      incoherent)
+
+    def testTooFar(self):
+        with self.assertRaises(xmlgen.GenException):
+            xmlgen.offsetsToAngles((0.0, 0.0), [0.8], [0.8])
+
+
+class LayoutTest(unittest.TestCase):
+    """
+    The compact and pretty layouts should only change the whitespace between
+    tags, however the XML is split into chunks
+    """
+
+    TEXT = HEADER + EXTERNAL_BLOCK + LONGBASELINE_BLOCK
+
+    def emit(self, xml, layout, chunkSize):
+        output = io.StringIO()
+        with xmlgen.XMLEmitter(output, bufferSize=chunkSize,
+                               layout=layout) as emitter:
+            for start in range(0, len(xml), chunkSize):
+                emitter.write(xml[start:start + chunkSize])
+        return output.getvalue()
+
+    def testLayouts(self):
+        xml = xmlgen.generate(self.TEXT, log=io.StringIO())
+        stripped = re.sub(r">\s*\n\s*<", "><", xml).strip()
+        compact = xmlgen.generate(self.TEXT, layout="compact",
+                                  log=io.StringIO())
+        pretty = xmlgen.generate(self.TEXT, layout="pretty", log=io.StringIO())
+        self.assertEqual(compact.strip(), stripped)
+        self.assertEqual(re.sub(r">\s*\n\s*<", "><", pretty).strip(), stripped)
+        self.assertLess(len(compact), len(xml))
+        self.assertIn("\n  <", pretty)
+        for chunkSize in (1, 7, 4096):
+            self.assertEqual(self.emit(xml, "compact", chunkSize), compact)
+            self.assertEqual(self.emit(xml, "pretty", chunkSize), pretty)
+
+    def testTextIsKept(self):
+        xml = "<a>\n  <b>  two  words </b>\n  <c/>\n</a>\n"
+        self.assertEqual(self.emit(xml, "compact", 3),
+                         "<a><b>  two  words </b><c/></a>\n")
+        self.assertEqual(self.emit(xml, "pretty", 3),
+                         "<a>\n  <b>  two  words </b>\n  <c/>\n</a>\n")
+
+
+class ParallelTest(unittest.TestCase):
+    """
+    Rendering the BLOCKs in parallel with --jobs should give the same output
+    as rendering them serially
+    """
+
+    def render(self, text, jobs):
+        graphs = []
+        output = io.StringIO()
+        blocks = xmlgen.iterBlocks(text.splitlines())
+        header = next(blocks)
+        with mock.patch.object(xmlgen.os, 'cpu_count', return_value=4), \
+             mock.patch.object(xmlgen, 'ProcessPoolExecutor',
+                               wraps=xmlgen.ProcessPoolExecutor) as pool:
+            xmlgen.writeXML(output, header, blocks, jobs=jobs, graphs=graphs,
+                            log=io.StringIO())
+        return output.getvalue(), graphs, pool.called
+
+    def testSameOutput(self):
+        text = HEADER + (EXTERNAL_BLOCK + LONGBASELINE_BLOCK) * \
+               (xmlgen.PARALLEL_MIN_BLOCKS // 2 + 1)
+        serial, serialGraphs, serialPool = self.render(text, 1)
+        parallel, parallelGraphs, parallelPool = self.render(text, 4)
+        self.assertFalse(serialPool)
+        self.assertTrue(parallelPool)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallelGraphs, serialGraphs)
+
+    def testFewBlocksAreSerial(self):
+        text = HEADER + EXTERNAL_BLOCK + LONGBASELINE_BLOCK
+        parallel, graphs, pool = self.render(text, 4)
+        self.assertFalse(pool)
+        self.assertEqual(parallel, generate(text))
+
+    def testErrorInBlock(self):
+        text = HEADER + EXTERNAL_BLOCK * xmlgen.PARALLEL_MIN_BLOCKS + \
+               removeKey(LONGBASELINE_BLOCK, "clock")
+        with self.assertRaisesRegex(xmlgen.GenException, "clock"):
+            self.render(text, 4)
+
+
+class FileTest(unittest.TestCase):
+    """
+    Base class for the tests that convert files in a temporary directory
+    """
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def path(self, name):
+        return os.path.join(self.tmpDir, name)
+
+    def writeInput(self, name, text, opener=open):
+        with opener(self.path(name), "wt") as ifile:
+            ifile.write(text)
+        return self.path(name)
+
+
+class WriteOnSuccessTest(FileTest):
+    """
+    The XML file should only be replaced when the conversion succeeds
+    """
+
+    def convert(self, text):
+        xmlgen.convertFile(self.writeInput("in.txt", text),
+                           self.path("out.xml"), log=io.StringIO())
+
+    def testFailureKeepsOutput(self):
+        self.convert(HEADER + EXTERNAL_BLOCK)
+        with open(self.path("out.xml")) as xmlFile:
+            xml = xmlFile.read()
+        with self.assertRaises(xmlgen.GenException):
+            self.convert(HEADER + EXTERNAL_BLOCK +
+                         removeKey(LONGBASELINE_BLOCK, "clock"))
+        with open(self.path("out.xml")) as xmlFile:
+            self.assertEqual(xmlFile.read(), xml)
+        self.assertEqual(sorted(os.listdir(self.tmpDir)),
+                         ["in.txt", "out.xml"])
+
+    def testFailureWritesNothing(self):
+        with self.assertRaises(xmlgen.GenException):
+            self.convert(HEADER + removeKey(EXTERNAL_BLOCK, "clock"))
+        self.assertEqual(os.listdir(self.tmpDir), ["in.txt"])
+
+    def testThreads(self):
+        # Threads of one process that write the same file use their own
+        # temporary files
+        barrier = threading.Barrier(2)
+
+        def write(text):
+            with xmlgen.writeOnSuccess(self.path("out.xml")) as tmpPath:
+                with open(tmpPath, "w") as tmpFile:
+                    tmpFile.write(text)
+                barrier.wait(timeout=10)
+            return tmpPath
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            tmpPaths = list(pool.map(write, ["first", "second"]))
+        self.assertNotEqual(tmpPaths[0], tmpPaths[1])
+        self.assertEqual(os.listdir(self.tmpDir), ["out.xml"])
+        with open(self.path("out.xml")) as xmlFile:
+            self.assertIn(xmlFile.read(), ["first", "second"])
+
+
+class CompressionTest(FileTest):
+    """
+    Compressed input, XML and graph files should be read and written like
+    their uncompressed versions
+    """
+
+    MODULES = {".gz": gzip, ".xz": lzma, ".bz2": bz2}
+
+    def testConvert(self):
+        text = HEADER + EXTERNAL_BLOCK
+        self.writeInput("in.txt", text)
+        xmlgen.convertFile(self.path("in.txt"), self.path("out.xml"),
+                           graphfile=self.path("graph.json"),
+                           log=io.StringIO())
+        with open(self.path("graph.json")) as graphFile:
+            graph = json.load(graphFile)["blocks"]
+        for extension, module in self.MODULES.items():
+            inputfile = self.writeInput("in.txt" + extension, text,
+                                        module.open)
+            xmlgen.convertFile(inputfile, self.path("out.xml" + extension),
+                               graphfile=self.path("graph.json" + extension),
+                               log=io.StringIO())
+            with module.open(self.path("out.xml" + extension), "rt") as xml:
+                self.assertEqual(xml.read(), generate(text))
+            with module.open(self.path("graph.json" + extension),
+                             "rt") as graphFile:
+                self.assertEqual(json.load(graphFile)["blocks"], graph)
+
+    def testDefaultOutputName(self):
+        for extension in [""] + list(self.MODULES):
+            self.assertEqual(xmlgen.defaultOutputName("dir/a.txt" + extension),
+                             "dir/a.xml")
+        self.assertEqual(xmlgen.defaultOutputName("dir/a.txt.GZ", "out"),
+                         os.path.join("out", "a.xml"))
+
+    def testFailureLeavesNoFile(self):
+        inputfile = self.writeInput("in.txt.gz", HEADER + removeKey(
+            EXTERNAL_BLOCK, "clock"), gzip.open)
+        with self.assertRaises(xmlgen.GenException):
+            xmlgen.convertFile(inputfile, self.path("out.xml.gz"),
+                               log=io.StringIO())
+        self.assertEqual(os.listdir(self.tmpDir), ["in.txt.gz"])
+
+
+class BlockCacheTest(FileTest):
+    """
+    A cached BLOCK should give the same XML and graph as rendering it, and
+    only the BLOCKs that changed should be rendered again
+    """
+
+    def render(self, text, cache):
+        graphs = []
+        output = io.StringIO()
+        blocks = xmlgen.iterBlocks(text.splitlines())
+        header = next(blocks)
+        xmlgen.writeXML(output, header, blocks, graphs=graphs, cache=cache,
+                        log=io.StringIO())
+        return output.getvalue(), graphs
+
+    def testHits(self):
+        text = HEADER + EXTERNAL_BLOCK + LONGBASELINE_BLOCK
+        uncached = self.render(text, None)
+        cache = xmlgen.BlockCache(self.tmpDir)
+        self.assertEqual(self.render(text, cache), uncached)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(self.render(text, cache), uncached)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        edited = text.replace("targetDuration_s=3600\nclock",
+                              "targetDuration_s=7200\nclock")
+        self.assertEqual(self.render(edited, cache),
+                         self.render(edited, None))
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+    def testErrorIsNotCached(self):
+        cache = xmlgen.BlockCache(self.tmpDir)
+        for i in range(2):
+            with self.assertRaises(xmlgen.GenException):
+                self.render(HEADER + removeKey(EXTERNAL_BLOCK, "clock"), cache)
+        self.assertEqual(os.listdir(self.tmpDir), [])
+
+    def testCorruptEntry(self):
+        text = HEADER + EXTERNAL_BLOCK
+        cache = xmlgen.BlockCache(self.tmpDir)
+        uncached = self.render(text, cache)
+        for name in os.listdir(self.tmpDir):
+            with open(self.path(name), "w") as entryFile:
+                entryFile.write("{")
+        self.assertEqual(self.render(text, cache), uncached)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def testPrune(self):
+        cache = xmlgen.BlockCache(self.tmpDir)
+        for mtime, name in enumerate("abc"):
+            cache.put(name, "<xml/>", {}, "")
+            os.utime(cache.path(name), (1000 + mtime, 1000 + mtime))
+        # Reading an entry marks it as recently used
+        self.assertEqual(cache.get("a"), ("<xml/>", {}, ""))
+        cache.maxSize = 2 * os.path.getsize(cache.path("a"))
+        cache.prune()
+        self.assertEqual(sorted(os.listdir(self.tmpDir)), ["a.json", "c.json"])
+
+
+class BatchTest(FileTest):
+    """
+    A batch should convert each file once, report the failures in the
+    manifest and never write two inputs to the same XML file
+    """
+
+    def convert(self, inputfiles):
+        manifest = self.path("manifest.json")
+        with xmlgen.logTo(io.StringIO()):
+            results = xmlgen.convertBatch(inputfiles, jobs=1,
+                                          manifest=manifest)
+        with open(manifest) as manifestFile:
+            return results, json.load(manifestFile)
+
+    def testManifest(self):
+        results, summary = self.convert(
+            [self.writeInput("a.txt", HEADER + EXTERNAL_BLOCK),
+             self.writeInput("b.txt", HEADER + removeKey(EXTERNAL_BLOCK,
+                                                         "clock"))])
+        self.assertEqual([result["status"] for result in results],
+                         ["ok", "failed"])
+        self.assertEqual((summary["files"], summary["failed"]), (2, 1))
+        self.assertEqual(summary["results"][0]["output"], self.path("a.xml"))
+        self.assertEqual(summary["results"][0]["size"],
+                         os.path.getsize(self.path("a.xml")))
+        self.assertIn("clock", summary["results"][1]["error"])
+        self.assertEqual(sorted(os.listdir(self.tmpDir)),
+                         ["a.txt", "a.xml", "b.txt", "manifest.json"])
+
+    def testSameOutput(self):
+        plain = self.writeInput("a.txt", HEADER + EXTERNAL_BLOCK)
+        compressed = self.writeInput("a.txt.gz", HEADER + LONGBASELINE_BLOCK,
+                                     gzip.open)
+        results, summary = self.convert([plain, compressed, plain])
+        self.assertEqual([result["status"] for result in results],
+                         ["ok", "failed", "failed"])
+        for result in results[1:]:
+            self.assertEqual(result["output"], self.path("a.xml"))
+            self.assertEqual(result["error"],
+                             "writes the same XML file as " + plain)
+        self.assertEqual(summary["failed"], 2)
+        with open(self.path("a.xml")) as xmlFile:
+            self.assertEqual(xmlFile.read(), generate(HEADER + EXTERNAL_BLOCK))
+
+
+class ServerTest(unittest.TestCase):
+    """
+    The conversion server should convert a POSTed input text and close idle
+    keep-alive connections, so that they cannot hold its threads
+    """
+
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.metrics = xmlgen.ServerMetrics()
+        self.server = xmlgen.makeServer(self.pool, self.metrics, port=0,
+                                        threads=1, idleTimeout=0.5)
+        self.server.RequestHandlerClass.log_message = lambda *args: None
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.pool.shutdown()
+
+    def post(self, text):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port,
+                                                timeout=10)
+        try:
+            connection.request("POST", "/", text.encode("utf-8"))
+            response = connection.getresponse()
+            return response.status, response.read().decode("utf-8")
+        finally:
+            connection.close()
+
+    def testConvert(self):
+        text = HEADER + EXTERNAL_BLOCK
+        self.assertEqual(self.post(text), (200, generate(text)))
+        code, body = self.post(HEADER + removeKey(EXTERNAL_BLOCK, "clock"))
+        self.assertEqual(code, 400)
+        self.assertIn("clock", body)
+        self.assertEqual(self.metrics.toDict()["status"],
+                         {"200": 1, "400": 1})
+
+    def testIdleConnectionIsClosed(self):
+        # The only handler thread serves this connection until it times out
+        idle = socket.create_connection(("127.0.0.1", self.port), timeout=10)
+        try:
+            idle.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = b""
+            while b"POST an input text" not in response:
+                data = idle.recv(4096)
+                self.assertTrue(data)
+                response += data
+            with mock.patch("sys.stderr", io.StringIO()):
+                text = HEADER + EXTERNAL_BLOCK
+                self.assertEqual(self.post(text), (200, generate(text)))
+                self.assertEqual(idle.recv(4096), b"")
+        finally:
+            idle.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
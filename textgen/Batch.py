@@ -0,0 +1,147 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from textgen.errors import *
+from textgen.ObservationSpec import ObservationSpec
+from textgen.XmlConverter import convertToXml, errorMessage, logWarnings
+
+# Columns that can be used in a target list. They map one-to-one to the
+# arguments of ObservationSpec.
+SPEC_FIELDS = ['projectName', 'mainName', 'startTime', 'elevation', 'avg',
+               'arrayConfig', 'rcumode', 'antennaMode', 'subbands',
+               'pointing', 'duration', 'dysco']
+
+def readTargets(fileName):
+    """
+    Read a target list from a CSV file (one observation per row, with the
+    column names from SPEC_FIELDS in the first line) or from a JSON file
+    (a list of objects with the same keys). Returns a list of dictionaries.
+    """
+    if os.path.splitext(fileName)[1].lower() == '.json':
+        with open(fileName) as inFile:
+            rows = json.load(inFile)
+    else:
+        with open(fileName, newline='') as inFile:
+            rows = list(csv.DictReader(inFile))
+    return rows
+
+def specFromRow(row):
+    """
+    Convert a row of the target list into an ObservationSpec. Empty cells
+    take the default value. In a CSV file, multiple pointings are separated
+    by '|'.
+    """
+    unknown = [key for key in row if key not in SPEC_FIELDS]
+    if unknown:
+        raise ValueError('Unknown column(s) in target list: {}'.format(\
+                         ', '.join(unknown)))
+    kwargs = {key: value for (key, value) in row.items() \
+              if value not in (None, '')}
+    if isinstance(kwargs.get('pointing'), str):
+        kwargs['pointing'] = kwargs['pointing'].split('|')
+    return ObservationSpec(**kwargs)
+
+def _describeError(err):
+    """
+    Returns a readable description of the exception that is being handled.
+    """
+    try:
+        return getErrorMessage()
+    except KeyError:
+        return '{}: {}'.format(type(err).__name__, err)
+
+def processRow(index, row, outDir='.', makeXml=False):
+    """
+    Generate the text file (and optionally the xml file) for a single row of
+    the target list. This runs in a worker process. Returns a dictionary that
+    summarises the result for the manifest.
+    """
+    startTime = time.time()
+    result = {'row': index, 'status': 'ok', 'textFile': None,
+              'xmlFile': None, 'warnings': [], 'error': None}
+    try:
+        # Imported here so that only the workers load the astronomy stack
+        from textgen.Imaging import generateTextFile
+        outFileName, img = generateTextFile(specFromRow(row), outDir)
+        result['textFile'] = outFileName
+        result['warnings'] = list(img.warnings)
+        if makeXml:
+            try:
+                result['xmlFile'], log = convertToXml(outFileName)
+            except Exception as err:
+                raise RuntimeError('xmlgen.py failed: ' + errorMessage(err))
+            result['warnings'] += ['xmlgen.py: ' + warning \
+                                   for warning in logWarnings(log)]
+    except Exception as err:
+        result['status'] = 'failed'
+        result['error'] = _describeError(err)
+    result['wallTime'] = time.time() - startTime
+    return result
+
+def findDuplicateRows(rows):
+    """
+    Returns a dictionary that maps the index of each row that would write the
+    same text file as an earlier row to the index of that earlier row and the
+    name of the file. Rows whose file name cannot be determined are left to
+    fail in processRow.
+    """
+    firstRow = {}
+    duplicates = {}
+    for index, row in enumerate(rows):
+        try:
+            fileName = specFromRow(row).getOutFileName()
+        except ValueError:
+            continue
+        if fileName in firstRow:
+            duplicates[index] = (firstRow[fileName], fileName)
+        else:
+            firstRow[fileName] = index
+    return duplicates
+
+def runBatch(rows, outDir='.', jobs=None, makeXml=False, manifest=None):
+    """
+    Process all rows of a target list on a pool of jobs worker processes
+    (one per CPU core by default). A row that would overwrite the text file
+    of an earlier row (same project, date and first target) fails instead of
+    being processed. A manifest with the per-row results is written to the
+    file manifest, if specified. Returns the list of results in the order of
+    the rows.
+    """
+    startTime = time.time()
+    nRows = len(rows)
+    duplicates = findDuplicateRows(rows)
+    todo = [index for index in range(nRows) if index not in duplicates]
+    results = [{'row': index, 'status': 'failed', 'textFile': None,
+                'xmlFile': None, 'warnings': [], 'wallTime': 0.,
+                'error': 'writes the same text file as row {0} ({1})'.\
+                         format(*duplicates[index])} \
+               if index in duplicates else None for index in range(nRows)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for result in pool.map(processRow, todo, [rows[i] for i in todo], \
+                               [outDir]*len(todo), [makeXml]*len(todo)):
+            results[result['row']] = result
+
+    for result in results:
+        if result['status'] == 'ok':
+            print(GREEN_COLOR + 'INFO: Row {}: wrote {} ({:.1f} s)'.format(\
+                  result['row'], result['textFile'], result['wallTime']) + \
+                  NO_COLOR)
+        else:
+            print(RED_COLOR + 'ERROR: Row {}: {}'.format(result['row'], \
+                  result['error']) + NO_COLOR)
+        for warning in result['warnings']:
+            printWarning('Row {}: {}'.format(result['row'], warning))
+
+    nFailed = len([item for item in results if item['status'] != 'ok'])
+    summary = {'rows': nRows, 'failed': nFailed,
+               'wallTime': time.time() - startTime, 'results': results}
+    print('INFO: Processed {} rows in {:.1f} s, {} failed.'.format(nRows, \
+          summary['wallTime'], nFailed))
+    if manifest is not None:
+        with open(manifest, 'w') as outFile:
+            json.dump(summary, outFile, indent=2)
+        print('INFO: Manifest written to {}'.format(manifest))
+    return results
@@ -1,17 +1,37 @@
 import tkinter as tk
 import tkinter.messagebox as tkMessageBox
-import subprocess
+import datetime
 import os
+import queue
+import sys
+import threading
 import webbrowser
 
 from textgen.errors import *
-from textgen.Imaging import *
+from textgen.ObservationSpec import ObservationSpec
+from textgen.XmlConverter import convertToXml, errorMessage, logWarnings
+
+# Lock that serializes the (slow) first import of textgen.Imaging between
+# the warm-up thread and actionSubmit
+_importLock = threading.Lock()
+
+def _loadImaging():
+    """
+    Import the module that does the astronomy calculations. It pulls in
+    astropy and numpy, which takes seconds, so it is only loaded when needed.
+    """
+    with _importLock:
+        import textgen.Imaging
+    return textgen.Imaging
 
 class GuiWindow():
-    def __init__(self):
+    def __init__(self, warmUp=True, profile=None):
         """
-        Initialize and generate GUI
+        Initialize and generate GUI. If warmUp is True, the astronomy modules
+        are loaded in a background thread once the window is shown. profile
+        is an optional StartupProfile that records the start-up phases.
         """
+        self.profile = profile
         self.root = tk.Tk()
         self.root.title('LOFAR Imaging Text Generator')
         self.root.option_add('*Font', 'helvetica 11')
@@ -142,6 +162,57 @@ class GuiWindow():
                                  command=self.openMoM)
         self.momB.grid(row=0, column=1, padx=100, sticky='E',pady=10)
 
+        rowIdx += 1
+        self.queueB = tk.Button(frame, text='QUEUE', justify=tk.CENTER,\
+                                command=self.actionSubmit, state='disabled')
+        self.queueB.grid(row=rowIdx, column=1, sticky='W')
+        self.stopB = tk.Button(frame, text='CANCEL', justify=tk.CENTER,\
+                               command=self.actionCancel, state='disabled')
+        self.stopB.grid(row=rowIdx, column=1, padx=100, sticky='W')
+
+        rowIdx += 1
+        self.statusStr = tk.StringVar()
+        self.statusStr.set('Idle')
+        statusL = tk.Label(frame, textvariable=self.statusStr, anchor='w')
+        statusL.grid(row=rowIdx, columnspan=2, sticky='W', pady=5)
+
+        # Submitted jobs are processed one at a time by a worker thread,
+        # which reports back to the Tk thread through the events queue.
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.nJobs = 0
+        self.cancelJob = threading.Event()
+        self.worker = None
+        self.root.after(100, self._pollEvents)
+
+        if warmUp:
+            self.root.after_idle(self._startWarmUp)
+
+    def _startWarmUp(self):
+        """
+        Start loading the astronomy modules in a background thread, so that
+        the first SUBMIT does not have to wait for them.
+        """
+        if self.profile is not None:
+            self.profile.mark('window shown')
+            self.profile.stop()
+            self.profile.report()
+        threading.Thread(target=self._warmUp, daemon=True).start()
+
+    def _warmUp(self):
+        """
+        Body of the warm-up thread. If the modules cannot be loaded, the
+        error is reported when a job is submitted.
+        """
+        try:
+            _loadImaging()
+        except Exception:
+            return
+        if self.profile is not None:
+            self.profile.mark('astronomy modules loaded in background')
+            phase, elapsed = self.profile.phases[-1]
+            print('  {:8.3f} s  {}'.format(elapsed, phase), file=sys.stderr)
+
     def openMoM(self, *args):
         webbrowser.open("https://lofar.astron.nl/mom3/user/setUpImportXML2.do",new=True)
 
@@ -231,84 +302,150 @@ class GuiWindow():
 
     def actionSubmit(self):
         """
-        This function coordinates all the background processing that happens
-        after the SUBMIT button is clicked.
+        Read the form and hand it to the worker thread, which does all the
+        background processing. SUBMIT is disabled while a job runs; more
+        forms can be added to the queue with QUEUE in the meantime.
         """
+        self.jobs.put(ObservationSpec.fromGui(self))
+        self.nJobs += 1
+        self._setBusy()
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._workerLoop, \
+                                           daemon=True)
+            self.worker.start()
 
-        try:
-            img = Imaging(self)
-        except:
-            errString = getErrorMessage()
-            showErrorPopUp(errString)
-            return None
+    def actionCancel(self):
+        """
+        Cancel the job that is currently running. Queued jobs still run. The
+        job stops at the next stage; a conversion to xml that has started
+        runs to completion first.
+        """
+        self.cancelJob.set()
+        self.statusStr.set('Cancelling...')
+
+    def _setBusy(self):
+        """
+        Enable or disable the buttons depending on whether a job is running
+        """
+        busy = self.nJobs > 0
+        self.submitB.configure(state='disabled' if busy else 'normal')
+        self.queueB.configure(state='normal' if busy else 'disabled')
+        self.stopB.configure(state='normal' if busy else 'disabled')
+
+    def _pollEvents(self):
+        """
+        Handle the messages posted by the worker thread. This runs on the Tk
+        thread every 100 ms.
+        """
+        while True:
+            try:
+                kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'status':
+                if self.nJobs > 1:
+                    value += ' ({} queued)'.format(self.nJobs-1)
+                self.statusStr.set(value)
+            elif kind == 'warning':
+                showWarningPopUp(value)
+            elif kind == 'error':
+                showErrorPopUp(value)
+            elif kind == 'finished':
+                self.nJobs -= 1
+                self._setBusy()
+        self.root.after(100, self._pollEvents)
 
-        outFileName='{}_{}_{}.txt'.format(img.projectName, \
-                                  img.startTime.strftime('%Y%m%d'),\
-                                  img.targetLabel[0])
-        outFile = open(outFileName, 'w')
+    def _post(self, kind, value=None):
+        """
+        Send a message from the worker thread to the Tk thread
+        """
+        self.events.put((kind, value))
 
-        # Write the header section
-        img.makeHeader(outFile)
+    def _checkCancel(self):
+        """
+        Stop the running job if CANCEL was clicked
+        """
+        if self.cancelJob.is_set():
+            raise JobCancelledError
 
-        startTime = img.startTime
-        if img.rcumode == '10-90 MHz' or img.rcumode == '30-90 MHz':
-            # In the case LBA
+    def _workerLoop(self):
+        """
+        Body of the worker thread. Runs the submitted jobs in order. A job
+        that fails unexpectedly is reported and does not stop the thread.
+        """
+        while True:
+            spec = self.jobs.get()
+            self.cancelJob.clear()
             try:
-                startTime = img.writeTarget(startTime, outFile)
-            except:
-                errString = getErrorMessage()
-                showErrorPopUp(errString)
-                return None
-        else:
-            # In the case of HBA
-            # Write the first calibrator block
-            calName = img.findHBACalibrator(startTime)
-            if calName is None:
-                showErrorPopUp('Unable to find a suitable calibrator.')
-                return None
-            print(GREEN_COLOR +\
-                  'INFO: Using {} as flux density calibrator'.format(calName) +\
-                  NO_COLOR)
-            startTime = img.writeCalibrator(startTime, calName, outFile)
-            # Write the target block
+                self._runJob(spec)
+            except JobCancelledError:
+                print(RED_COLOR + 'INFO: Job cancelled.' + NO_COLOR)
+                self._post('status', 'Cancelled')
+            except Exception as err:
+                self._post('status', 'Failed')
+                self._post('warning', 'Unexpected error: {}: {}'.format(\
+                           type(err).__name__, err))
+            finally:
+                self._post('finished')
+
+    def _runJob(self, spec):
+        """
+        Generate the text file for spec and convert it to xml
+        """
+        try:
+            self._post('status', 'Loading astronomy modules...')
+            Imaging = _loadImaging().Imaging
+            self._checkCancel()
+            self._post('status', \
+                       'Checking target and calibrator visibility...')
+            img = Imaging(spec, warn=lambda msg: self._post('warning', msg))
+            outFileName = img.getOutFileName()
+            self._checkCancel()
+            self._post('status', 'Writing {}...'.format(outFileName))
+            with open(outFileName, 'w') as outFile:
+                img.writeTextFile(outFile)
+        except JobCancelledError:
+            raise
+        except Exception as err:
             try:
-                startTime = img.writeTarget(startTime, outFile)
-            except:
                 errString = getErrorMessage()
-                showErrorPopUp(errString)
-                return None
-            # Write the second calibrator block
-            calName = img.findHBACalibrator(startTime, calName)
-            if calName is None:
-                showErrorPopUp('Unable to find a suitable calibrator.')
-                return None
-            print(GREEN_COLOR +\
-                  'INFO: Using {} as flux density calibrator'.format(calName) +\
-                  NO_COLOR)
-            startTime = img.writeCalibrator(startTime, calName, outFile)
+            except KeyError:
+                errString = '{}: {}'.format(type(err).__name__, err)
+            self._post('status', 'Failed')
+            self._post('error', errString)
+            return None
 
-        outFile.close()
+        self._checkCancel()
+        self._post('status', 'Converting {} to xml...'.format(outFileName))
+        if not self._runXmlgen(outFileName):
+            return None
+        self._checkCancel()
+        self._post('status', 'Finished {}'.format(outFileName))
+        print('')
 
-        # If xmlgen.py exists, convert the text file to xml
-        FNULL = open(os.devnull, 'w')
+    def _runXmlgen(self, outFileName):
+        """
+        If xmlgen.py exists, convert the text file to xml. xmlgen is run
+        in-process; its messages are printed and its warnings or error
+        message, if any, are shown to the user. Returns False if the
+        conversion failed.
+        """
         try:
-            subprocess.call(['./xmlgen.py', '-i', outFileName], stdout=FNULL, \
-                            stderr=subprocess.STDOUT)
-            print(GREEN_COLOR + 'INFO: Found xmlgen.py. Generating XML file.' +\
+            xmlFileName, log = convertToXml(outFileName)
+        except ImportError:
+            print(RED_COLOR + 'INFO: Could not find xmlgen.py')
+            print('INFO: Only text output will be generated.')
+            print('INFO: Run xmlgen.py manually to generate the xml file.'+\
                   NO_COLOR)
-        except OSError:
-            print(RED_COLOR + 'INFO: Could not find xmlgen.py in the ' +\
-                  'current working directory.' + NO_COLOR)
-            try:
-                subprocess.call(['xmlgen.py', '-i', outFileName], \
-                           stdout=FNULL, stderr=subprocess.STDOUT)
-                print(GREEN_COLOR + \
-                      'INFO: Found xmlgen.py. Generating XML file.' + NO_COLOR)
-            except OSError:
-                print(RED_COLOR + 'INFO: Could not find xmlgen.py in PATH')
-                print('INFO: Only text output will be generated.')
-                print('INFO: Run xmlgen.py manually to generate the xml file.'+\
-                      NO_COLOR)
-        FNULL.close()
-
-        print('')
+            return True
+        except Exception as err:
+            self._post('status', 'xmlgen.py failed')
+            self._post('error', 'xmlgen.py failed: ' + errorMessage(err))
+            return False
+        print(log, end='')
+        warnings = logWarnings(log)
+        if warnings:
+            self._post('warning', 'xmlgen.py: ' + '\n'.join(warnings))
+        print(GREEN_COLOR + 'INFO: Generated XML file {}'.format(xmlFileName)+\
+              NO_COLOR)
+        return True
@@ -1,11 +1,14 @@
 import datetime
+import os
 from astropy.coordinates import SkyCoord
 import astropy.units as u
 import numpy as np
-from ephem import Observer, FixedBody, degrees, Sun, Moon
 
 from textgen.errors import *
-from textgen.GUIWindow import *
+from textgen.ObservationSpec import ObservationSpec, outFileName
+from textgen.SubbandSet import SubbandSet
+from textgen.Visibility import findVisibility, rankCalibrators, \
+                               minimumSeparations
 
 class Imaging():
     """
@@ -20,15 +23,28 @@ class Imaging():
     # Have a list of valid A-team sources
     VALID_ATEAMS = ['CasA', 'CygA', 'TauA', 'VirA']
 
-    def __init__(self, gui):
+    # Lowest and highest valid subband for each filter
+    SUBBAND_LIMITS = {'30-90 MHz': (154, 461),
+                      '170-230 MHz': (64, 448),
+                      '210-250 MHz': (64, 240)}
+    DEFAULT_SUBBAND_LIMITS = (51, 461)
+
+    def __init__(self, spec, warn=None):
         """
-        Initialize the Imaging class and do check for input validity
+        Initialize the Imaging class and do check for input validity. spec is
+        an ObservationSpec (a GuiWindow is also accepted). Warnings are
+        collected in self.warnings and also passed to warn, if specified.
         """
+        if not isinstance(spec, ObservationSpec):
+            spec = ObservationSpec.fromGui(spec)
+        self.warnings = []
+        self._warningSink = warn
+
         # Get the project name
-        self.projectName = gui.projNameT.get()
+        self.projectName = spec.projectName
 
         # Get the main folder name
-        self.mainName = gui.mainNameT.get()
+        self.mainName = spec.mainName
         if len(self.mainName) > 20:
             raise TooLongFolderNameError
         if self.mainName == '':
@@ -36,7 +52,7 @@ class Imaging():
 
         #Parse datetime and make datetime object
         try:
-            dy, dm, ds, th, tm, ts = gui.dateT.get().split('-')
+            dy, dm, ds, th, tm, ts = spec.startTime.split('-')
             self.startTime = datetime.datetime(int(dy), int(dm), int(ds), \
                                                int(th), int(tm), int(ts))
         except:
@@ -44,14 +60,14 @@ class Imaging():
 
         # Get minimum elevation to select a calibrator
         try:
-            self.elevation = float(gui.elevationT.get())
+            self.elevation = float(spec.elevation)
         except ValueError:
             raise InvalidElevationError
         if self.elevation < 0. or self.elevation > 90.:
             raise InvalidElevationError
 
         # Get the averaging factors
-        self.avg = gui.avgT.get()
+        self.avg = spec.avg
         if len(self.avg.split(',')) != 2:
             raise InvalidAverageError
         try:
@@ -61,22 +77,21 @@ class Imaging():
             raise InvalidAverageError
 
         # Get the array configuration
-        arrayStr = gui.arrayConfigStr.get()
+        arrayStr = spec.arrayConfig
         self.arrayConfig = {'Super-terp only': 'superterp',
                             'Core stations': 'core',
                             'Dutch stations': 'NL',
                             'International': 'all'}[arrayStr]
 
         # Get sub band list
-        self.antennaMode = gui.antennaModeStr.get()
-        self.rcumode = gui.freqModeStr.get()
+        self.antennaMode = spec.antennaMode
+        self.rcumode = spec.rcumode
         self.clockFreq = self._getClockFreq()
-        self.subbands = gui.subbandT.get()
-        self._validateSubBands()
-        self.nSubBands = self._countSubBands()
+        self.subbands = spec.subbands
+        self.nSubBands = len(self._validateSubBands())
 
         # Check if dysco has to be enabled or disabled
-        if gui.dyscoModeStr.get() == 'Enabled':
+        if spec.dysco == 'Enabled':
            storagemanager = "dysco"
         else:
            storagemanager = " "
@@ -84,7 +99,7 @@ class Imaging():
         # Get the pointing string
         try:
             self.targetLabel, self.targetRA, self.targetDec, self.demixLabel =\
-                self._parsePointString(str(gui.pointT.get('1.0','end-1c')))
+                self._parsePointString(str(spec.pointing))
         except ValueError:
             raise InvalidSubbandError
         self.nBeams = len(self.targetLabel)
@@ -95,29 +110,35 @@ class Imaging():
 
         # Get the observation duration
         try:
-            self.targetObsLength = float(gui.durationT.get())
+            self.targetObsLength = float(spec.duration)
         except ValueError:
             raise InvalidDurationError
         if self.targetObsLength < 0.:
             raise InvalidDurationError
 
         # Check if the listed targets are above 30 degrees for the entire
-        # duration of the observation
+        # duration of the observation. All beams are checked in one go.
+        coords = ['{};{}'.format(self.targetRA[beamIdx], \
+                                 self.targetDec[beamIdx]) \
+                  for beamIdx in range(self.nBeams)]
+        visibility = findVisibility(coords, self.startTime, \
+                                    self.targetObsLength, self.elevation)
+        # Closest approach of the Sun and the Moon during the target scan
+        separations = minimumSeparations(coords, self.startTime, \
+                                         self.targetObsLength)
         for beamIdx in range(self.nBeams):
-            coord = '{};{}'.format(self.targetRA[beamIdx], \
-                                   self.targetDec[beamIdx])
-            if not self._isVisible(coord, self.startTime, self.targetObsLength):
-                showWarningPopUp('One of the specified targets is below user '+\
+            if not visibility[beamIdx].visible:
+                self._warn('One of the specified targets is below user '+\
                    'specified elevation [{} degrees].'.format(self.elevation) +\
                    ' Will generate text file anyway.')
             # Check the distance between the Sun and the target beams
-            if self._findDistanceToSun(coord)< 30.:
-                showWarningPopUp('Sun is within 30 degrees of source {}.'.\
+            if separations['sun'][beamIdx] < 30.:
+                self._warn('Sun is within 30 degrees of source {}.'.\
                                  format(self.targetLabel[beamIdx]) +\
                                  'Will generate text file anyway.')
-            # Check the distance between the Sun and the target beams
+            # Check the distance between the Moon and the target beams
             print('INFO: Moon is {} degrees away from the pointing center.'.\
-                  format(self._findDistanceToMoon(coord)) )
+                  format(separations['moon'][beamIdx]) )
 
         # String common to all imaging blocks
         self.COMMON_STR = "split_targets=F\ncalibration=none\n"\
@@ -133,39 +154,16 @@ class Imaging():
                 "coherentDedisperseChannels=False\n"\
                 "storagemanager={}\n".format(storagemanager) + \
                 "timeStep1=60\ntimeStep2=60"
-        # Set the list of valid calibrators
-        self.validCalibs = Imaging.VALID_CALIBS[:]
+        # Calibrator rankings already computed for a given time window
+        self._calibRankings = {}
 
-    def _findDistanceToMoon(self, coord):
+    def _warn(self, message):
         """
-        Print the distance between the specified pointing center and the Moon.
+        Record a warning and pass it on to the warning sink, if any.
         """
-        moon = Moon()
-        moon.compute(self.startTime)
-        coordMoon = SkyCoord('{} {}'.format(moon.ra, moon.dec), \
-                             unit=(u.hourangle, u.deg))
-        coordTarget = SkyCoord('{} {}'.format(coord.split(';')[0], \
-                              coord.split(';')[1]), \
-                              unit=(u.hourangle, u.deg))
-
-        # Find the separation between the Sun and the target
-        return coordMoon.separation(coordTarget).deg
-
-    def _findDistanceToSun(self, coord):
-        """
-        Print the distance between the specified pointing center and the Sun.
-        """
-        # Find the coordinates of the Sun at the start of the observing run
-        sun = Sun()
-        sun.compute(self.startTime)
-        coordSun = SkyCoord('{} {}'.format(sun.ra, sun.dec),
-                            unit=(u.hourangle, u.deg))
-        coordTarget = SkyCoord('{} {}'.format(coord.split(';')[0], \
-                              coord.split(';')[1]), \
-                              unit=(u.hourangle, u.deg))
-
-        # Find the separation between the Sun and the target
-        return coordSun.separation(coordTarget).deg
+        self.warnings.append(message)
+        if self._warningSink is not None:
+            self._warningSink(message)
 
     def _getClockFreq(self):
         """
@@ -178,63 +176,25 @@ class Imaging():
 
     def _validateSubBands(self):
         """
-        Parse the subband string and check if they are all valid
-        """
-        for item in self.subbands.split(','):
-            # Is it a single number?
-            if '..' not in item:
-                try:
-                    s1 = int(item)
-                except:
-                    raise InvalidSubbandError
-                if self.rcumode == '30-90 MHz':
-                    if s1<154 or s1>461:
-                        raise OutOfBoundsSubBandError
-                elif self.rcumode == '170-230 MHz':
-                    if s1<64 or s1>448:
-                        raise OutOfBoundsSubBandError
-                elif self.rcumode == '210-250 MHz':
-                    if s1<64 or s1>240:
-                        raise OutOfBoundsSubBandError
-                else:
-                    if s1<51 or s1>461:
-                        raise OutOfBoundsSubBandError
-            # Is it a range?
-            else:
-                try:
-                    s1 = int(item.split('..')[0])
-                    s2 = int(item.split('..')[1])
-                except ValueError:
-                    raise InvalidSubBandError
-                if s1>s2:
-                    raise InvalidSubBandOrderError
-                if self.rcumode == '30-90 MHz':
-                    if s1<154 or s2>461:
-                        raise OutOfBoundsSubBandError
-                elif self.rcumode == '170-230 MHz':
-                    if s1<64 or s2>448:
-                        raise OutOfBoundsSubBandError
-                elif self.rcumode == '210-250 MHz':
-                    if s1<64 or s2>240:
-                        raise OutOfBoundsSubBandError
-                else:
-                    if s1<51 or s2>461:
-                        raise OutOfBoundsSubBandError
-
-    def _countSubBands(self):
-        """
-        Parse the subband string and count the number of subbands
-        """
-        count = 0
-        for item in self.subbands.split(','):
-            # Is it a single number?
-            if '..' not in item:
-                count += 1
-            else:
-                s1 = int(item.split('..')[0])
-                s2 = int(item.split('..')[1])
-                count += (s2 - s1 + 1)
-        return count
+        Parse the subband string and check if they are all valid. Returns
+        the parsed SubbandSet.
+        """
+        # Repeated subbands ('n*x') are valid in xmlgen, but not here
+        if '*' in self.subbands:
+            raise InvalidSubbandError
+        try:
+            subbandSet = SubbandSet(self.subbands)
+        except ValueError:
+            raise InvalidSubbandError
+        if len(subbandSet.ranges) == 0:
+            raise InvalidSubbandError
+        if subbandSet.hasReversedRange():
+            raise InvalidSubBandOrderError
+        lowest, highest = self.SUBBAND_LIMITS.get(self.rcumode, \
+                                                  self.DEFAULT_SUBBAND_LIMITS)
+        if not subbandSet.withinBounds(lowest, highest):
+            raise OutOfBoundsSubBandError
+        return subbandSet
 
     def _parsePointString(self, strFromTextBox):
         """
@@ -265,58 +225,68 @@ class Imaging():
                       ' {}, 8bits, 1s, 64ch/sb\n\n'\
                       .format(obsdate,self.antennaMode, self.rcumode))
 
+    def rankCalibrators(self, startTime, endTime):
+        """
+        Return the ranking of all valid calibrators for the time window
+        between startTime and endTime, best calibrator first. The ranking of
+        each window is computed only once.
+        """
+        key = (startTime, endTime)
+        if key not in self._calibRankings:
+            calibrators = [(item, self._getCalPointing(item)) \
+                           for item in Imaging.VALID_CALIBS]
+            target = '{};{}'.format(self.targetRA[0], self.targetDec[0])
+            self._calibRankings[key] = rankCalibrators(calibrators, \
+                                       startTime, endTime, target)
+        return self._calibRankings[key]
+
+    def getOutFileName(self):
+        """
+        Returns the name of the text file for this observation.
+        """
+        return outFileName(self.projectName, self.startTime, \
+                           self.targetLabel[0])
+
+    def writeTextFile(self, outFile):
+        """
+        Write the header, the calibrator blocks and the target block to the
+        output text file.
+        """
+        self.makeHeader(outFile)
+
+        startTime = self.startTime
+        if self.rcumode == '10-90 MHz' or self.rcumode == '30-90 MHz':
+            # In the case LBA
+            self.writeTarget(startTime, outFile)
+        else:
+            # In the case of HBA
+            # Write the first calibrator block
+            calName = self.findHBACalibrator(startTime)
+            print(GREEN_COLOR +\
+                  'INFO: Using {} as flux density calibrator'.format(calName) +\
+                  NO_COLOR)
+            startTime = self.writeCalibrator(startTime, calName, outFile)
+            # Write the target block
+            startTime = self.writeTarget(startTime, outFile)
+            # Write the second calibrator block
+            calName = self.findHBACalibrator(startTime, calName)
+            print(GREEN_COLOR +\
+                  'INFO: Using {} as flux density calibrator'.format(calName) +\
+                  NO_COLOR)
+            self.writeCalibrator(startTime, calName, outFile)
+
     def findHBACalibrator(self, time, exclude=None):
         """
         For a given datetime, return the ``best'' flux density calibrator
-        for an HBA observation.
-        """
-        # Create the telescope object
-        # The following values were taken from otool.py which is part of the
-        # LOFAR source visibility calculator.
-        lofar = Observer()
-        lofar.lon = '6.869882'
-        lofar.lat = '52.915129'
-        lofar.elevation = 15.
-        lofar.date = time
-
-        # Create a target object
-        # If multiple targets are specified, use the first one
-        target = FixedBody()
-        target._epoch = '2000'
-        coordTarget = SkyCoord('{} {}'.format(\
-                              self.targetRA[0],
-                              self.targetDec[0]),
-                              unit=(u.hourangle, u.deg))
-        target._ra = coordTarget.ra.radian
-        target._dec = coordTarget.dec.radian
-        target.compute(lofar)
-        targetElevation = float(target.alt)*180./np.pi
-
-        # Create the calibrator object
-        calibrator = FixedBody()
-        calibrator._epoch = '2000'
-        calName = []
-        calibElevation = []
-        if exclude is not None:
-            self.validCalibs.remove(exclude)
-        for item in self.validCalibs:
-            myCoord = self._getCalPointing(item)
-            calibrator._ra = myCoord.split(';')[0]
-            calibrator._dec = myCoord.split(';')[1]
-            calibrator.compute(lofar)
-            tempElevation = float(calibrator.alt)*180./np.pi
-            #print 'Temp is', tempElevation
-            #if tempElevation > self.elevation:
-            #    calName.append(item)
-            #    calibElevation.append(tempElevation)
-            #print calibElevation
-            calName.append(item)
-            calibElevation.append(tempElevation)
-        if calibElevation[np.argmax(calibElevation)] < self.elevation:
-           showWarningPopUp('One of the chosen calibrator is below user '+\
+        for an HBA observation. The calibrator named by exclude is skipped.
+        """
+        ranking = [item for item in self.rankCalibrators(time, time) \
+                   if item.name != exclude]
+        if ranking[0].startElevation < self.elevation:
+           self._warn('One of the chosen calibrator is below user '+\
                'specified elevation [{} degrees].'.format(self.elevation) +\
                ' Will generate text file anyway.')
-        return calName[np.argmax(calibElevation)]
+        return ranking[0].name
 
     def _findLBACalibrator(self, time):
         """
@@ -325,15 +295,11 @@ class Imaging():
         visibile for the entire duration of the target scan unlike
         _findHBACalibrator.
         """
-        calName = self.findHBACalibrator(time)
-        while True:
-            coord = self._getCalPointing(calName)
-            if self._isVisible(coord, time, self.targetObsLength):
-                return calName
-            else:
-                print('{} is invisible'.format(calName))
-                calName = self.findHBACalibrator(time, exclude=calName)
-                print('Will try {} next'.format(calName))
+        endTime = time + datetime.timedelta(hours=self.targetObsLength)
+        for item in self.rankCalibrators(time, endTime):
+            if item.minElevation >= self.elevation:
+                return item.name
+            print('{} is invisible'.format(item.name))
         # If control reaches here, no suitable calibrator could be found
         raise NoGoodLBACalibratorError
 
@@ -342,33 +308,11 @@ class Imaging():
         For a given source and datetime, check if the source is visible
         during the specified duration. Not that the horizon here is
         the elevation specified by the user. Note that the coordinate of
-        source is specified as 'RA;Dec'
-        """
-        endTime = startTime + datetime.timedelta(hours=duration)
-        time = startTime
-        while time < endTime:
-            lofar = Observer()
-            lofar.lon = '6.869882'
-            lofar.lat = '52.915129'
-            lofar.elevation = 15.
-            lofar.date = time
-
-            target = FixedBody()
-            target._epoch = '2000'
-            coordTarget = SkyCoord('{} {}'.format(coord.split(';')[0], \
-                              coord.split(';')[1]), \
-                              unit=(u.hourangle, u.deg))
-            target._ra = coordTarget.ra.radian
-            target._dec = coordTarget.dec.radian
-            target.compute(lofar)
-            targetElevation = float(target.alt)*180./np.pi
-
-            if targetElevation < self.elevation:
-                return False
-
-            time += datetime.timedelta(minutes=15)
-        # Turns out this source is above the horizon
-        return True
+        source is specified as 'RA;Dec'. The exact time at which the source
+        sets is used, so short dips below the horizon are not missed.
+        """
+        return findVisibility(coord, startTime, duration, \
+                              self.elevation)[0].visible
 
     def _getCalPointing(self, calName):
         """
@@ -523,3 +467,15 @@ class Imaging():
 
     def __exit__(self, *err):
         self.close()
+
+def generateTextFile(spec, outDir='.', warn=None):
+    """
+    Generate the text file for the observation described by spec without
+    any user interaction. Returns the name of the text file and the Imaging
+    object, whose warnings attribute lists all warnings that were raised.
+    """
+    img = Imaging(spec, warn)
+    outFileName = os.path.join(outDir, img.getOutFileName())
+    with open(outFileName, 'w') as outFile:
+        img.writeTextFile(outFile)
+    return outFileName, img
@@ -0,0 +1,76 @@
+import datetime
+
+def outFileName(projectName, startTime, label):
+    """
+    Returns the name of the text file for an observation of project
+    projectName starting at the datetime startTime, whose first beam is
+    labelled label.
+    """
+    return '{}_{}_{}.txt'.format(projectName, startTime.strftime('%Y%m%d'), \
+                                 label)
+
+class ObservationSpec():
+    """
+    ObservationSpec holds all the user input needed to generate the text file
+    for an interferometric imaging observation. The values use the same
+    format as the corresponding fields in the GUI, so that a specification
+    can be built either from the GUI or from a script.
+    """
+
+    def __init__(self, projectName='', mainName='', startTime='', \
+                 elevation='30', avg='4,1', arrayConfig='International', \
+                 rcumode='110-190 MHz', antennaMode='HBA Dual Inner', \
+                 subbands='', pointing='', duration='8', dysco='Enabled'):
+        """
+        Initialize the specification. startTime is 'yyyy-mm-dd-hh-mm-ss',
+        avg is '<freq>,<time>' and pointing contains one
+        '<label>,<ra (hms)>,<dec (dms)>,<demix>' line per beam. A list of
+        lines is also accepted for pointing.
+        """
+        self.projectName = projectName
+        self.mainName = mainName
+        self.startTime = startTime
+        self.elevation = elevation
+        self.avg = avg
+        self.arrayConfig = arrayConfig
+        self.rcumode = rcumode
+        self.antennaMode = antennaMode
+        self.subbands = subbands
+        if not isinstance(pointing, str):
+            pointing = '\n'.join(pointing)
+        self.pointing = pointing
+        self.duration = duration
+        self.dysco = dysco
+
+    @classmethod
+    def fromGui(cls, gui):
+        """
+        Read the specification from the widgets of a GuiWindow
+        """
+        return cls(projectName=gui.projNameT.get(),
+                   mainName=gui.mainNameT.get(),
+                   startTime=gui.dateT.get(),
+                   elevation=gui.elevationT.get(),
+                   avg=gui.avgT.get(),
+                   arrayConfig=gui.arrayConfigStr.get(),
+                   rcumode=gui.freqModeStr.get(),
+                   antennaMode=gui.antennaModeStr.get(),
+                   subbands=gui.subbandT.get(),
+                   pointing=str(gui.pointT.get('1.0', 'end-1c')),
+                   duration=gui.durationT.get(),
+                   dysco=gui.dyscoModeStr.get())
+
+    def getOutFileName(self):
+        """
+        Returns the name of the text file that Imaging writes for this
+        specification, without validating the rest of it. Raises ValueError
+        if the start time or the first pointing cannot be parsed.
+        """
+        try:
+            startTime = datetime.datetime.strptime(self.startTime, \
+                                                   '%Y-%m-%d-%H-%M-%S')
+            label = self.pointing.splitlines()[0].replace(' ', '').\
+                    split(',')[0]
+        except (ValueError, IndexError):
+            raise ValueError('Cannot determine the output file name')
+        return outFileName(self.projectName, startTime, label)
@@ -0,0 +1,89 @@
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+
+class StartupProfile():
+    """
+    StartupProfile measures where the start-up time of the GUI goes. Module
+    imports done by the main thread are timed in the style of
+    'python -X importtime' and the time at which each start-up phase ends is
+    recorded with mark().
+    """
+
+    def __init__(self):
+        """
+        Initialize the profile. The clock starts now.
+        """
+        self.startTime = time.perf_counter()
+        self.phases = []
+        self.imports = []
+        self._stack = []
+        self._thread = threading.get_ident()
+        self._import = builtins.__import__
+
+    def start(self):
+        """
+        Start timing module imports
+        """
+        builtins.__import__ = self._timedImport
+
+    def stop(self):
+        """
+        Stop timing module imports
+        """
+        builtins.__import__ = self._import
+
+    def _timedImport(self, name, globals=None, locals=None, fromlist=(), \
+                     level=0):
+        """
+        Replacement for builtins.__import__ that records the self and
+        cumulative time of every module that is loaded for the first time.
+        """
+        args = (name, globals, locals, fromlist, level)
+        if threading.get_ident() != self._thread:
+            return self._import(*args)
+        fullName = name
+        if level > 0 and globals is not None:
+            package = globals.get('__package__') or globals.get('__name__')
+            try:
+                fullName = importlib.util.resolve_name('.'*level + name, \
+                                                       package)
+            except (ImportError, ValueError):
+                pass
+        if fullName in sys.modules:
+            return self._import(*args)
+        self._stack.append(0.)
+        start = time.perf_counter()
+        try:
+            return self._import(*args)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += cumulative
+            self.imports.append((fullName, cumulative - children, cumulative, \
+                                 len(self._stack)))
+
+    def mark(self, phase):
+        """
+        Record the end of a start-up phase
+        """
+        self.phases.append((phase, time.perf_counter() - self.startTime))
+
+    def report(self, nImports=25, outFile=sys.stderr):
+        """
+        Print the start-up phases and the nImports slowest imports
+        """
+        print('Start-up profile:', file=outFile)
+        for phase, elapsed in self.phases:
+            print('  {:8.3f} s  {}'.format(elapsed, phase), file=outFile)
+        print('import time: self [us] | cumulative | imported package', \
+              file=outFile)
+        slowest = sorted(self.imports, key=lambda item: item[2], \
+                         reverse=True)[:nImports]
+        for name, selfTime, cumulative, depth in slowest:
+            print('import time: {:>9d} | {:>10d} | {}{}'.format(\
+                  int(selfTime*1e6), int(cumulative*1e6), '  '*depth, name), \
+                  file=outFile)
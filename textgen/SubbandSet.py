@@ -0,0 +1,82 @@
+class SubbandSet(object):
+    """
+    A subband list stored as (first, last, repeat) ranges instead of one
+    entry per subband. 'a..b' is the range (a, b, 1), 'n*x' is (x, x, n) and
+    'x' is (x, x, 1). A range with first > last is kept (it contains no
+    subbands), so that callers can reject it. Raises ValueError if the list
+    cannot be parsed. xmlgen.py has its own copy of this class, so that it
+    stays a standalone script.
+    """
+
+    def __init__(self, parset_subband_list):
+        self.text = parset_subband_list
+        self.ranges = []
+        stripped_subband_list = parset_subband_list.strip('[] \n\t').\
+                                replace(' ', '')
+        if stripped_subband_list == '':
+            return
+        for word in stripped_subband_list.split(','):
+            sub_list = word.split('..')
+            try:
+                if len(sub_list) == 1:
+                    multiplication = sub_list[0].split('*')
+                    if len(multiplication) == 2:
+                        subband = int(multiplication[1])
+                        self.ranges.append((subband, subband, \
+                                            int(multiplication[0])))
+                    else:
+                        subband = int(sub_list[0])
+                        self.ranges.append((subband, subband, 1))
+                elif len(sub_list) == 2:
+                    self.ranges.append((int(sub_list[0]), int(sub_list[1]), \
+                                        1))
+                else:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(str(word) + \
+                                 ' is not a valid sub_range in a subband list')
+
+    def __len__(self):
+        return sum(max(0, last - first + 1) * repeat \
+                   for (first, last, repeat) in self.ranges)
+
+    def __iter__(self):
+        for first, last, repeat in self.ranges:
+            for subband in range(first, last + 1):
+                for i in range(repeat):
+                    yield subband
+
+    def hasReversedRange(self):
+        """
+        True if one of the ranges is 'a..b' with a > b
+        """
+        return any(first > last for (first, last, repeat) in self.ranges)
+
+    def withinBounds(self, lowest, highest):
+        """
+        True if all subbands are in [lowest, highest]
+        """
+        return all(lowest <= first and last <= highest \
+                   for (first, last, repeat) in self.ranges if first <= last)
+
+    def duplicates(self):
+        """
+        Returns the sorted list of subbands that are specified more than once.
+        The ranges are sorted and swept once, so this takes O(n log n) in the
+        number of ranges.
+        """
+        doubles = []
+        covered = None
+        for first, last, repeat in sorted(r for r in self.ranges \
+                                          if r[0] <= r[1]):
+            if repeat > 1:
+                doubles.append((first, last))
+            elif covered is not None and first <= covered:
+                doubles.append((first, min(last, covered)))
+            covered = last if covered is None else max(covered, last)
+        result = []
+        for first, last in sorted(doubles):
+            if result and first <= result[-1]:
+                first = result[-1] + 1
+            result += range(first, last + 1)
+        return result
@@ -0,0 +1,318 @@
+from collections import namedtuple
+import datetime
+
+from astropy.coordinates import SkyCoord, EarthLocation, AltAz, get_body
+from astropy.time import Time
+import astropy.units as u
+import numpy as np
+
+# Location of the LOFAR core. The following values were taken from otool.py
+# which is part of the LOFAR source visibility calculator.
+LOFAR_LOCATION = EarthLocation(lon=6.869882*u.deg, lat=52.915129*u.deg, \
+                               height=15.*u.m)
+
+# Default sampling interval (in minutes) of the visibility time grid
+DEFAULT_STEP = 15.
+
+Visibility = namedtuple('Visibility', ['minElevation', 'setTime', 'visible'])
+Visibility.__doc__ = """
+Visibility of a single source over a time window. minElevation is the lowest
+elevation (in degrees) of the source during the window, setTime is the time at
+which the source is below the elevation limit (the start time if it already is
+at the start, None if it never is) and visible is True if the source stays
+above the limit for the whole window. setTime is the exact time of the
+elevation crossing, not a point on a sampling grid.
+"""
+
+def parseCoords(coords):
+    """
+    Convert one or more 'RA;Dec' strings (RA in hms and Dec in dms) into a
+    single SkyCoord object.
+    """
+    if isinstance(coords, SkyCoord):
+        return coords
+    if isinstance(coords, str):
+        coords = [coords]
+    ra = [item.split(';')[0] for item in coords]
+    dec = [item.split(';')[1] for item in coords]
+    return SkyCoord(ra, dec, unit=(u.hourangle, u.deg))
+
+def timeGrid(startTime, duration, step=DEFAULT_STEP):
+    """
+    Return the times (as an astropy Time array) at which the elevation is
+    sampled for an observation starting at startTime and lasting duration
+    hours. The grid always contains the start time.
+    """
+    offsets = np.arange(0., max(duration*60., 0.), step)
+    if offsets.size == 0:
+        offsets = np.zeros(1)
+    return Time(startTime) + offsets*u.min
+
+def elevations(coords, times):
+    """
+    Return the elevation (in degrees) of every source at every time as an
+    array of shape (nSources, nTimes). All sources and times are transformed
+    to the LOFAR horizontal frame in a single call.
+    """
+    coords = parseCoords(coords)
+    times = Time(times)
+    frame = AltAz(obstime=times.reshape((1,) + times.shape), \
+                  location=LOFAR_LOCATION)
+    altaz = coords.reshape(coords.shape + (1,)).transform_to(frame)
+    return np.atleast_2d(altaz.alt.deg)
+
+# Ratio between the length of a solar and a sidereal day
+SIDEREAL_RATE = 1.00273790935
+
+Crossings = namedtuple('Crossings', ['transit', 'rise', 'set', 'alwaysUp', \
+                                     'neverUp'])
+Crossings.__doc__ = """
+Times at which a source crosses a given elevation around the transit that is
+closest to the requested time. rise and set are None if the source is always
+above (alwaysUp) or always below (neverUp) the elevation.
+"""
+
+def _siderealAngle(times):
+    """
+    Return the local mean sidereal angle (in degrees) at the LOFAR core for
+    the given astropy Time object.
+    """
+    days = times.jd - 2451545.0
+    gmst = 280.46061837 + 360.98564736629*days
+    return (gmst + LOFAR_LOCATION.lon.deg)%360.
+
+def _pairwiseElevations(coords, times):
+    """
+    Return the elevation (in degrees) of coords[i] at times[i]. Unlike
+    elevations(), no (nSources, nTimes) grid is formed.
+    """
+    altaz = coords.transform_to(AltAz(obstime=times, location=LOFAR_LOCATION))
+    return np.atleast_1d(altaz.alt.deg)
+
+# Smallest rate of change of the elevation (in degrees per day) for which a
+# Newton step is taken when refining a crossing, the maximum number of steps
+# (Newton or bisection) per crossing and the difference from the requested
+# elevation (in degrees) at which a crossing has converged
+MIN_ELEVATION_RATE = 1.
+MAX_REFINE_STEPS = 40
+ELEVATION_TOLERANCE = 1e-4
+
+def _refineCrossings(coords, jd, elevation, lower, upper, rising, \
+                     tolerance=ELEVATION_TOLERANCE):
+    """
+    Refine approximate crossing times (given as Julian dates) with Newton
+    steps on the apparent elevation of the sources, until the elevation is
+    within tolerance (in degrees) of the requested one. Each crossing is
+    bracketed by the Julian dates lower and upper, between which the elevation
+    increases (if rising) or decreases monotonically. Close to culmination,
+    where the elevation hardly changes, and when a Newton step would leave the
+    bracket, the bracket is bisected instead. Only the crossings that have not
+    converged yet are transformed in each step.
+    """
+    lat = LOFAR_LOCATION.lat.rad
+    lower = np.array(lower, dtype=float)
+    upper = np.array(upper, dtype=float)
+    jd = np.clip(jd, lower, upper)
+    todo = np.arange(len(jd))
+    for _ in range(MAX_REFINE_STEPS):
+        times = Time(jd[todo], format='jd')
+        alt = _pairwiseElevations(coords[todo], times)
+        converged = np.abs(alt - elevation) < tolerance
+        todo, times, alt = todo[~converged], times[~converged], \
+                           alt[~converged]
+        if todo.size == 0:
+            break
+        hourAngle = np.radians(_siderealAngle(times) - coords.ra.deg[todo])
+        # Rate of change of the elevation in degrees per day
+        rate = -np.cos(lat)*np.cos(coords.dec.rad[todo])*np.sin(hourAngle) / \
+               np.cos(np.radians(alt)) * 360.*SIDEREAL_RATE
+
+        # The crossing is later than jd if a rising source is still below or
+        # a setting source still above the elevation
+        later = (alt < elevation) == rising[todo]
+        lower[todo] = np.where(later, jd[todo], lower[todo])
+        upper[todo] = np.where(later, upper[todo], jd[todo])
+
+        useNewton = np.abs(rate) >= MIN_ELEVATION_RATE
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = np.where(useNewton, jd[todo] - (alt - elevation)/rate, \
+                              jd[todo])
+        useNewton &= (newton >= lower[todo]) & (newton <= upper[todo])
+        jd[todo] = np.where(useNewton, newton, \
+                            0.5*(lower[todo] + upper[todo]))
+    return jd
+
+def _transits(coords, time):
+    """
+    Return the Julian dates of the transits of the sources that are closest
+    to the specified astropy Time.
+    """
+    hourAngle = (_siderealAngle(time) - coords.ra.deg + 180.)%360. - 180.
+    return np.atleast_1d(time.jd - hourAngle/(360.*SIDEREAL_RATE))
+
+def findCrossings(coords, time, elevation, tolerance=ELEVATION_TOLERANCE):
+    """
+    Return the exact times at which each source rises above and sets below the
+    specified elevation (in degrees) at the LOFAR core. The initial estimate is
+    computed analytically from the hour angle, the declination and the
+    latitude and is then refined with Newton steps until the elevation is
+    within tolerance (in degrees). Returns a list of Crossings tuples, one per
+    source.
+    """
+    coords = parseCoords(coords)
+    time = Time(time)
+    lat = LOFAR_LOCATION.lat.rad
+    dec = coords.dec.rad
+
+    transit = _transits(coords, time)
+
+    # Semi-diurnal arc above the requested elevation
+    cosArc = (np.sin(np.radians(elevation)) - np.sin(lat)*np.sin(dec)) / \
+             (np.cos(lat)*np.cos(dec))
+    alwaysUp = cosArc < -1.
+    neverUp = cosArc > 1.
+    halfArc = np.degrees(np.arccos(np.clip(cosArc, -1., 1.))) / \
+              (360.*SIDEREAL_RATE)
+    rise = transit - halfArc
+    setting = transit + halfArc
+
+    # Refine the rise and set times of all crossing sources together
+    crosses = ~(alwaysUp | neverUp)
+    nCross = int(crosses.sum())
+    if nCross > 0:
+        both = SkyCoord(np.tile(coords.ra.deg[crosses], 2), \
+                        np.tile(coords.dec.deg[crosses], 2), unit=u.deg)
+        # Between transit and lower culmination the elevation is monotonic
+        halfDay = 0.5/SIDEREAL_RATE
+        transits = np.tile(transit[crosses], 2)
+        rising = np.arange(2*nCross) < nCross
+        jd = _refineCrossings(both, np.concatenate((rise[crosses], \
+                              setting[crosses])), elevation, \
+                              np.where(rising, transits - halfDay, transits), \
+                              np.where(rising, transits, transits + halfDay), \
+                              rising, tolerance)
+        rise[crosses] = jd[:nCross]
+        setting[crosses] = jd[nCross:]
+
+    result = []
+    for index in range(len(coords)):
+        transitTime = _toDatetime(transit[index])
+        if crosses[index]:
+            result.append(Crossings(transitTime, _toDatetime(rise[index]), \
+                                    _toDatetime(setting[index]), False, \
+                                    False))
+        else:
+            result.append(Crossings(transitTime, None, None, \
+                                    bool(alwaysUp[index]), \
+                                    bool(neverUp[index])))
+    return result
+
+def _toDatetime(jd):
+    """
+    Convert a Julian date to a datetime object.
+    """
+    return Time(jd, format='jd').to_datetime()
+
+def _lowerCulmination(coords):
+    """
+    Return the geometric elevation (in degrees, ignoring refraction and
+    precession) of the sources at lower culmination.
+    """
+    lat = LOFAR_LOCATION.lat.deg
+    return np.atleast_1d(lat + coords.dec.deg - 90.)
+
+def _windowElevations(coords, startTime, endTime):
+    """
+    Return the elevations (in degrees) of the sources at startTime and
+    endTime as an array of shape (nSources, 2) together with the minimum
+    elevation of each source over the window.
+    """
+    elev = elevations(coords, [startTime, endTime])
+    minElev = elev.min(axis=1)
+
+    # Between the end points, the elevation only has a minimum at lower
+    # culmination, which happens half a sidereal day away from transit.
+    halfDay = 0.5/SIDEREAL_RATE
+    start = Time(startTime).jd
+    end = Time(endTime).jd
+    culmination = _transits(coords, Time(startTime)) - halfDay
+    culmination += 2.*halfDay*np.ceil((start - culmination)/(2.*halfDay))
+    inWindow = culmination <= end
+    minElev[inWindow] = np.minimum(minElev[inWindow], \
+                                   _lowerCulmination(coords)[inWindow])
+    return elev, minElev
+
+def findVisibility(coords, startTime, duration, minElevation):
+    """
+    For every source, check whether it stays above minElevation for the
+    whole observation starting at startTime and lasting duration hours.
+    Instead of sampling the elevation on a time grid, the minimum elevation
+    and the time at which each source drops below minElevation are computed
+    from the elevation crossings. Returns a list of Visibility tuples, one
+    per source.
+    """
+    coords = parseCoords(coords)
+    endTime = startTime + datetime.timedelta(hours=duration)
+    elev, minElev = _windowElevations(coords, startTime, endTime)
+    crossings = findCrossings(coords, startTime, minElevation)
+    result = []
+    for index in range(len(coords)):
+        if elev[index][0] < minElevation or crossings[index].neverUp:
+            setTime = startTime
+        elif crossings[index].alwaysUp or crossings[index].set >= endTime:
+            setTime = None
+        else:
+            setTime = max(startTime, crossings[index].set)
+        result.append(Visibility(float(minElev[index]), setTime, \
+                                 setTime is None))
+    return result
+
+CalibratorRank = namedtuple('CalibratorRank', ['name', 'startElevation', \
+                            'endElevation', 'minElevation', 'separation'])
+CalibratorRank.__doc__ = """
+Elevations (in degrees) of a calibrator at the start and end of a time window,
+its minimum elevation over the window and its separation (in degrees) from
+the target. separation is None if no target was specified.
+"""
+
+def rankCalibrators(calibrators, startTime, endTime, target=None):
+    """
+    Rank calibrators for the time window between startTime and endTime.
+    calibrators is a list of (name, 'RA;Dec') pairs and target an optional
+    'RA;Dec' string. All calibrators are evaluated together and a list of
+    CalibratorRank tuples is returned, highest elevation at startTime first.
+    """
+    names = [item[0] for item in calibrators]
+    coords = parseCoords([item[1] for item in calibrators])
+    elev, minElev = _windowElevations(coords, startTime, endTime)
+    if target is not None:
+        separation = coords.separation(parseCoords(target)[0]).deg
+    else:
+        separation = [None]*len(names)
+
+    ranking = []
+    for index in np.argsort(-elev[:, 0], kind='stable'):
+        ranking.append(CalibratorRank(names[index], float(elev[index][0]), \
+                       float(elev[index][1]), float(minElev[index]), \
+                       None if target is None else float(separation[index])))
+    return ranking
+
+def minimumSeparations(coords, startTime, duration, bodies=('sun', 'moon'), \
+                       step=DEFAULT_STEP):
+    """
+    Return the minimum angular separation (in degrees) between every source
+    and each of the specified solar system bodies during the observation
+    starting at startTime and lasting duration hours. The positions of the
+    bodies are computed once on the time grid and the separations for all
+    sources are evaluated as a single (nSources, nTimes) broadcast. Returns a
+    dictionary mapping each body to an array with one value per source.
+    """
+    coords = parseCoords(coords)
+    times = timeGrid(startTime, duration, step)
+    targets = coords.reshape(coords.shape + (1,))
+    result = {}
+    for body in bodies:
+        position = get_body(body, times, LOFAR_LOCATION)
+        separation = position.separation(targets.transform_to(position.frame))
+        result[body] = np.atleast_2d(separation.deg).min(axis=1)
+    return result
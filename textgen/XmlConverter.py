@@ -0,0 +1,66 @@
+import importlib
+import importlib.util
+import os
+import shutil
+from io import StringIO
+
+_xmlgen = None
+
+def loadXmlgen():
+    """
+    Import xmlgen.py as a module. It is looked for on the python path (which
+    includes the directory of lofar_text_generator.py), in the current
+    working directory and on PATH, in that order. The module is loaded only
+    once and reused by all later conversions. Raises ImportError if xmlgen.py
+    cannot be found.
+    """
+    global _xmlgen
+    if _xmlgen is not None:
+        return _xmlgen
+    try:
+        _xmlgen = importlib.import_module('xmlgen')
+        return _xmlgen
+    except ImportError:
+        pass
+    for fileName in [os.path.join(os.getcwd(), 'xmlgen.py'), \
+                     shutil.which('xmlgen.py')]:
+        if fileName is not None and os.path.isfile(fileName):
+            spec = importlib.util.spec_from_file_location('xmlgen', fileName)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _xmlgen = module
+            return _xmlgen
+    raise ImportError('Could not find xmlgen.py')
+
+def errorMessage(err):
+    """
+    Returns the message of an exception raised by xmlgen without the
+    terminal color codes, so that it can be shown in a pop-up.
+    """
+    xmlgen = loadXmlgen()
+    return str(err).replace(xmlgen.RED_COLOR, '').replace(xmlgen.NO_COLOR, '')
+
+def logWarnings(log):
+    """
+    Returns the warnings in the messages of an xmlgen conversion, without the
+    'WARNING: ' prefix and the terminal color codes.
+    """
+    xmlgen = loadXmlgen()
+    return [line.split('WARNING: ', 1)[1].replace(xmlgen.NO_COLOR, '') \
+            for line in log.splitlines() if 'WARNING: ' in line]
+
+def convertToXml(textFileName, xmlFileName=None, status='opened'):
+    """
+    Convert a text file to xml in-process. By default, the xml file gets the
+    name of the text file with the extension replaced by .xml. The progress
+    messages of xmlgen are captured instead of printed; only this conversion
+    writes to the capture, so it is safe to call from any thread. Returns the
+    name of the xml file and the captured messages. Raises
+    xmlgen.GenException if the text file is invalid.
+    """
+    xmlgen = loadXmlgen()
+    if xmlFileName is None:
+        xmlFileName = os.path.splitext(textFileName)[0] + '.xml'
+    log = StringIO()
+    xmlgen.convertFile(textFileName, xmlFileName, status, log=log)
+    return xmlFileName, log.getvalue()
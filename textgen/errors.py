@@ -1,5 +1,4 @@
 import sys
-import tkinter.messagebox as tkMessageBox
 
 # Colorscheme for printing information and errors
 RED_COLOR    = '\033[91m'
@@ -63,6 +62,10 @@ class NoGoodLBACalibratorError(Exception):
     """Raised if no good calibrator could be found"""
     pass
 
+class JobCancelledError(Exception):
+    """Raised in the GUI worker thread when the running job is cancelled"""
+    pass
+
 def getErrorMessage():
     """
     Returns the appropriate error message for the most recently raised
@@ -93,10 +96,18 @@ def showErrorPopUp(message):
     """
     Display an error pop-up message
     """
+    import tkinter.messagebox as tkMessageBox
     tkMessageBox.showerror('Error', message)
 
 def showWarningPopUp(message):
     """
     Display a warning pop-up message
     """
+    import tkinter.messagebox as tkMessageBox
     tkMessageBox.showinfo('Warning', message)
+
+def printWarning(message):
+    """
+    Print a warning message to the terminal
+    """
+    print(RED_COLOR + 'WARNING: ' + message + NO_COLOR)
@@ -33,9 +33,23 @@ from xml.sax.saxutils import escape as XMLescape
 from os import _exit as os_exit
 from os.path import splitext
 from datetime import datetime, timedelta
-from math import pi
+from math import pi, sin, cos, asin, atan2, sqrt
+from io import StringIO
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from functools import lru_cache
 import re
 import json
+import inspect
+import hashlib
+import os
+import glob
+import importlib
+import itertools
+import threading
+import signal
+import stat
 
 CLOCK_MODES = ['160 MHz', '200 MHz']
 INSTRUMENT_FILTERS = ["10-70 MHz", "30-70 MHz", "10-90 MHz", "30-90 MHz", "110-190 MHz", "170-230 MHz", "210-250 MHz"]
@@ -59,6 +73,14 @@ INTERNATIONAL_STATIONS = 'DE601,DE602,DE603,DE604,DE605,FR606,SE607,UK608,DE609,
 NL_STATIONS = 'CS001,CS002,CS003,CS004,CS005,CS006,CS007,CS011,CS013,CS017,CS021,CS024,CS026,CS028,CS030,CS031,CS032,CS101,CS103,CS201,CS301,CS302,CS401,CS501,RS106,RS205,RS208,RS210,RS305,RS306,RS307,RS310,RS406,RS407,RS409,RS503,RS508,RS509'
 DEFAULT_TASKS_PER_NODE = 11
 DEFAULT_CORES_PER_TASK = 2
+DEFAULT_SERVER_PORT = 8642
+# Seconds a --serve connection may be idle, e.g. kept alive between requests, before it is closed, so that idle clients
+# cannot hold all handler threads
+SERVER_IDLE_TIMEOUT = 5
+# Inputs with fewer BLOCKs are rendered serially with -j, as starting the worker processes and sending the BLOCKs to
+# them takes longer than rendering a BLOCK (about 2 ms for a BLOCK without repeats)
+PARALLEL_MIN_BLOCKS = 16
+COMPRESSION_MODULES = {'.gz': 'gzip', '.xz': 'lzma', '.bz2': 'bz2'}
 
 RED_COLOR = '\033[91m'
 NO_COLOR = '\033[0m'
@@ -74,6 +96,142 @@ class GenException(Exception):
     def __init__(self, message):
         # Call the base class constructor with the parameters it needs
         super(Exception, self).__init__(RED_COLOR + message + NO_COLOR)
+        self.message = message
+
+    def __reduce__(self):
+        # Pickle the plain message, so that errors raised in worker processes are not colored twice
+        return (GenException, (self.message,))
+
+
+class CompactFilter(object):
+    '''
+    Streaming filter for --compact: removes the indentation and the line breaks between tags. Only whitespace that
+    contains a line break is removed, so the text of an element is never changed. The text after the last '>' of a
+    chunk is held back until the next chunk, as it may be the start of such whitespace.
+    '''
+    BETWEEN_TAGS = re.compile(r'>\s*\n\s*<')
+
+    def __init__(self):
+        self.tail = ''
+
+    def feed(self, text):
+        text = self.tail + text
+        end = text.rfind('>')
+        if end < 0:
+            self.tail = text
+            return ''
+        self.tail = text[end:]
+        return self.BETWEEN_TAGS.sub('><', text[:end])
+
+    def close(self):
+        text, self.tail = self.tail, ''
+        return self.BETWEEN_TAGS.sub('><', text)
+
+
+class PrettyFilter(object):
+    '''
+    Streaming filter for --pretty: re-indents the XML by indent spaces per level, one tag per line, except that an
+    element that only contains text stays on one line. Whitespace that contains a line break is dropped, as in
+    CompactFilter.
+    '''
+    TOKENS = re.compile(r'<[^>]*>|[^<]+')
+
+    def __init__(self, indent=2):
+        self.indent = ' ' * indent
+        self.depth = 0
+        self.last = None  # 'start', 'end', 'empty' or 'text'
+        self.tail = ''
+
+    def feed(self, text):
+        text = self.tail + text
+        end = text.rfind('>') + 1
+        self.tail = text[end:]
+        return self.format(text[:end])
+
+    def close(self):
+        text, self.tail = self.tail, ''
+        return self.format(text) + '\n'
+
+    def format(self, text):
+        parts = []
+        for token in self.TOKENS.findall(text):
+            if token[0] != '<':
+                if '\n' in token and not token.strip():
+                    continue
+                kind = 'text'
+            elif token[1] == '/':
+                self.depth -= 1
+                if self.last not in ('start', 'text'):
+                    parts.append('\n' + self.indent * self.depth)
+                kind = 'end'
+            else:
+                if self.last is not None:
+                    parts.append('\n' + self.indent * self.depth)
+                if token[1] in '?!' or token.endswith('/>'):
+                    kind = 'empty'
+                else:
+                    kind = 'start'
+                    self.depth += 1
+            parts.append(token)
+            self.last = kind
+        return ''.join(parts)
+
+
+LAYOUT_FILTERS = {'compact': CompactFilter, 'pretty': PrettyFilter}
+
+
+class XMLEmitter(object):
+    '''
+    Buffered output layer for the generated XML. The write* functions hand
+    it fragments, which are collected in memory and written to the target
+    (a file, a pipe or an io.StringIO) in a few large writes: whenever
+    bufferSize characters are buffered and on flush(). With layout
+    'compact' or 'pretty', the XML is passed through the matching filter of
+    LAYOUT_FILTERS on its way out.
+    '''
+
+    def __init__(self, target, bufferSize=1 << 20, layout=None):
+        self.target = target
+        self.bufferSize = bufferSize
+        self.filter = LAYOUT_FILTERS[layout]() if layout else None
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.bufferSize:
+            self._drain()
+
+    def writeln(self, text):
+        self._parts.append(text)
+        self._parts.append('\n')
+        self._size += len(text) + 1
+        if self._size >= self.bufferSize:
+            self._drain()
+
+    def _drain(self):
+        if self._parts:
+            text = ''.join(self._parts)
+            self.target.write(self.filter.feed(text) if self.filter else text)
+            self._parts = []
+            self._size = 0
+
+    def flush(self):
+        self._drain()
+        self.target.flush()
+
+    def close(self):
+        self._drain()
+        if self.filter:
+            self.target.write(self.filter.close())
+        self.target.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def merge_dicts(*dict_args):
@@ -87,16 +245,53 @@ def merge_dicts(*dict_args):
     return result
 
 
+class LogOutput(threading.local):
+    '''
+    Where the messages of xmlgen go in each thread: sys.stdout, unless the thread redirected them with logTo
+    '''
+    stream = None
+
+
+logOutput = LogOutput()
+
+
+def logFile():
+    return sys.stdout if logOutput.stream is None else logOutput.stream
+
+
+@contextmanager
+def logTo(stream):
+    '''
+    Send the messages that xmlgen prints in this thread to stream (a file-like object) instead of sys.stdout, or to
+    the current destination if stream is None. Unlike contextlib.redirect_stdout, other threads are not affected.
+    '''
+    previous = logOutput.stream
+    if stream is not None:
+        logOutput.stream = stream
+    try:
+        yield logFile()
+    finally:
+        logOutput.stream = previous
+
+
+def printLine(message):
+    print(message, file=logFile())
+
+
 def printMessage(message):
-    print((GREEN_COLOR + message + NO_COLOR))
+    print((GREEN_COLOR + message + NO_COLOR), file=logFile())
 
 
 def printInfo(message):
-    print((CYAN_COLOR + 'INFO: ' + message + NO_COLOR))
+    print((CYAN_COLOR + 'INFO: ' + message + NO_COLOR), file=logFile())
 
 
 def printWarning(message):
-    print((YELLOW_COLOR + 'WARNING: ' + message + NO_COLOR))
+    print((YELLOW_COLOR + 'WARNING: ' + message + NO_COLOR), file=logFile())
+
+
+def printError(message):
+    print((RED_COLOR + 'ERROR: ' + message + NO_COLOR), file=logFile())
 
 
 def dms2deg(dms_str):
@@ -182,6 +377,83 @@ def convertAngle2(angle, beamName):
     return angle
 
 
+class SubbandSet(object):
+    '''
+    A subband list stored as (first, last, repeat) ranges instead of one
+    entry per subband. 'a..b' is the range (a, b, 1), 'n*x' is (x, x, n) and
+    'x' is (x, x, 1). A range with first > last is kept (it contains no
+    subbands), so that callers can reject it. textgen/SubbandSet.py has the
+    same class for Imaging; this copy keeps xmlgen.py a standalone script.
+    '''
+
+    def __init__(self, parset_subband_list):
+        self.text = parset_subband_list
+        self.ranges = []
+        stripped_subband_list = parset_subband_list.strip('[] \n\t').replace(' ', '')
+        if stripped_subband_list == '':
+            return
+        for word in stripped_subband_list.split(','):
+            sub_list = word.split('..')
+            try:
+                if len(sub_list) == 1:
+                    multiplication = sub_list[0].split('*')
+                    if len(multiplication) == 2:
+                        subband = int(multiplication[1])
+                        self.ranges.append((subband, subband, int(multiplication[0])))
+                    else:
+                        subband = int(sub_list[0])
+                        self.ranges.append((subband, subband, 1))
+                elif len(sub_list) == 2:
+                    self.ranges.append((int(sub_list[0]), int(sub_list[1]), 1))
+                else:
+                    raise ValueError
+            except ValueError:
+                raise GenException(str(word) + ' is not a valid sub_range in a subband list')
+
+    def __len__(self):
+        return sum(max(0, last - first + 1) * repeat for (first, last, repeat) in self.ranges)
+
+    def __iter__(self):
+        for first, last, repeat in self.ranges:
+            for subband in range(first, last + 1):
+                for i in range(repeat):
+                    yield subband
+
+    def hasReversedRange(self):
+        '''
+        True if one of the ranges is 'a..b' with a > b
+        '''
+        return any(first > last for (first, last, repeat) in self.ranges)
+
+    def withinBounds(self, lowest, highest):
+        '''
+        True if all subbands are in [lowest, highest]
+        '''
+        return all(lowest <= first and last <= highest
+                   for (first, last, repeat) in self.ranges if first <= last)
+
+    def duplicates(self):
+        '''
+        Returns the sorted list of subbands that are specified more than once.
+        The ranges are sorted and swept once, so this takes O(n log n) in the
+        number of ranges.
+        '''
+        doubles = []
+        covered = None
+        for first, last, repeat in sorted(r for r in self.ranges if r[0] <= r[1]):
+            if repeat > 1:
+                doubles.append((first, last))
+            elif covered is not None and first <= covered:
+                doubles.append((first, min(last, covered)))
+            covered = last if covered is None else max(covered, last)
+        result = []
+        for first, last in sorted(doubles):
+            if result and first <= result[-1]:
+                first = result[-1] + 1
+            result += range(first, last + 1)
+        return result
+
+
 def parse_subband_list(parset_subband_list, nr_subbands):
     r'''
     Parse a subband list from a parset.
@@ -202,52 +474,74 @@ def parse_subband_list(parset_subband_list, nr_subbands):
     >>> parse_subband_list('[77..87,116..127,155..166,194..205,233..243,272..282,311..321]')
     >>> parse_subband_list('[]')
     '''
-    stripped_subband_list = parset_subband_list.strip('[] \n\t').replace(' ', '')
-    if stripped_subband_list == '':
-        return []
-    sub_lists = [word.strip().split('..') for word in stripped_subband_list.split(',')]
-    subbands = []
-    for sub_list in sub_lists:
-        if len(sub_list) == 1:
-            multiplication = sub_list[0].split('*')
-            if len(multiplication) == 2:
-                subbands += [int(multiplication[1])] * int(multiplication[0])
-            else:
-                subbands.append(int(sub_list[0]))
-        elif len(sub_list) == 2:
-            subbands += list(range(int(sub_list[0]), int(sub_list[1]) + 1))
-        else:
-            raise GenException(str(word) + ' is not a valid sub_range in a subband list') # FIXME: word might be undefined?
-    doubles = set([x for x in subbands if subbands.count(x) > 1])
+    subbandSet = SubbandSet(parset_subband_list)
+    warnDuplicateSubbands(subbandSet)
+    return list(subbandSet)
+
+
+def warnDuplicateSubbands(subbandSet):
+    doubles = subbandSet.duplicates()
     if len(doubles) > 0:
-        printWarning(parset_subband_list + ' contains the following double specified subbands: %s' % sorted(doubles))
-    return subbands
+        printWarning(subbandSet.text + ' contains the following double specified subbands: %s' % doubles)
 
 
 def verifySubbandList(keyname, parset_subband_list, nr_subbands):
-    subbandListCalculated = parse_subband_list(parset_subband_list, nr_subbands)
-    calcNrSubbands = len(subbandListCalculated)
+    subbandSet = SubbandSet(parset_subband_list)
+    warnDuplicateSubbands(subbandSet)
+    calcNrSubbands = len(subbandSet)
     if calcNrSubbands != int(nr_subbands):
         raise GenException("%s error: calculated number of subbands (%i) is not equal to the specified number of "
                            "subbands (%s)\nIs the subband list correct?" % (keyname, calcNrSubbands, nr_subbands))
 
 
+def splitParms(value):
+    '''
+    Split a ';' separated parameter list and clear the white-space just before and directly after each ';'.
+    This intentionally does not clear white-space in the (string) parameters themselves, nor before the first one.
+    '''
+    valList = value.rstrip().split(';')
+    last = len(valList) - 1
+    for i in range(last + 1):
+        if i > 0:
+            valList[i] = valList[i].lstrip()
+        if i < last:
+            valList[i] = valList[i].rstrip()
+    return valList
+
+
 def readExtraParms(keyset, lines):
     valListEsc = []
     for line in lines:
         if line.startswith(keyset + ":") or line.startswith(keyset + "="):
-            # clear white-space just before ';'
-            line = re.sub(r"\s+;", ';', line.lstrip(keyset).lstrip(":").lstrip("=").rstrip())
-            # clear white-space directly after ';' (this method intentionally does not clear white-space in the
-            # (string) parameters self!)
-            line = re.sub(r";\s+", ';', line)
-            valList = line.split(';')
+            valList = splitParms(line.lstrip(keyset).lstrip(":").lstrip("="))
             for strVal in valList:
                 valListEsc.append(XMLescape(strVal))
     return valListEsc
 
 
+def readTABAngle(value, sexagesimalToDegrees):
+    '''
+    Returns a TAB angle in radians. value is in degrees if it ends in 'deg' or 'd', in radians if it is a number and
+    in the sexagesimal format that sexagesimalToDegrees (hms2deg or dms2deg) reads otherwise.
+    '''
+    if value.endswith('deg') or value.endswith('d'):  # degree units?
+        return deg2rad(value.rstrip(' deg'))
+    try:  # if float conversion works assume radian
+        return float(value)
+    except ValueError:
+        return deg2rad(sexagesimalToDegrees(value))
+
+
 def readTiedArrayBeams(lines):
+    '''
+    Read the TAB lines of a beam or Global_TAB:
+      c;angle1;angle2                                 a coherent TAB
+      i;dispersionMeasure                             an incoherent TAB
+      rings;nrRings;ringSize[;angle1;angle2]          coherent TABs in hexagonal rings around a centre TAB
+      grid;nrColumns;nrRows;spacing[;angle1;angle2]   coherent TABs on a rectangular grid
+    The rings and grid are centred on angle1;angle2, or on the beam if that is not given; expandTiedArrayBeams turns
+    them into coherent TABs.
+    '''
     tabs = []
     stopTABsearch = False
     try:
@@ -257,35 +551,121 @@ def readTiedArrayBeams(lines):
             else:
                 valList = line.lstrip().rstrip().replace(' ', '').split(';')
                 if valList[0].startswith('c'):
-                    # angle1
-                    if valList[1].endswith('deg') or valList[1].endswith('d'):  # degree units?
-                        valList[1] = deg2rad(valList[1].rstrip(' deg'))
-                    else:  # try radian else HMS
-                        try:  # if float conversion works assume radian
-                            angle1 = float(valList[1])
-                            valList[1] = angle1
-                        except:  # float conversion did not work try hms
-                            valList[1] = deg2rad(hms2deg(valList[1]))
-                    # angle2
-                    if valList[2].endswith('deg') or valList[2].endswith('d'):  # degree units?
-                        valList[2] = deg2rad(valList[2].rstrip(' deg'))
-                    else:  # try radian else HMS
-                        try:  # if float conversion works assume radian
-                            angle2 = float(valList[2])
-                            valList[2] = angle2
-                        except:  # float conversion did not work try hms
-                            valList[2] = deg2rad(dms2deg(valList[2]))
-                            # if valList[2].endswith('deg') or valList[2].endswith('d'):
-                            # valList[2] = deg2rad(valList[2].rstrip(' deg'))
+                    valList[1] = readTABAngle(valList[1], hms2deg)
+                    valList[2] = readTABAngle(valList[2], dms2deg)
                     tabs.append(valList)
                 elif valList[0].startswith('i'):
                     valList[1] = float(valList[1])
                     tabs.append(valList)
-    except:
-        raise GenException("An error occurred reading the TAB specification on line '%s'" % line) # FIXME line might be undefined?
+                elif valList[0] in ('rings', 'grid'):
+                    nrCounts = 1 if valList[0] == 'rings' else 2
+                    if len(valList) not in (nrCounts + 2, nrCounts + 4):
+                        raise GenException("wrong number of parameters in the TAB specification on line '%s'" % line)
+                    counts = [int(value) for value in valList[1:nrCounts + 1]]
+                    if min(counts) < (0 if valList[0] == 'rings' else 1):
+                        raise GenException("too few TABs in the TAB specification on line '%s'" % line)
+                    spacing = readTABAngle(valList[nrCounts + 1], dms2deg)
+                    centre = None
+                    if len(valList) == nrCounts + 4:
+                        centre = (readTABAngle(valList[nrCounts + 2], hms2deg),
+                                  readTABAngle(valList[nrCounts + 3], dms2deg))
+                    tabs.append([valList[0]] + counts + [spacing, centre])
+    except (ValueError, IndexError):
+        raise GenException("An error occurred reading the TAB specification on line '%s'" % line)
     return tabs
 
 
+def tabRingOffsets(nrRings, ringSize, numpy=None):
+    '''
+    Returns the l and m offsets (direction cosines) of a centre TAB and nrRings hexagonal rings around it. Ring k
+    has 6k TABs, at a distance of k * ringSize along the hexagon, so there are 1 + 3 * nrRings * (nrRings + 1) TABs.
+    Ring by ring, each ring starts at the corner on the l axis and goes counterclockwise.
+    '''
+    if numpy is not None:
+        rings = numpy.arange(1, nrRings + 1)
+        ring = numpy.repeat(rings, 6 * rings)  # the ring of each TAB
+        index = numpy.arange(len(ring)) - 3 * ring * (ring - 1)  # position in its ring
+        corner = (index // ring) * (pi / 3)  # angle of the corner each TAB comes after
+        step = index % ring  # steps from that corner towards the next one
+        l = ringSize * (ring * numpy.cos(corner) + step * numpy.cos(corner + 2 * pi / 3))
+        m = ringSize * (ring * numpy.sin(corner) + step * numpy.sin(corner + 2 * pi / 3))
+        return numpy.concatenate(([0.0], l)), numpy.concatenate(([0.0], m))
+    l = [0.0]
+    m = [0.0]
+    for ring in range(1, nrRings + 1):
+        for side in range(6):
+            corner = side * (pi / 3)
+            for step in range(ring):
+                l.append(ringSize * (ring * cos(corner) + step * cos(corner + 2 * pi / 3)))
+                m.append(ringSize * (ring * sin(corner) + step * sin(corner + 2 * pi / 3)))
+    return l, m
+
+
+def tabGridOffsets(nrColumns, nrRows, spacing, numpy=None):
+    '''
+    Returns the l and m offsets (direction cosines) of nrColumns x nrRows TABs spacing apart, centred on 0, row by row
+    '''
+    if numpy is not None:
+        m, l = numpy.mgrid[0:nrRows, 0:nrColumns]
+        return ((l.ravel() - (nrColumns - 1) / 2) * spacing), ((m.ravel() - (nrRows - 1) / 2) * spacing)
+    l = [(column - (nrColumns - 1) / 2) * spacing for row in range(nrRows) for column in range(nrColumns)]
+    m = [(row - (nrRows - 1) / 2) * spacing for row in range(nrRows) for column in range(nrColumns)]
+    return l, m
+
+
+def offsetsToAngles(centre, l, m, numpy=None):
+    '''
+    Returns the lists of angle1 and angle2 (right ascension and declination, in radians) of the directions at the
+    offsets l and m (direction cosines in the SIN projection) from centre, an (angle1, angle2) tuple
+    '''
+    ra, dec = centre
+    if numpy is not None:
+        l = numpy.asarray(l, dtype=float)
+        m = numpy.asarray(m, dtype=float)
+        if len(l) and (l * l + m * m).max() >= 1:
+            raise GenException("TABs more than 90 degrees from their centre")
+        n = numpy.sqrt(1 - l * l - m * m)
+        angle1 = (ra + numpy.arctan2(l, n * cos(dec) - m * sin(dec))) % (2 * pi)
+        angle2 = numpy.arcsin(m * cos(dec) + n * sin(dec))
+        return angle1.tolist(), angle2.tolist()
+    angle1 = []
+    angle2 = []
+    for dl, dm in zip(l, m):
+        if dl * dl + dm * dm >= 1:
+            raise GenException("TABs more than 90 degrees from their centre")
+        dn = sqrt(1 - dl * dl - dm * dm)
+        angle1.append((ra + atan2(dl, dn * cos(dec) - dm * sin(dec))) % (2 * pi))
+        angle2.append(asin(dm * cos(dec) + dn * sin(dec)))
+    return angle1, angle2
+
+
+def expandTiedArrayBeams(TAB, ra, dec):
+    '''
+    Returns TAB with its rings and grid entries replaced by the coherent TABs they describe. A ring or grid without a
+    centre is centred on the beam at ra, dec (in degrees). NumPy computes the coordinates of all TABs at once if it is
+    installed; it is imported here, so that it is only loaded for BLOCKs that use rings or grids.
+    '''
+    if not any(tab[0] in ('rings', 'grid') for tab in TAB):
+        return TAB
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    expanded = []
+    for tab in TAB:
+        if tab[0] == 'rings':
+            l, m = tabRingOffsets(tab[1], tab[2], numpy)
+        elif tab[0] == 'grid':
+            l, m = tabGridOffsets(tab[1], tab[2], tab[3], numpy)
+        else:
+            expanded.append(tab)
+            continue
+        centre = tab[-1] or (deg2rad(ra), deg2rad(dec))
+        angle1, angle2 = offsetsToAngles(centre, l, m, numpy)
+        expanded += [['c', a1, a2] for a1, a2 in zip(angle1, angle2)]
+    return expanded
+
+
 def hasCoherentTab(TAB):
     for i in range(0, len(TAB)):
         if TAB[i][0] == 'c':
@@ -294,6 +674,7 @@ def hasCoherentTab(TAB):
 
 
 ##FIXME we will need to fill in actual values. Might need to depend on variables
+@lru_cache(maxsize=64)  # called for every pipeline with the same few arguments
 def processingCluster(cluster, number_of_tasks, number_of_cores_per_task):
     CEP4 = r"""  <processingCluster>
                     <name>CEP4</name>
@@ -313,6 +694,7 @@ def processingCluster(cluster, number_of_tasks, number_of_cores_per_task):
     return result
 
 
+@lru_cache(maxsize=16)
 def dataProductCluster(cluster):
     template = r"""<storageCluster>
                       <name>%s</name>
@@ -332,7 +714,7 @@ def writeXMLObs(ofile, name, descr, topo, predecessor_topo, attrname, projname,
                 cordata, cohdata, incohdata, antenna, clock, instrfilt, interval, channels,
                 cohdedisp, flysEye, subsperfileCS, colapseCS, downstepsCS, whichCS, subsperfileIS, colapseIS,
                 downstepsIS, whichIS, stations, start, stop, duration, bitspersample, status):
-    print(r"""          <item index="0">
+    ofile.writeln(r"""          <item index="0">
                 <lofar:observation>
                   <name>%s</name>
                   <description>%s</description>
@@ -391,12 +773,12 @@ def writeXMLObs(ofile, name, descr, topo, predecessor_topo, attrname, projname,
         writeBoolean(cordata), writeBoolean(cohdata), writeBoolean(incohdata), antenna, clock, instrfilt, interval,
         channels,
         writeBoolean(cohdedisp), writeBoolean(flysEye), subsperfileCS, colapseCS, downstepsCS, whichCS,
-        subsperfileIS, colapseIS, downstepsIS, whichIS, stations, start, stop, duration, bitspersample), file=ofile)
+        subsperfileIS, colapseIS, downstepsIS, whichIS, stations, start, stop, duration, bitspersample))
 
 
 def writeXMLBeam(ofile, name, description, topo, beamtype, target, ra, dec, subbands, flyseye, tabrings, tabringsize,
                  tablist, dataproducts, status):
-    print(r"""<item index="0">
+    ofile.writeln(r"""<item index="0">
                       <lofar:measurement xsi:type="lofar:BFMeasurementType">
                         <name>%s</name>
                         <description>%s</description>
@@ -431,33 +813,47 @@ def writeXMLBeam(ofile, name, description, topo, beamtype, target, ra, dec, subb
                       </lofar:measurement>
                     </item>""" % (
     name, description, topo, status, beamtype, target, ra, dec, subbands, writeBoolean(flyseye),
-    tabrings, tabringsize, tablist, dataproducts), file=ofile)
+    tabrings, tabringsize, tablist, dataproducts))
 
 
 def writeXMLObsEnd(ofile):
-    print(r"""</children>
+    ofile.writeln(r"""</children>
                 </lofar:observation>
-                </item>""", file=ofile)
+                </item>""")
 
 
-def writeTABXML(TAB):
-    strVal = r""
-    for i in range(0, len(TAB)):
-        if TAB[i][0] == 'c':
-            strVal += r"""                <tiedArrayBeam>
+COHERENT_TAB = r"""                <tiedArrayBeam>
                   <coherent>true</coherent>
                   <angle1>%s</angle1>
                   <angle2>%s</angle2>
                 </tiedArrayBeam>
-                """ % (TAB[i][1], TAB[i][2])
-        else:
-            strVal += r"""                <tiedArrayBeam>
+                """
+INCOHERENT_TAB = r"""                <tiedArrayBeam>
                   <coherent>false</coherent>
                   <dispersionMeasure>%s</dispersionMeasure>
                 </tiedArrayBeam>
-                """ % (TAB[i][1])
-    strVal = strVal.rstrip()  # strip off the last newline
-    return strVal
+                """
+
+
+def writeTABXML(TAB):
+    return renderTABXML(tuple(tuple(tab) for tab in TAB))
+
+
+@lru_cache(maxsize=64)
+def renderTABXML(TAB):
+    '''
+    Returns the XML of the tied-array beams in TAB, a tuple of ('c', angle1, angle2) and ('i', dispersionMeasure)
+    tuples. The same TABs are written for every repeat (and for each beam with Global_TAB), so the result is cached.
+    '''
+    coherentStart, coherentMiddle, coherentEnd = COHERENT_TAB.split('%s')
+    incoherentStart, incoherentEnd = INCOHERENT_TAB.split('%s')
+    parts = []
+    for tab in TAB:  # a single join of the pieces, instead of formatting each TAB and adding it to a string
+        if tab[0] == 'c':
+            parts += (coherentStart, str(tab[1]), coherentMiddle, str(tab[2]), coherentEnd)
+        else:
+            parts += (incoherentStart, str(tab[1]), incoherentEnd)
+    return ''.join(parts).rstrip()  # strip off the last newline
 
 
 def writeMiscParameters(ofile, miscParameters):
@@ -468,11 +864,11 @@ def writeMiscParameters(ofile, miscParameters):
     """
     if miscParameters is not None and len(miscParameters) > 0:
         j = json.dumps(miscParameters)
-        print(r"""<misc>%s</misc>""" % j, file=ofile)
+        ofile.writeln(r"""<misc>%s</misc>""" % j)
 
 
 def writeBBSParameters(ofile, bbsParameters):
-    print(r"""            <bbsParameters>
+    ofile.writeln(r"""            <bbsParameters>
               <baselines>%s</baselines>
               <correlations>%s</correlations>
               <beamModelEnable>%s</beamModelEnable>
@@ -481,13 +877,14 @@ def writeBBSParameters(ofile, bbsParameters):
               <strategyBaselines>%s</strategyBaselines>
               <strategyTimeRange>%s</strategyTimeRange>
             </bbsParameters>""" % (
-    bbsParameters[0], bbsParameters[1], writeBoolean(bbsParameters[2]), bbsParameters[3], bbsParameters[4],
-    bbsParameters[5], bbsParameters[6]), file=ofile)
+    bbsParameters.baselines, bbsParameters.correlations, writeBoolean(bbsParameters.beamModelEnable),
+    bbsParameters.solveParms, bbsParameters.solveUVRange, bbsParameters.strategyBaselines,
+    bbsParameters.strategyTimeRange))
     ##TODO % {"baselines":, "correlations":, writeBoolean("beamenable":), "solveparms":, "solveuvrange":, "strategybaselines":, "strategytimerange":}
 
 
 def writeDemixParameters(ofile, demixParameters):
-    print(r"""                  <demixingParameters>
+    ofile.writeln(r"""                  <demixingParameters>
                     <averagingFreqStep>%s</averagingFreqStep>
                     <averagingTimeStep>%s</averagingTimeStep>
                     <demixFreqStep>%s</demixFreqStep>
@@ -496,9 +893,9 @@ def writeDemixParameters(ofile, demixParameters):
                     <demixIfNeeded>%s</demixIfNeeded>
                     <ignoreTarget>%s</ignoreTarget>
                   </demixingParameters>""" % (
-    demixParameters[0], demixParameters[1], demixParameters[2], demixParameters[3], demixParameters[4],
-    demixParameters[5],
-    writeBoolean(demixParameters[6])), file=ofile)  ##TODO writeBoolean() Might be reduntant? Should do the conversion earlier
+    demixParameters.averagingFreqStep, demixParameters.averagingTimeStep, demixParameters.demixFreqStep,
+    demixParameters.demixTimeStep, demixParameters.demixAlways, demixParameters.demixIfNeeded,
+    writeBoolean(demixParameters.ignoreTarget)))  ##TODO writeBoolean() Might be reduntant? Should do the conversion earlier
     ##TODO % {"averagingFreqStep":, "averagingTimeStep":, "demixFreqStep":, "demixTimeStep":, writeBoolean("demixAlways":), writeBoolean("demixIfNeeded":), writeBoolean("ignoreTarget":)}
 
 
@@ -508,7 +905,7 @@ def writeXMLTargetPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate,
                            storageCluster, status, nr_tasks, nr_cores_per_task, miscParameters):
     stor_cluster = dataProductCluster(storageCluster)
     proc_cluster = processingCluster(storageCluster, nr_tasks, nr_cores_per_task)
-    print(r"""<item index="0">
+    ofile.writeln(r"""<item index="0">
                   <lofar:pipeline xsi:type="lofar:CalibrationPipelineType">
                     <topology>%s</topology>
                     <predecessor_topology>%s</predecessor_topology>
@@ -516,13 +913,13 @@ def writeXMLTargetPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate,
                     <description>%s (%s)</description>
                     <currentStatus>
                       <mom2:%sStatus/>
-                    </currentStatus>""" % (topo, pred_topo, name, name, descr, status), file=ofile)
+                    </currentStatus>""" % (topo, pred_topo, name, name, descr, status))
     if proc_cluster:
-        print(proc_cluster, file=ofile)
-    print(r"""                    <pipelineAttributes>
+        ofile.writeln(proc_cluster)
+    ofile.writeln(r"""                    <pipelineAttributes>
                       <defaultTemplate>%s</defaultTemplate>
                       <flaggingStrategy>%s</flaggingStrategy>
-                      <duration>%s</duration>""" % (defaulttemplate, flagging, duration), file=ofile)
+                      <duration>%s</duration>""" % (defaulttemplate, flagging, duration))
     writeDemixParameters(ofile, demixParameters)
     ##TODO if bbsParameters: ??
     writeBBSParameters(ofile, bbsParameters)
@@ -538,7 +935,7 @@ def writeXMLTargetPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate,
                         </item>""" % (instroutname, instrouttopo, stor_cluster)
     else:
         instr_out = ""
-    print(r"""</pipelineAttributes>
+    ofile.writeln(r"""</pipelineAttributes>
                     <usedDataProducts>
                       <item>
                         <lofar:uvDataProduct topology="%s">
@@ -564,7 +961,7 @@ def writeXMLTargetPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate,
                     </resultDataProducts>
                     </lofar:pipeline>
                   </item>""" % (uvintopo, uvinname, instrintopo, instrinname,
-                  uvoutname, uvouttopo, stor_cluster, instr_out), file=ofile)
+                  uvoutname, uvouttopo, stor_cluster, instr_out))
 
 
 def writeXMLCalPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, flagging, duration, skymodel, demixParameters,
@@ -572,7 +969,7 @@ def writeXMLCalPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, flaggi
                     nr_cores_per_task, miscParameters):
     stor_cluster = dataProductCluster(storageCluster)
     proc_cluster = processingCluster(storageCluster, nr_tasks, nr_cores_per_task)
-    print(r"""        <item index="0">
+    ofile.writeln(r"""        <item index="0">
               <lofar:pipeline xsi:type="lofar:CalibrationPipelineType">
                 <topology>%s</topology>
                 <predecessor_topology>%s</predecessor_topology>
@@ -580,19 +977,19 @@ def writeXMLCalPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, flaggi
                 <description>%s (%s)</description>
                 <currentStatus>
                   <mom2:%sStatus/>
-                </currentStatus>""" % (topo, pred_topo, name, name, descr, status), file=ofile)
+                </currentStatus>""" % (topo, pred_topo, name, name, descr, status))
     if proc_cluster:
-        print(proc_cluster, file=ofile)
-    print(r"""                <pipelineAttributes>
+        ofile.writeln(proc_cluster)
+    ofile.writeln(r"""                <pipelineAttributes>
                   <defaultTemplate>%s</defaultTemplate>
                   <flaggingStrategy>%s</flaggingStrategy>
                   <duration>%s</duration>
-                  <skyModelDatabase>%s</skyModelDatabase>""" % (defaulttemplate, flagging, duration, skymodel), file=ofile)
+                  <skyModelDatabase>%s</skyModelDatabase>""" % (defaulttemplate, flagging, duration, skymodel))
     writeDemixParameters(ofile, demixParameters)
     ##TODO if bbsParameters: ??
     writeBBSParameters(ofile, bbsParameters)
     writeMiscParameters(ofile, miscParameters)
-    print(r"""</pipelineAttributes>
+    ofile.writeln(r"""</pipelineAttributes>
                 <usedDataProducts>
                   <item>
                     <lofar:uvDataProduct topology="%s">
@@ -618,7 +1015,7 @@ def writeXMLCalPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, flaggi
                   </item>
                 </resultDataProducts>
               </lofar:pipeline>
-            </item>""" % (uvintopo, instroutname, instrouttopo, stor_cluster, uvouttopo, uvouttopo, stor_cluster), file=ofile)
+            </item>""" % (uvintopo, instroutname, instrouttopo, stor_cluster, uvouttopo, uvouttopo, stor_cluster))
 
 
 def writeXMLAvgPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate, flagging, duration,
@@ -626,7 +1023,7 @@ def writeXMLAvgPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate, fl
                         miscParameters):
     stor_cluster = dataProductCluster(storageCluster)
     proc_cluster = processingCluster(storageCluster, nr_tasks, nr_cores_per_task)
-    print(r"""        <item index="0">
+    ofile.writeln(r"""        <item index="0">
               <lofar:pipeline xsi:type="lofar:AveragingPipelineType">
                 <topology>%s</topology>
                 <predecessor_topology>%s</predecessor_topology>
@@ -634,16 +1031,16 @@ def writeXMLAvgPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate, fl
                 <description>%s (%s)</description>
                 <currentStatus>
                   <mom2:%sStatus/>
-                </currentStatus>""" % (topo, pred_topo, name, name, descr, status), file=ofile)
+                </currentStatus>""" % (topo, pred_topo, name, name, descr, status))
     if proc_cluster:
-        print(proc_cluster, file=ofile)
-    print(r"""                <pipelineAttributes>
+        ofile.writeln(proc_cluster)
+    ofile.writeln(r"""                <pipelineAttributes>
                   <defaultTemplate>%s</defaultTemplate>
                   <flaggingStrategy>%s</flaggingStrategy>
-                  <duration>%s</duration>""" % (defaulttemplate, flagging, duration), file=ofile)
+                  <duration>%s</duration>""" % (defaulttemplate, flagging, duration))
     writeDemixParameters(ofile, demixParameters)
     writeMiscParameters(ofile, miscParameters)
-    print(r"""</pipelineAttributes>
+    ofile.writeln(r"""</pipelineAttributes>
                 <usedDataProducts>
                   <item>
                     <lofar:uvDataProduct topology="%s">
@@ -661,7 +1058,7 @@ def writeXMLAvgPipeline(ofile, topo, pred_topo, name, descr, defaulttemplate, fl
                   </item>
                 </resultDataProducts>
               </lofar:pipeline>
-            </item>""" % (uvintopo, uvouttopo, uvouttopo, stor_cluster), file=ofile)
+            </item>""" % (uvintopo, uvouttopo, uvouttopo, stor_cluster))
 
 
 def writeXMLPulsarPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, duration, bfintopo, pouttopo,
@@ -672,7 +1069,7 @@ def writeXMLPulsarPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, dur
                        miscParameters):
     stor_cluster = dataProductCluster(storageCluster)
     proc_cluster = processingCluster(storageCluster, nr_tasks, nr_cores_per_task)
-    print(r"""        <item index="0">
+    ofile.writeln(r"""        <item index="0">
               <lofar:pipeline xsi:type="lofar:PulsarPipelineType">
                 <topology>%s</topology>
                 <predecessor_topology>%s</predecessor_topology>
@@ -680,10 +1077,10 @@ def writeXMLPulsarPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, dur
                 <description>%s (%s)</description>
                 <currentStatus>
                   <mom2:%sStatus/>
-                </currentStatus>""" % (topo, pred_topo, name, name, descr, status), file=ofile)
+                </currentStatus>""" % (topo, pred_topo, name, name, descr, status))
     if proc_cluster:
-        print(proc_cluster, file=ofile)
-    print(r"""                <pipelineAttributes>
+        ofile.writeln(proc_cluster)
+    ofile.writeln(r"""                <pipelineAttributes>
                   <defaultTemplate>%s</defaultTemplate>
                   <duration>%s</duration>
                   <_2bf2fitsExtraOpts>%s</_2bf2fitsExtraOpts>
@@ -713,9 +1110,9 @@ def writeXMLPulsarPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, dur
                                               writeBoolean(norfi), prepdataExtraOpts, prepfoldExtraOpts,
                                               prepsubbandExtraOpts, pulsar, writeBoolean(rawTo8bit), rfifindExtraOpts,
                                               writeBoolean(rrats), writeBoolean(singlePulse), writeBoolean(skipDspsr),
-                                              writeBoolean(skipDynamicSpectrum), writeBoolean(skipPrepfold), tsubint), file=ofile)
+                                              writeBoolean(skipDynamicSpectrum), writeBoolean(skipPrepfold), tsubint))
     writeMiscParameters(ofile, miscParameters)
-    print(r"""
+    ofile.writeln(r"""
                 </pipelineAttributes>
                 <usedDataProducts>
                   <item>
@@ -734,7 +1131,7 @@ def writeXMLPulsarPipe(ofile, topo, pred_topo, name, descr, defaulttemplate, dur
                   </item>
                 </resultDataProducts>
               </lofar:pipeline>
-            </item>""" % (bfintopo, pouttopo, pouttopo, stor_cluster), file=ofile)
+            </item>""" % (bfintopo, pouttopo, pouttopo, stor_cluster))
 
 
 # nv 13okt2014: #6716 - Implement Long Baseline Pipeline
@@ -743,7 +1140,7 @@ def writeXMLLongBaselinePipe(ofile, topo, pred_topo, name, descr, defaulttemplat
                              status, nr_tasks, nr_cores_per_task):
     stor_cluster = dataProductCluster(storageCluster)
     proc_cluster = processingCluster(storageCluster, nr_tasks, nr_cores_per_task)
-    print(r"""        <item index="0">
+    ofile.writeln(r"""        <item index="0">
               <lofar:pipeline xsi:type="lofar:LongBaselinePipelineType">
                 <topology>%s</topology>
                 <predecessor_topology>%s</predecessor_topology>
@@ -751,10 +1148,10 @@ def writeXMLLongBaselinePipe(ofile, topo, pred_topo, name, descr, defaulttemplat
                 <description>%s (%s)</description>
                 <currentStatus>
                   <mom2:%sStatus/>
-                </currentStatus>""" % (topo, pred_topo, name, name, descr, status), file=ofile)
+                </currentStatus>""" % (topo, pred_topo, name, name, descr, status))
     if proc_cluster:
-        print(proc_cluster, file=ofile)
-    print(r"""                <pipelineAttributes>
+        ofile.writeln(proc_cluster)
+    ofile.writeln(r"""                <pipelineAttributes>
                   <defaultTemplate>%s</defaultTemplate>
                   <duration>%s</duration>
                   <subbandsPerSubbandGroup>%s</subbandsPerSubbandGroup>
@@ -778,13 +1175,24 @@ def writeXMLLongBaselinePipe(ofile, topo, pred_topo, name, descr, defaulttemplat
                 </resultDataProducts>
               </lofar:pipeline>
             </item>""" % (defaulttemplate, duration, subbands_per_subbandgroup, subbandgroups_per_ms,
-                          uvintopo, uvouttopo, uvouttopo, stor_cluster), file=ofile)
+                          uvintopo, uvouttopo, uvouttopo, stor_cluster))
 
 
 def writeDataProducts(dataTopo, correlatedData, coherentStokesData, incoherentStokesData, storageCluster):
+    return dataProductsTemplate(correlatedData, coherentStokesData, incoherentStokesData,
+                                storageCluster) % {'topology': dataTopo}
+
+
+@lru_cache(maxsize=64)
+def dataProductsTemplate(correlatedData, coherentStokesData, incoherentStokesData, storageCluster):
+    '''
+    Returns the XML of the data products of a beam as a format string with the topology of the beam as %(topology)s.
+    Only the topology differs between the beams of a BLOCK, so the rest is formatted once.
+    '''
+    cluster = dataProductCluster(storageCluster).replace('%', '%%')
     strVal = r""
     if correlatedData:
-        dataTopoStr = dataTopo + '.uv.dps'
+        dataTopoStr = '%(topology)s.uv.dps'
         strVal += r"""                <item>
                     <lofar:uvDataProduct>
                     <name>%s</name>
@@ -793,14 +1201,14 @@ def writeDataProducts(dataTopo, correlatedData, coherentStokesData, incoherentSt
                     %s
                     </lofar:uvDataProduct>
                   </item>
-                  """ % (dataTopoStr, dataTopoStr, dataProductCluster(storageCluster))
+                  """ % (dataTopoStr, dataTopoStr, cluster)
     if coherentStokesData | incoherentStokesData:
         if coherentStokesData & ~incoherentStokesData:
-            dataTopoStr = dataTopo + '.cs'
+            dataTopoStr = '%(topology)s.cs'
         elif incoherentStokesData & ~coherentStokesData:
-            dataTopoStr = dataTopo + '.is'
+            dataTopoStr = '%(topology)s.is'
         else:
-            dataTopoStr = dataTopo + '.csis'
+            dataTopoStr = '%(topology)s.csis'
         strVal += r"""                <item>
                     <lofar:bfDataProduct>
                     <name>%s</name>
@@ -809,25 +1217,25 @@ def writeDataProducts(dataTopo, correlatedData, coherentStokesData, incoherentSt
                     %s
                     </lofar:bfDataProduct>
                   </item>
-                  """ % (dataTopoStr, dataTopoStr, dataProductCluster(storageCluster))
+                  """ % (dataTopoStr, dataTopoStr, cluster)
     strVal = strVal.rstrip()  # strip off the last newline
     return strVal
 
 
 def writeImagingPipelineInputDataproducts(ofile, topologyList):
-    print(r"""                <usedDataProducts>""", file=ofile)
+    ofile.writeln(r"""                <usedDataProducts>""")
     for topology in topologyList:
-        print(r"""                <item>
+        ofile.writeln(r"""                <item>
               <lofar:uvDataProduct topology="%s">
                 <name>%s</name>
               </lofar:uvDataProduct>
-            </item>""" % (topology, topology), file=ofile)
-    print(r"""               </usedDataProducts>""", file=ofile)
+            </item>""" % (topology, topology))
+    ofile.writeln(r"""               </usedDataProducts>""")
 
 
 def writeSkyImageOutputDataproduct(ofile, topology, storageCluster):
     stor_cluster = dataProductCluster(storageCluster)
-    print(r"""                <resultDataProducts>
+    ofile.writeln(r"""                <resultDataProducts>
                   <item>
                     <lofar:skyImageDataProduct>
                       <name>%s</name>
@@ -838,22 +1246,22 @@ def writeSkyImageOutputDataproduct(ofile, topology, storageCluster):
                   </item>
                 </resultDataProducts>
               </lofar:pipeline>
-            </item>""" % (topology, topology, stor_cluster), file=ofile)
+            </item>""" % (topology, topology, stor_cluster))
 
 
 def writeFolderStart(ofile, folderNr, packageName, packageDescription, processing):
-    print(r"""   <item index="0">
+    ofile.writeln(r"""   <item index="0">
         <lofar:folder topology_parent="true">
           <topology>%s</topology>
           <name>%s</name>
           <description>%s (%s)</description>
-          <children>""" % (folderNr, packageName, packageDescription, processing), file=ofile)
+          <children>""" % (folderNr, packageName, packageDescription, processing))
 
 
 def writeFolderEnd(ofile):
-    print(r"""</children>
+    ofile.writeln(r"""</children>
   </lofar:folder>
-  </item>""", file=ofile)
+  </item>""")
 
 
 def writeBoolean(booleanValue):
@@ -879,39 +1287,39 @@ def toBool(strVal):
 
 
 def writeProjectStart(ofile, version, projectName):
-    print(r"""<?xml version="1.0" encoding="UTF-8"?>
+    ofile.writeln(r"""<?xml version="1.0" encoding="UTF-8"?>
   <lofar:project xmlns:lofar="http://www.astron.nl/MoM2-Lofar" xmlns:mom2="http://www.astron.nl/MoM2" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://www.astron.nl/MoM2-Lofar http://lofar.astron.nl:8080/mom3/schemas/LofarMoM2.xsd http://www.astron.nl/MoM2 http://lofar.astron.nl:8080/mom3/schemas/MoM2.xsd ">
   <version>%s</version>
   <template version="%s" author="Alwin de Jong,Adriaan Renting" changedBy="Adriaan Renting">
   <description>XML Template generator version %s</description>
   </template>
   <name>%s</name>
-  <children>""" % (version, version, version, projectName), file=ofile)
+  <children>""" % (version, version, version, projectName))
 
 
 def writeProjectEnd(ofile):
-    print(r"""          </children>
-  </lofar:project>""", file=ofile)
+    ofile.writeln(r"""          </children>
+  </lofar:project>""")
 
 
 def writeMainFolderStart(ofile, mainFolderName, mainFolderDescription):
-    print(r"""   <item index="0">
+    ofile.writeln(r"""   <item index="0">
     <lofar:folder topology_parent="false">
     <name>%s</name>
     <description>%s</description>
-    <children>""" % (mainFolderName, mainFolderDescription), file=ofile)
+    <children>""" % (mainFolderName, mainFolderDescription))
 
 
 def writeMainFolderEnd(ofile):
-    print(r"""</children>
+    ofile.writeln(r"""</children>
   </lofar:folder>
-  </item>""", file=ofile)
+  </item>""")
 
 
 def writeImagingPipelineXML(ofile, input_list, bbsParameters, storageCluster, status, nr_tasks, nr_cores_per_task,
                             miscParameters):
     proc_cluster = processingCluster(storageCluster, nr_tasks, nr_cores_per_task)
-    print(r"""<item index="0">
+    ofile.writeln(r"""<item index="0">
         <lofar:pipeline xsi:type="lofar:%(imaging_pipe_type)s">
           <topology>%(imaging_pipe_topology)s</topology>
           <predecessor_topology>%(imaging_pipe_predecessors_string)s</predecessor_topology>
@@ -919,10 +1327,10 @@ def writeImagingPipelineXML(ofile, input_list, bbsParameters, storageCluster, st
           <description>%(imaging_pipe_name)s (Imaging pipeline beam %(beamNr)s)</description>
           <currentStatus>
             <mom2:%(initial_status)sStatus/>
-          </currentStatus>""" % (input_list), file=ofile)
+          </currentStatus>""" % (input_list))
     if proc_cluster:
-        print(proc_cluster, file=ofile)
-    print(r"""                <imagingPipelineAttributes>
+        ofile.writeln(proc_cluster)
+    ofile.writeln(r"""                <imagingPipelineAttributes>
             <defaultTemplate>%(imaging_pipe_default_template)s</defaultTemplate>
             <duration>%(imaging_pipe_duration)s</duration>
             <nrOfOutputSkyImage>%(nrImages)s</nrOfOutputSkyImage>
@@ -938,55 +1346,139 @@ def writeImagingPipelineXML(ofile, input_list, bbsParameters, storageCluster, st
               <uvMin>%(uvMin)s</uvMin>
               <uvMax>%(uvMax)s</uvMax>
               <stokes>%(stokesToImage)s</stokes>
-            </imagingParameters>""" % (input_list), file=ofile)
+            </imagingParameters>""" % (input_list))
     if bbsParameters:
         writeBBSParameters(ofile, bbsParameters)
         writeMiscParameters(ofile, miscParameters)
-    print(r"""
-          </imagingPipelineAttributes>""", file=ofile)
+    ofile.writeln(r"""
+          </imagingPipelineAttributes>""")
+
+
+def writeXMLImagingPipe(ofile, topo, pred_topo, name, input_list, uvintopos, skyouttopo, bbsParameters,
+                        storageCluster, status, nr_tasks, nr_cores_per_task, miscParameters):
+    writeImagingPipelineXML(ofile, input_list, bbsParameters, storageCluster, status, nr_tasks, nr_cores_per_task,
+                            miscParameters)
+    writeImagingPipelineInputDataproducts(ofile, uvintopos)
+    writeSkyImageOutputDataproduct(ofile, skyouttopo, storageCluster)
 
 
 def parseOptions(argv):
-    inputfile = ''
-    outputfile = ''
-    status = "opened"
+    options = Options()
+    options.cachedir = os.environ.get('XMLGEN_CACHE_DIR')  # the cache is off unless this is set or --cache is given
 
     try:
-        opts, args = getopt.getopt(argv, "hi:o:a", ["ifile=", "ofile="])
+        opts, args = getopt.getopt(argv, "hi:o:aj:g:", ["ifile=", "ofile=", "jobs=", "graph=", "cache", "no-cache",
+                                                        "batch=", "manifest=", "serve", "port=", "socket=",
+                                                        "compact", "pretty"])
     except getopt.GetoptError:
-        print('xmlgen.py -i <inputfile> [-o <outputfile>] [-a]')
+        print('xmlgen.py -i <inputfile> [-o <outputfile>] [-a] [-j <jobs>] [-g <graphfile>] [--cache|--no-cache]')
+        print('xmlgen.py --batch <dir|glob> [-o <outputdir>] [-a] [-j <jobs>] [--manifest <file>] [--cache|--no-cache]')
+        print('xmlgen.py --serve [--port <port>|--socket <path>] [-j <jobs>] [--cache|--no-cache]')
         sys.exit(2)
 
     if len(opts) == 0:
-        print('usage: xmlgen.py -i <inputfile> [-o <outputfile>] [-a]')
+        print('usage: xmlgen.py -i <inputfile> [-o <outputfile>] [-a] [-j <jobs>] [-g <graphfile>] [--cache|--no-cache]')
+        print('       xmlgen.py --batch <dir|glob> [-o <outputdir>] [-a] [-j <jobs>] [--manifest <file>] '
+              '[--cache|--no-cache]')
+        print('       xmlgen.py --serve [--port <port>|--socket <path>] [-j <jobs>] [--cache|--no-cache]')
         sys.exit(2)
 
     for opt, arg in opts:
         if opt == '-h':
-            print('usage: xmlgen.py -i <inputfile> [-o <outputfile.xml>] [-a]')
+            print('usage: xmlgen.py -i <inputfile> [-o <outputfile.xml>] [-a] [-j <jobs>] [-g <graphfile>] '
+                  '[--cache|--no-cache] [--compact|--pretty]')
+            print('       xmlgen.py --batch <dir|glob> [-o <outputdir>] [-a] [-j <jobs>] [--manifest <file>] '
+                  '[--cache|--no-cache] [--compact|--pretty]')
+            print('       xmlgen.py --serve [--port <port>|--socket <path>] [-j <jobs>] [--cache|--no-cache] '
+                  '[--compact|--pretty]')
+            print('  -j, --jobs   number of processes used to render the BLOCKs in parallel (default 1), or to')
+            print('               convert the files or requests in parallel in batch and server mode (default:')
+            print('               number of CPU cores). Rendering in parallel only helps for inputs with many')
+            print('               BLOCKs; inputs with fewer than %i BLOCKs are rendered serially, and no more'
+                  % PARALLEL_MIN_BLOCKS)
+            print('               processes than CPU cores are used')
+            print('  -g, --graph  also export the observations, pipelines and their dependencies to a JSON file')
+            print('  --cache      reuse the XML of BLOCKs that did not change since the last run, from')
+            print('               $XMLGEN_CACHE_DIR or ~/.cache/xmlgen (on by default if XMLGEN_CACHE_DIR is set)')
+            print('  --no-cache   render all BLOCKs')
+            print('  --batch      convert all .txt files in a directory, or all files matching a glob pattern, in')
+            print('               one run. The XML files are written next to the inputs, or to the directory -o')
+            print('  --manifest   JSON file with the status, time and output size of each file in batch mode')
+            print('               (default: manifest.json in <outputdir>, or in the directory of the input files)')
+            print('  --serve      run a local conversion server: POST an input text to / to get the XML (add')
+            print('               ?status=approved for -a), GET /metrics for the request latencies')
+            print('  --port       port of the server on localhost (default %i)' % DEFAULT_SERVER_PORT)
+            print('  --socket     serve on this UNIX socket instead of a port')
+            print('  --compact    write the XML without indentation and line breaks between tags (smaller files)')
+            print('  --pretty     write the XML re-indented consistently, by two spaces per level')
+            print('  Input and output files ending in .gz, .xz or .bz2 are decompressed and compressed on the fly.')
             sys.exit()
         elif opt in ("-i", "--ifile"):
-            inputfile = arg
+            options.inputfile = arg
         elif opt in ("-o", "--ofile"):
-            outputfile = arg
+            options.outputfile = arg
         elif opt in ("-a"):
-            status = "approved"
-
-    if (outputfile == inputfile):
-        raise GenException("Output file'" + outputfile + "' has the same name as inputfile")
-    if len(outputfile):
-        print("Writing output xml file: " + outputfile)
+            options.status = "approved"
+        elif opt in ("-j", "--jobs"):
+            try:
+                options.jobs = int(arg)
+            except ValueError:
+                raise GenException("Number of jobs '" + arg + "' is not an integer")
+            if options.jobs < 1:
+                raise GenException("Number of jobs must be at least 1")
+        elif opt in ("-g", "--graph"):
+            options.graphfile = arg
+        elif opt == "--cache":
+            options.cachedir = defaultCacheDir()
+        elif opt == "--no-cache":
+            options.cachedir = None
+        elif opt == "--batch":
+            options.batch = arg
+        elif opt == "--manifest":
+            options.manifest = arg
+        elif opt == "--serve":
+            options.serve = True
+        elif opt == "--port":
+            try:
+                options.port = int(arg)
+            except ValueError:
+                raise GenException("Port '" + arg + "' is not an integer")
+        elif opt == "--socket":
+            options.socket = arg
+        elif opt in ("--compact", "--pretty"):
+            options.layout = opt[2:]
+
+    if options.serve:
+        if options.inputfile or options.outputfile or options.graphfile or options.batch:
+            raise GenException("--serve cannot be combined with -i, -o, -g or --batch")
+        if options.port is not None and options.socket:
+            raise GenException("--port and --socket cannot be combined")
+        if options.port is None:
+            options.port = DEFAULT_SERVER_PORT
+        return options
+    if options.batch:
+        if options.inputfile or options.graphfile:
+            raise GenException("--batch cannot be combined with -i or -g")
+        return options
+    if options.jobs is None:
+        options.jobs = 1
+    if (options.outputfile == options.inputfile):
+        raise GenException("Output file'" + options.outputfile + "' has the same name as inputfile")
+    if len(options.outputfile):
+        print("Writing output xml file: " + options.outputfile)
     else:
-        outputfile = splitext(inputfile)[0] + '.xml'
-        print("Output file not specified, writing output xml file:'" + outputfile + "'")
-    return (inputfile, outputfile, status)
+        options.outputfile = defaultOutputName(options.inputfile)
+        print("Output file not specified, writing output xml file:'" + options.outputfile + "'")
+    return options
 
 
-def processInput(inputfile):
-    ifile = open(inputfile, 'r')
-    lines = ifile.readlines()
-    header = []
-    blocks = []
+def iterBlocks(lines):
+    """
+    Split the lines of an input text into the header and the BLOCKs. This is
+    a generator: it yields the header first and then one BLOCK at a time, so
+    that only the BLOCK being processed has to be kept in memory. Empty lines
+    and comments are skipped.
+    """
     block = []
     block_count = 0
     for l in lines:
@@ -995,10 +1487,10 @@ def processInput(inputfile):
             if not line[0] == "#":  # skipping comments
                 if "BLOCK" in line:
                     if block_count == 0:
-                        header = block
+                        yield block
                     else:
                         if len(block) > 1:  # We have at least BLOCK
-                            blocks.append(block)
+                            yield block
                         else:
                             printWarning("BLOCK %i was found to be empty" % block_count)
                     block = []
@@ -1006,12 +1498,76 @@ def processInput(inputfile):
                 stripped_line = line.split('#')[0]
                 if stripped_line:  # Not sure if this can happen?
                     block.append(stripped_line)
+    if block_count == 0:
+        yield []  # There is no header without a BLOCK
     if len(block) > 1:  # We have at least BLOCK
-        blocks.append(block)
+        yield block
     else:
         printWarning("BLOCK %i was found to be empty" % block_count)
-    ifile.close()
-    return (header, blocks)
+
+
+def splitBlocks(lines):
+    """
+    Split the lines of an input text into the header and a list of BLOCKs
+    """
+    blocks = iterBlocks(lines)
+    header = next(blocks)
+    return (header, list(blocks))
+
+
+def openFile(path, mode='r'):
+    """
+    Open the text file path for reading ('r') or writing ('w'). A file whose
+    name ends in .gz, .xz or .bz2 is decompressed while it is read and
+    compressed while it is written, so that the uncompressed data never
+    has to go to disk. The compression modules are only imported when used.
+    """
+    extension = splitext(path)[1].lower()
+    if extension in COMPRESSION_MODULES:
+        return importlib.import_module(COMPRESSION_MODULES[extension]).open(path, mode + 't')
+    return open(path, mode)
+
+
+@contextmanager
+def writeOnSuccess(path):
+    '''
+    Yields the name of a temporary file next to path that is renamed to path when the block succeeds and removed
+    when it raises, so that a failed conversion does not leave a partial file behind. The temporary name keeps the
+    compression extension of path (see openFile) and is unique per thread, as --serve and textgen convert in threads.
+    Paths that are not regular files, like /dev/stdout, are written directly.
+    '''
+    if os.path.exists(path) and not os.path.isfile(path):
+        yield path
+        return
+    base, extension = splitext(path)
+    tmpPath = "%s.%i.%i.tmp%s" % (base, os.getpid(), threading.get_ident(), extension)
+    try:
+        yield tmpPath
+        os.replace(tmpPath, path)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+def defaultOutputName(inputfile, outputdir=None):
+    """
+    Returns the name of the XML file for inputfile when none is given: the
+    name of the input file, without a compression extension, with its
+    extension replaced by .xml. It is put in outputdir if given.
+    """
+    name = inputfile
+    if splitext(name)[1].lower() in COMPRESSION_MODULES:
+        name = splitext(name)[0]
+    name = splitext(name)[0] + '.xml'
+    if outputdir:
+        name = os.path.join(outputdir, os.path.basename(name))
+    return name
+
+
+def processInput(inputfile):
+    with openFile(inputfile, 'r') as ifile:
+        return splitBlocks(ifile)
 
 
 def wrongCombiError():
@@ -1032,7 +1588,7 @@ def readProcessing(value):
             raise GenException(
                 "the specified processing '" + processing + "' is not recognized. It should be one of %s" % ", ".join(
                     PROCESSING))
-        print("processing = %s" % processing)
+        printLine("processing = %s" % processing)
     else:
         processing = ''
     return processing
@@ -1057,7 +1613,7 @@ def readKeyValuePair(line):
 def readBoolKey(keyname, value):
     if value:
         key = toBool(value)
-        print("%s = %s" % (keyname, value))
+        printLine("%s = %s" % (keyname, value))
     else:
         raise GenException("the %s has not been specified" % keyname)
     return key
@@ -1066,7 +1622,7 @@ def readBoolKey(keyname, value):
 def readStringKey(keyname, value):
     if value:
         key = value
-        print("%s = %s" % (keyname, value))
+        printLine("%s = %s" % (keyname, value))
     else:
         raise GenException("the %s has not been specified" % keyname)
     return key
@@ -1075,7 +1631,7 @@ def readStringKey(keyname, value):
 def readIntKey(keyname, value):
     if value:
         key = int(value)  # TODO try: ?
-        print("%s = %s" % (keyname, key))
+        printLine("%s = %s" % (keyname, key))
     else:
         raise GenException("the %s has not been specified" % keyname)
     return key
@@ -1084,7 +1640,7 @@ def readIntKey(keyname, value):
 def readFloatKey(keyname, value):
     if value:
         key = float(value)  # TODO try: ?
-        print("%s = %s" % (keyname, key))
+        printLine("%s = %s" % (keyname, key))
     else:
         raise GenException("the %s has not been specified" % keyname)
     return key
@@ -1108,7 +1664,7 @@ def readListKey(keyname, value):
         if key not in keylist:
             raise GenException(
                 "the %s parameter '%s' not correct. Should be one of %s" % (keyname, value, ", ".join(keylist)))
-        print("%s = %s" % (keyname, key))
+        printLine("%s = %s" % (keyname, key))
     else:  # TODO added this as it seemed to make sense?
         raise GenException("the %s has not been specified" % keyname)
     return key
@@ -1125,36 +1681,33 @@ def readIntListKey(keyname, value):
         if key not in keylist:
             raise GenException(
                 "the %s parameter '%s' not correct. Should be one of %s" % (keyname, value, str(keylist)))
-        print("%s = %s" % (keyname, key))
+        printLine("%s = %s" % (keyname, key))
     else:  # TODO added this as it seemed to make sense?
         raise GenException("the %s has not been specified" % keyname)
     return key
 
 
+HEADER_KEYS = ("projectName", "mainFolderName", "mainFolderDescription")
+
+
 def processHeader(header):
+    values = {}
     for line in header:
         key, value = readKeyValuePair(line)
         if key == "projectName":
-            projectName = readStringKey("projectName", value)
-        elif key == "mainFolderName":
-            mainFolderName = readOptionalStringKey("mainFolderName", value)
-        elif key == "mainFolderDescription":
-            mainFolderDescription = readOptionalStringKey("mainFolderDescription", value)
-    try:
-        # check if everything was defined
-        projectName
-        mainFolderName
-        mainFolderDescription
-    except NameError as ex:
-        raise GenException("Could not find all expected keys in header: %s" % ex.message)
-
-    return projectName, mainFolderName, mainFolderDescription
+            values[key] = readStringKey(key, value)
+        elif key in HEADER_KEYS:
+            values[key] = readOptionalStringKey(key, value)
+    missing = [key for key in HEADER_KEYS if key not in values]
+    if missing:
+        raise GenException("Could not find all expected keys in header: %s" % ", ".join(missing))
+    return values["projectName"], values["mainFolderName"], values["mainFolderDescription"]
 
 
 def readOptionalStringKey(keyname, value):
     if value:
         key = value
-        print("%s = %s" % (keyname, value))
+        printLine("%s = %s" % (keyname, value))
     else:
         printWarning("The %s has not been specified" % keyname)
         key = ""  # TODO put in some dummy description?
@@ -1166,10 +1719,10 @@ def readPackageTag(value):
         packageTag = value
         if len(packageTag) > 8:
             raise GenException("the package tag:'" + packageTag + "' is too long. Max 8 characters.")
-        print("package tag = %s" % packageTag)
+        printLine("package tag = %s" % packageTag)
     else:
         packageTag = ''
-        print("no package tag will be used.")
+        printLine("no package tag will be used.")
     return packageTag
 
 
@@ -1177,7 +1730,7 @@ def readStartTimeUTC(value):
     if value:
         startTimeUTC = value
         startTime = datetime.strptime(startTimeUTC, '%Y-%m-%d %H:%M:%S')
-        print("start time (UTC) = %s" % startTime.strftime('%b %d %Y %H:%M:%S'))
+        printLine("start time (UTC) = %s" % startTime.strftime('%b %d %Y %H:%M:%S'))
         set_starttime = True
 
         return startTime, set_starttime
@@ -1186,7 +1739,7 @@ def readStartTimeUTC(value):
 def readTimeStep(number, value):
     if value:
         timeStep = int(value)
-        print("time step%i = %s seconds" % (number, timeStep))
+        printLine("time step%i = %s seconds" % (number, timeStep))
     else:
         timeStep = ''
     return timeStep
@@ -1204,7 +1757,7 @@ def readStationList(value):
                 'NL', NL_STATIONS).replace(
                 'nl', NL_STATIONS).replace(
                 'dutch', NL_STATIONS).split(','))))
-        print("stations = %s" % stationList)
+        printLine("stations = %s" % stationList)
     else:
         raise GenException("the stationList has not been specified")
     return stationList
@@ -1214,31 +1767,133 @@ def readCreate_extra_ncp_beam(value):
     if value:
         create_extra_ncp_beam = toBool(value)  # TODO toBool can return True, False or ''
         if create_extra_ncp_beam:
-            print("extra ncp beam will be created")
+            printLine("extra ncp beam will be created")
         else:
-            print("extra ncp beam will not be created")
+            printLine("extra ncp beam will not be created")
     else:
         raise GenException("create_extra_ncp_beam has not been specified")
     return create_extra_ncp_beam
 
 
+class Record(object):
+    '''
+    Base class for the records that hold the parsed settings. The fields of a record are listed in __slots__, so
+    a misspelled field name raises an AttributeError instead of silently creating a new key. DEFAULTS holds the
+    default value of a field, fields that are not in it default to None (not specified). The default of a field is
+    only set when the field is first read, as a BlockSettings has about 80 fields of which most keep their default.
+    '''
+    __slots__ = ()
+    DEFAULTS = {}
+
+    def __init__(self, *values, **fields):
+        if values:
+            self.setValues(values)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def __getattr__(self, name):
+        # Only called when name has not been set
+        if name not in self.__slots__:
+            raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
+        default = self.DEFAULTS.get(name)
+        if isinstance(default, list):
+            default = list(default)
+        setattr(self, name, default)
+        return default
+
+    def setValues(self, values):
+        '''
+        Set the fields in the order of __slots__ to values, which can be shorter than the number of fields
+        '''
+        if len(values) > len(self.__slots__):
+            raise GenException("too many parameters for %s: %s" % (self.__class__.__name__, ";".join(map(str, values))))
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def copy(self):
+        return self.__class__(*[getattr(self, name) for name in self.__slots__])
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__,
+                           ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__))
+
+
+class Beam(Record):
+    '''
+    A calibrator or target beam: ra;dec;target;subbands;nrSubbands;nrTABrings;TABringSize;create_pipeline[;duration]
+    '''
+    __slots__ = ('ra', 'dec', 'target', 'subbands', 'nrSubbands', 'nrTabRings', 'tabRingSize', 'createPipeline',
+                 'duration')
+    DEFAULTS = {'duration': 0}
+
+
+class BBSParameters(Record):
+    '''
+    The parameters of a BBS line, Global_BBS or Imaging_BBS (which has no skyModel)
+    '''
+    __slots__ = ('skyModel', 'baselines', 'correlations', 'beamModelEnable', 'solveParms', 'solveUVRange',
+                 'strategyBaselines', 'strategyTimeRange')
+    DEFAULTS = {'skyModel': '', 'baselines': '', 'correlations': '', 'beamModelEnable': 'true', 'solveParms': '',
+                'solveUVRange': '', 'strategyBaselines': '', 'strategyTimeRange': ''}
+
+
+class DemixParameters(Record):
+    '''
+    The parameters of a Demix line or Global_Demix
+    '''
+    __slots__ = ('averagingFreqStep', 'averagingTimeStep', 'demixFreqStep', 'demixTimeStep', 'demixAlways',
+                 'demixIfNeeded', 'ignoreTarget')
+    DEFAULTS = dict.fromkeys(__slots__, '')
+
+    def check(self, name):
+        checkDemixMultiples(self.averagingFreqStep, self.averagingTimeStep, self.demixFreqStep, self.demixTimeStep,
+                            name)
+        self.ignoreTarget = toBool(self.ignoreTarget)
+
+
+class PulsarParameters(Record):
+    '''
+    The parameters of a Pulsar line or Global_Pulsar. The field names are the keyword arguments of
+    writeXMLPulsarPipe.
+    '''
+    __slots__ = ('pulsar', 'singlePulse', 'rawTo8bit', 'dspsrExtraOpts', 'prepdataExtraOpts', '_8bitConversionSigma',
+                 'tsubint', 'norfi', 'nofold', 'nopdmp', 'skipDspsr', 'rrats', '_2bf2fitsExtraOpts', 'decodeSigma',
+                 'decodeNblocks', 'rfifindExtraOpts', 'prepfoldExtraOpts', 'prepsubbandExtraOpts',
+                 'dynamicSpectrumTimeAverage', 'skipDynamicSpectrum', 'skipPrepfold', 'digifilExtraOpts')
+    DEFAULTS = dict.fromkeys(__slots__, '')
+    BOOLEANS = ('singlePulse', 'rawTo8bit', 'norfi', 'nofold', 'nopdmp', 'skipDspsr', 'rrats', 'skipDynamicSpectrum',
+                'skipPrepfold')
+
+    def convertBooleans(self):
+        for name in self.BOOLEANS:
+            setattr(self, name, toBool(getattr(self, name)))
+
+    def asDict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Options(Record):
+    '''
+    The command line options, see parseOptions
+    '''
+    __slots__ = ('inputfile', 'outputfile', 'status', 'jobs', 'graphfile', 'cachedir', 'batch', 'manifest', 'serve',
+                 'port', 'socket', 'layout')
+    DEFAULTS = {'inputfile': '', 'outputfile': '', 'status': 'opened', 'serve': False}
+
+
 def readGlobalBBS(value):
-    globalBBS = ['', '', '', 'true', '', '', '', '']
+    globalBBS = BBSParameters()
     if value:
-        valList = value.split(';')
-        for i in range(0, len(valList)):
-            globalBBS[i] = XMLescape(valList[i])
-        globalBBS[3] = toBool(globalBBS[3])
+        globalBBS.setValues([XMLescape(val) for val in value.split(';')])
+        globalBBS.beamModelEnable = toBool(globalBBS.beamModelEnable)
     return globalBBS
 
 
 def readImagingBBS(value):
-    imagingBBS = ['', '', 'true', '', '', '', '']
+    imagingBBS = BBSParameters()
     if value:
-        valList = value.split(';')
-        for i in range(0, len(valList)):
-            imagingBBS[i] = XMLescape(valList[i])
-        imagingBBS[2] = toBool(imagingBBS[2])
+        imagingBBS.setValues([''] + [XMLescape(val) for val in value.split(';')])  # Imaging_BBS has no skyModel
+        imagingBBS.beamModelEnable = toBool(imagingBBS.beamModelEnable)
     return imagingBBS
 
 
@@ -1257,33 +1912,18 @@ def checkDemixMultiples(avg_freq_step, avg_time_step, demix_freq_step, demix_tim
 
 
 def readGlobalDemix(value):
-    globalDemix = ['', '', '', '', '', '', '']
+    globalDemix = DemixParameters()
     if value:
-        valList = value.split(';')
-        for i in range(0, len(valList)):
-            globalDemix[i] = valList[i]
-        checkDemixMultiples(globalDemix[0], globalDemix[1], globalDemix[2], globalDemix[3], "globalDemix")
-        globalDemix[6] = toBool(globalDemix[6])  # convert ignoreTarget to bool
+        globalDemix.setValues(value.split(';'))
+        globalDemix.check("globalDemix")
     return globalDemix
 
 
 def readGlobalPulsar(value):
-    globalPulsar = ['', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '']
+    globalPulsar = PulsarParameters()
     if value:
-        valList = re.sub(r"\s+;", ';', value)  # clear white-space just before ';'
-        valList = re.sub(r";\s+", ';', valList).split(
-            ';')  # clear white-space directly after ';' (this method intentionally does not clear white-space in the (string) parameters self!)
-        for i in range(0, len(valList)):
-            globalPulsar[i] = XMLescape(valList[i])
-        globalPulsar[1] = toBool(globalPulsar[1])  # singlePulse
-        globalPulsar[2] = toBool(globalPulsar[2])  # rawTo8bit
-        globalPulsar[7] = toBool(globalPulsar[7])  # norfi
-        globalPulsar[8] = toBool(globalPulsar[8])  # nofold
-        globalPulsar[9] = toBool(globalPulsar[9])  # nopdmp
-        globalPulsar[10] = toBool(globalPulsar[10])  # skipDspsr
-        globalPulsar[11] = toBool(globalPulsar[11])  # rrats
-        globalPulsar[19] = toBool(globalPulsar[19])  # skipDynamicSpectrum
-        globalPulsar[20] = toBool(globalPulsar[20])  # skipPrepfold
+        globalPulsar.setValues([XMLescape(val) for val in splitParms(value)])
+        globalPulsar.convertBooleans()
     return globalPulsar
 
 
@@ -1314,34 +1954,36 @@ def readGlobalTABrings(value):
     return globalTABrings
 
 
-def findBeamSpecs(startLine, lines):
-    beams = []
-    beamSpec = ''
-    for lineNr in range(startLine, len(lines)):
-        line = lines[lineNr]
+def tokenizeBlock(lines):
+    """
+    Classify every line of a BLOCK in a single pass. Returns a list with a (key, value, section) tuple for each
+    key=value line. The section holds the lines that follow the key line up to the next key=value line:
+    'beams' is a list with for each beam spec line a dict with the 'beam' line and its 'pipelines' (BBS, Demix and
+    Pulsar lines) and 'TABs' lines; 'pipelines' and 'TABs' hold the lines that come before the first beam spec.
+    """
+    tokens = []
+    section = {'beams': [], 'pipelines': [], 'TABs': []}  # lines before the first key are not used
+    current = section
+    for line in lines:
         if line[:1].isdigit():  # startswith a digit, new beam
-            if beamSpec:  # save previous found one
-                beam = {'beam': beamSpec, 'pipelines': pipelines, "TABs": TABs}
-                beams.append(beam)
-            beamSpec = line
-            pipelines = []
-            TABs = []
+            current = {'beam': line, 'pipelines': [], 'TABs': []}
+            section['beams'].append(current)
         if line.startswith(('BBS', 'Demix', 'Pulsar')):  # Can contain '='
-            pipelines.append(line)      # FIXME: pipelines might be undefined
-        elif '=' in line:  # key=value pair, so end of beam spec
-            break
-        if line.startswith(('TAB', 'c;', 'i;')):
-            TABs.append(line)           # FIXME: TABs might be undefined
-    if beamSpec:  # save last found one
-        beam = {'beam': beamSpec, 'pipelines': pipelines, "TABs": TABs}
-        beams.append(beam)
-    return beams
-
-
-def readCalibratorBeam(startLine, lines, globalSubbands, globalTABrings, globalBBS, globalDemix, globalTAB,
+            current['pipelines'].append(line)
+        elif '=' in line:  # key=value pair, so end of the previous section
+            key, value = readKeyValuePair(line)
+            section = {'beams': [], 'pipelines': [], 'TABs': []}
+            current = section
+            tokens.append((key, value, section))
+            continue
+        if line.startswith(('TAB', 'c;', 'i;', 'rings;', 'grid;')):
+            current['TABs'].append(line)
+    return tokens
+
+
+def readCalibratorBeam(beamspecs, globalSubbands, globalTABrings, globalBBS, globalDemix, globalTAB,
                        coherentStokesData, flysEye):
     printInfo("found a calibrator beam")
-    beamspecs = findBeamSpecs(startLine, lines)
     if len(beamspecs) < 1:
         raise GenException("the calibration beam is not specified")
     # TODO currently only one Calibrator Beam?
@@ -1355,109 +1997,99 @@ def readCalibratorBeam(startLine, lines, globalSubbands, globalTABrings, globalB
     elif nr_parms < 8:
         raise GenException("too few parameters for calibrator beam: " + beam)
     else:
-        calibratorBeam = beam.replace(' ;', ';').replace('; ', ';').split(';')
+        calibratorBeam = Beam(*beam.replace(' ;', ';').replace('; ', ';').split(';'))
         if nr_parms == 9:
             try:
-                calibratorBeam[8] = int(calibratorBeam[8])  # the (optionally specified) duration of the pipeline
+                calibratorBeam.duration = int(calibratorBeam.duration)  # the (optional) pipeline duration
             except:
-                raise GenException("the specified pipeline duration: " + calibratorBeam[8]
+                raise GenException("the specified pipeline duration: " + calibratorBeam.duration
                                    + " needs to be an integer value in seconds")
-        else:
-            calibratorBeam.append(0)
 
         # convert coordinated HMS to degrees
         # Right Ascension
-        calibratorBeam[0] = convertAngle1(calibratorBeam[0], "calibratorBeam")
+        calibratorBeam.ra = convertAngle1(calibratorBeam.ra, "calibratorBeam")
         # declination
-        calibratorBeam[1] = convertAngle2(calibratorBeam[1], "calibratorBeam")
+        calibratorBeam.dec = convertAngle2(calibratorBeam.dec, "calibratorBeam")
 
-        if not calibratorBeam[3]:
+        if not calibratorBeam.subbands:
             if globalSubbands:
-                calibratorBeam[3] = globalSubbands[0]
-                calibratorBeam[4] = globalSubbands[1]
+                calibratorBeam.subbands = globalSubbands[0]
+                calibratorBeam.nrSubbands = globalSubbands[1]
             else:
                 raise GenException("No subbands specified for the calibrator beam")
         else:
-            verifySubbandList("calibratorBeam", calibratorBeam[3], calibratorBeam[4])
+            verifySubbandList("calibratorBeam", calibratorBeam.subbands, calibratorBeam.nrSubbands)
 
-        if not calibratorBeam[5]:  # TABrings specified?
+        if not calibratorBeam.nrTabRings:  # TABrings specified?
             if globalTABrings:
-                calibratorBeam[5] = globalTABrings[0]
-                calibratorBeam[6] = globalTABrings[1]
+                calibratorBeam.nrTabRings = globalTABrings[0]
+                calibratorBeam.tabRingSize = globalTABrings[1]
         else:
-            calibratorBeam[5] = int(calibratorBeam[5])  # nrTABrings
-            if calibratorBeam[6].endswith('deg') or calibratorBeam[6].endswith('d'):
-                calibratorBeam[6] = deg2rad(calibratorBeam[6].rstrip(' deg'))
+            calibratorBeam.nrTabRings = int(calibratorBeam.nrTabRings)
+            if calibratorBeam.tabRingSize.endswith('deg') or calibratorBeam.tabRingSize.endswith('d'):
+                calibratorBeam.tabRingSize = deg2rad(calibratorBeam.tabRingSize.rstrip(' deg'))
             else:
-                calibratorBeam[6] = float(calibratorBeam[6])  # TAB ring size
+                calibratorBeam.tabRingSize = float(calibratorBeam.tabRingSize)
 
-        calibratorBeam[7] = toBool(calibratorBeam[7])  # create pipeline?
-        create_calibrator_pipeline = calibratorBeam[7]
-        print(("right ascenscion:" + str(calibratorBeam[0]) + " declination:" + str(calibratorBeam[1]) + " target:" +
-               calibratorBeam[2] + " subbands:" + calibratorBeam[3] + " nrSubbands:" + calibratorBeam[
-                   4] + " create pipeline:" + str(calibratorBeam[7])))
+        calibratorBeam.createPipeline = toBool(calibratorBeam.createPipeline)  # create pipeline?
+        create_calibrator_pipeline = calibratorBeam.createPipeline
+        printLine(("right ascenscion:" + str(calibratorBeam.ra) + " declination:" + str(calibratorBeam.dec) +
+                   " target:" + calibratorBeam.target + " subbands:" + calibratorBeam.subbands + " nrSubbands:" +
+                   calibratorBeam.nrSubbands + " create pipeline:" + str(calibratorBeam.createPipeline)))
 
+        calibratorBBS = []  # Can now be a list of pipelines per beam
+        calibratorDemix = []
         if create_calibrator_pipeline:
-            BBSDefault = ['', '', '', 'true', '', '', '', '']
-            DemixDefault = ['', '', '', '', '', '', '']
-            calibratorBBS = []  # Can now be a list of pipelines per beam
-            calibratorDemix = []
             for pipeline in pipelines:
                 if pipeline.startswith("BBS"):
-                    calibratorBBS.append(BBSDefault[:])  # [:] is needed to make a deep copy
+                    calibratorBBS.append(BBSParameters())
                     calBBS = readExtraParms("BBS", [pipeline])
                     if len(calBBS) > 0:
-                        for i in range(0, len(calBBS)):
-                            calibratorBBS[-1][i] = calBBS[i]
-                        calibratorBBS[-1][3] = toBool(calibratorBBS[-1][3])
-                    elif globalBBS != []:
+                        calibratorBBS[-1].setValues(calBBS)
+                        calibratorBBS[-1].beamModelEnable = toBool(calibratorBBS[-1].beamModelEnable)
+                    elif globalBBS:
                         printInfo('Using global BBS settings for Calibrator beam pipeline')
-                        for i in range(0, len(globalBBS)):
-                            calibratorBBS[-1][i] = globalBBS[i]
+                        calibratorBBS[-1] = globalBBS.copy()
 
                 if pipeline.startswith("Demix"):
-                    calibratorDemix.append(DemixDefault[:])  # [:] is needed to make a deep copy
+                    calibratorDemix.append(DemixParameters())
                     calDemix = readExtraParms("Demix", [pipeline])
                     if len(calDemix) > 0:
-                        for i in range(0, len(calDemix)):
-                            calibratorDemix[-1][i] = calDemix[i]
-                        checkDemixMultiples(calibratorDemix[-1][0], calibratorDemix[-1][1], calibratorDemix[-1][2],
-                                            calibratorDemix[-1][3], "calibratorDemix")
-                        calibratorDemix[-1][6] = toBool(calibratorDemix[-1][6])
-                    elif globalDemix != []:
+                        calibratorDemix[-1].setValues(calDemix)
+                        calibratorDemix[-1].check("calibratorDemix")
+                    elif globalDemix:
                         printInfo('Using global demix settings for Calibrator beam pipeline')
-                        for i in range(0, len(globalDemix)):
-                            calibratorDemix[-1][i] = globalDemix[i]
+                        calibratorDemix[-1] = globalDemix.copy()
 
         calibratorTAB = readTiedArrayBeams(TABs)
         if not calibratorTAB:
             if globalTAB:
                 printInfo('Using global TABs for calibrator beam')
                 calibratorTAB = globalTAB  # TODO check no possibility for globalTABrings?
+        calibratorTAB = expandTiedArrayBeams(calibratorTAB, calibratorBeam.ra, calibratorBeam.dec)
         if coherentStokesData and not (hasCoherentTab(calibratorTAB) or flysEye):
             raise GenException("CalibratorBeam: no coherent TAB specified while coherent Stokes data requested")
 
-        if not calibratorBBS:                   # FIXME: calibratorBBS might be undefined
-            calibratorBBS.append(BBSDefault)  # FIXME: BBSDefault might be undefined
+        if not calibratorBBS:
             if globalBBS:
                 printInfo('Using global BBS settings for pipeline(s) coupled to Calibrator beam')
-                for i in range(0, len(globalBBS)):
-                    calibratorBBS[-1][i] = globalBBS[i]
+                calibratorBBS.append(globalBBS.copy())
+            else:
+                calibratorBBS.append(BBSParameters())
 
-        if not calibratorDemix:             # FIXME: calibratorDemix might be undefined
-            calibratorDemix.append(DemixDefault)  # FIXME: DemixDefault might be undefined
+        if not calibratorDemix:
             if globalDemix:
                 printInfo('Using global demix settings for pipeline(s) coupled to Calibrator beam')
-                for i in range(0, len(globalDemix)):
-                    calibratorDemix[-1][i] = globalDemix[i]
+                calibratorDemix.append(globalDemix.copy())
+            else:
+                calibratorDemix.append(DemixParameters())
 
     return calibratorBeam, calibratorBBS, calibratorDemix, calibratorTAB, create_calibrator_pipeline
 
 
-def readTargetBeams(startLine, lines, globalSubbands, globalBBS, globalDemix, globalPulsar, globalTAB, globalTABrings,
+def readTargetBeams(beamspecs, globalSubbands, globalBBS, globalDemix, globalPulsar, globalTAB, globalTABrings,
                     coherentStokesData, flysEye, numberOfBitsPerSample):
     printInfo('found the target beams')
-    beamspecs = findBeamSpecs(startLine, lines)
     if len(beamspecs) < 1:
         raise GenException("the target beams are not specified")
     targetBeams = []
@@ -1477,124 +2109,104 @@ def readTargetBeams(startLine, lines, globalSubbands, globalBBS, globalDemix, gl
         elif nr_parms < 8:
             raise GenException("too few parameters for target beam: " + beam)
         else:
-            targetBeams.append(beam.replace(' ;', ';').replace('; ', ';').split(';'))
+            targetBeam = Beam(*beam.replace(' ;', ';').replace('; ', ';').split(';'))
+            targetBeams.append(targetBeam)
 
             if nr_parms == 9:
                 try:
-                    targetBeams[nr_beams][8] = int(
-                        targetBeams[nr_beams][8])  # the (optionally specified) duration of the pipeline
+                    targetBeam.duration = int(targetBeam.duration)  # the (optional) pipeline duration
                 except:
-                    raise GenException("the specified pipeline duration: " + targetBeams[nr_beams][
-                        8] + " needs to be an integer value in seconds")
-            else:
-                targetBeams[nr_beams].append(0)
+                    raise GenException("the specified pipeline duration: " + targetBeam.duration
+                                       + " needs to be an integer value in seconds")
 
             # convert coordinated HMS to degrees
             # right ascension
-            targetBeams[nr_beams][0] = convertAngle1(targetBeams[nr_beams][0], "targetBeam:" + str(nr_beams))
+            targetBeam.ra = convertAngle1(targetBeam.ra, "targetBeam:" + str(nr_beams))
             # declination
-            targetBeams[nr_beams][1] = convertAngle2(targetBeams[nr_beams][1], "targetBeam:" + str(nr_beams))
+            targetBeam.dec = convertAngle2(targetBeam.dec, "targetBeam:" + str(nr_beams))
 
-            if not targetBeams[nr_beams][3]:
+            if not targetBeam.subbands:
                 if globalSubbands:
-                    targetBeams[nr_beams][3] = globalSubbands[0]
-                    targetBeams[nr_beams][4] = globalSubbands[1]
+                    targetBeam.subbands = globalSubbands[0]
+                    targetBeam.nrSubbands = globalSubbands[1]
                     printInfo('Using Global_Subband settings for target beam: %i' % nr_beams)
                 else:
                     raise GenException("No subbands specified for the calibrator beam")
             else:
-                verifySubbandList("targetBeam %i" % (nr_beams + 1), targetBeams[nr_beams][3], targetBeams[nr_beams][4])
+                verifySubbandList("targetBeam %i" % (nr_beams + 1), targetBeam.subbands, targetBeam.nrSubbands)
 
-            if not targetBeams[nr_beams][5]:  # TABrings specified?
+            if not targetBeam.nrTabRings:  # TABrings specified?
                 if globalTABrings:
-                    targetBeams[nr_beams][5] = globalTABrings[0]
-                    targetBeams[nr_beams][6] = globalTABrings[1]
+                    targetBeam.nrTabRings = globalTABrings[0]
+                    targetBeam.tabRingSize = globalTABrings[1]
                     printInfo('Using Global_TABrings settings for target beam: %i' % nr_beams)
                 else:
-                    targetBeams[nr_beams][5] = 0
+                    targetBeam.nrTabRings = 0
             else:
-                targetBeams[nr_beams][5] = int(targetBeams[nr_beams][5])
-                if targetBeams[nr_beams][5] > 0:
-                    if targetBeams[nr_beams][6].endswith('deg') or targetBeams[nr_beams][6].endswith('d'):
-                        targetBeams[nr_beams][6] = deg2rad(targetBeams[nr_beams][6].rstrip(' deg'))
+                targetBeam.nrTabRings = int(targetBeam.nrTabRings)
+                if targetBeam.nrTabRings > 0:
+                    if targetBeam.tabRingSize.endswith('deg') or targetBeam.tabRingSize.endswith('d'):
+                        targetBeam.tabRingSize = deg2rad(targetBeam.tabRingSize.rstrip(' deg'))
                     else:  # TODO try?
-                        targetBeams[nr_beams][6] = float(targetBeams[nr_beams][6])  # TAB ring size
-
-            targetBeams[nr_beams][7] = toBool(targetBeams[nr_beams][7])  # create pipeline coupled to target beam?
-            print(("right ascenscion:" + str(targetBeams[nr_beams][0]) + " declination:" +
-                   str(targetBeams[nr_beams][1]) + " target:" + targetBeams[nr_beams][2] + " subbands:" +
-                   targetBeams[nr_beams][3] + " nrSubbands:" + targetBeams[nr_beams][4] + " create pipeline:" +
-                   str(targetBeams[nr_beams][7])))
-
-            BBSDefault = ['', '', '', 'true', '', '', '', '']
-            DemixDefault = ['', '', '', '', '', '', '']
-            PulsarDefault = ['', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '']
-            targetBBS.append([])  # Can now be a list of pipelines per beam
-            targetDemix.append([])
-            targetPulsar.append([])
-            if targetBeams[nr_beams][7]:  # pipeline created?
+                        targetBeam.tabRingSize = float(targetBeam.tabRingSize)
+
+            targetBeam.createPipeline = toBool(targetBeam.createPipeline)  # create pipeline coupled to target beam?
+            printLine(("right ascenscion:" + str(targetBeam.ra) + " declination:" + str(targetBeam.dec) + " target:" +
+                       targetBeam.target + " subbands:" + targetBeam.subbands + " nrSubbands:" +
+                       targetBeam.nrSubbands + " create pipeline:" + str(targetBeam.createPipeline)))
+
+            beamBBS = []  # Can now be a list of pipelines per beam
+            beamDemix = []
+            beamPulsar = []
+            targetBBS.append(beamBBS)
+            targetDemix.append(beamDemix)
+            targetPulsar.append(beamPulsar)
+            if targetBeam.createPipeline:  # pipeline created?
                 for pipeline in pipelines:
                     if pipeline.startswith("BBS"):
-                        targetBBS[nr_beams].append(BBSDefault[:])  # [:] is needed to make a deep copy
-                        tarBBS = readExtraParms("BBS", [pipeline])
-                        for i in range(0, len(tarBBS)):
-                            targetBBS[nr_beams][-1][i] = tarBBS[i]
-                        targetBBS[nr_beams][-1][3] = toBool(targetBBS[nr_beams][-1][3])
+                        beamBBS.append(BBSParameters())
+                        beamBBS[-1].setValues(readExtraParms("BBS", [pipeline]))
+                        beamBBS[-1].beamModelEnable = toBool(beamBBS[-1].beamModelEnable)
 
                     if pipeline.startswith("Demix"):
-                        targetDemix[nr_beams].append(DemixDefault[:])  # [:] is needed to make a deep copy
+                        beamDemix.append(DemixParameters())
                         tarDemix = readExtraParms("Demix", [pipeline])
                         if len(tarDemix) >= 4:
-                            for i in range(0, len(tarDemix)):
-                                targetDemix[nr_beams][-1][i] = tarDemix[i]
-                            checkDemixMultiples(targetDemix[nr_beams][-1][0], targetDemix[nr_beams][-1][1],
-                                                targetDemix[nr_beams][-1][2], targetDemix[nr_beams][-1][3],
-                                                "targetDemix[%i]" % nr_beams)
-                            targetDemix[nr_beams][-1][6] = toBool(
-                                targetDemix[nr_beams][-1][6])  # convert ignoreTarget to bool
+                            beamDemix[-1].setValues(tarDemix)
+                            beamDemix[-1].check("targetDemix[%i]" % nr_beams)
                         elif len(tarDemix) > 0:
                             raise GenException(
                                 "Demixing parameters should at least have the first four averaging/demixing steps")
                                 #"(block %s, targetBeam %s)" % (blockNr, nr_beams))  # FIXME: blockNr is undefined!!!
 
                     if pipeline.startswith("Pulsar"):
-                        targetPulsar[nr_beams].append(PulsarDefault[:])  # [:] is needed to make a deep copy
+                        beamPulsar.append(PulsarParameters())
                         tarPulsar = readExtraParms("Pulsar", [pipeline])
                         if len(tarPulsar) > 0:
-                            for i in range(0, len(tarPulsar)):
-                                targetPulsar[nr_beams][-1][i] = tarPulsar[i]
-                            targetPulsar[nr_beams][-1][1] = toBool(targetPulsar[nr_beams][-1][1])  # singlePulse
-                            targetPulsar[nr_beams][-1][2] = toBool(targetPulsar[nr_beams][-1][2])  # rawTo8bit
-                            targetPulsar[nr_beams][-1][7] = toBool(targetPulsar[nr_beams][-1][7])  # norfi
-                            targetPulsar[nr_beams][-1][8] = toBool(targetPulsar[nr_beams][-1][8])  # nofold
-                            targetPulsar[nr_beams][-1][9] = toBool(targetPulsar[nr_beams][-1][9])  # nopdmp
-                            targetPulsar[nr_beams][-1][10] = toBool(targetPulsar[nr_beams][-1][10])  # skipDspsr
-                            targetPulsar[nr_beams][-1][11] = toBool(targetPulsar[nr_beams][-1][11])  # rrats
-                            targetPulsar[nr_beams][-1][19] = toBool(
-                                targetPulsar[nr_beams][-1][19])  # skipDynamicSpectrum
-                            targetPulsar[nr_beams][-1][20] = toBool(targetPulsar[nr_beams][-1][20])  # skipPrepfold
-
-                if not targetBBS[nr_beams]:
-                    targetBBS[nr_beams].append(BBSDefault)
+                            beamPulsar[-1].setValues(tarPulsar)
+                            beamPulsar[-1].convertBooleans()
+
+                if not beamBBS:
                     if globalBBS:
                         printInfo('Using global BBS settings for pipeline(s) coupled to target beam:' + str(nr_beams))
-                        for i in range(0, len(globalBBS)):
-                            targetBBS[nr_beams][-1][i] = globalBBS[i]
+                        beamBBS.append(globalBBS.copy())
+                    else:
+                        beamBBS.append(BBSParameters())
 
-                if not targetDemix[nr_beams]:
-                    targetDemix[nr_beams].append(DemixDefault)
+                if not beamDemix:
                     if globalDemix:
                         printInfo('Using global demix settings for pipeline(s) coupled to target beam:' + str(nr_beams))
-                        for i in range(0, len(globalDemix)):
-                            targetDemix[nr_beams][-1][i] = globalDemix[i]
+                        beamDemix.append(globalDemix.copy())
+                    else:
+                        beamDemix.append(DemixParameters())
 
-                if not targetPulsar[nr_beams]:
-                    targetPulsar[nr_beams].append(PulsarDefault)
+                if not beamPulsar:
                     if globalPulsar:
                         printInfo('Using global Pulsar settings for pulsar pipeline(s) coupled to target beam:' +
                                   str(nr_beams))
-                        for i in range(0, len(globalPulsar)):
-                            targetPulsar[nr_beams][-1][i] = globalPulsar[i]
+                        beamPulsar.append(globalPulsar.copy())
+                    else:
+                        beamPulsar.append(PulsarParameters())
 
             tarTAB = readTiedArrayBeams(TABs)
             if tarTAB:
@@ -1603,13 +2215,14 @@ def readTargetBeams(startLine, lines, globalSubbands, globalBBS, globalDemix, gl
                 targetTAB.append(globalTAB)
             else:
                 targetTAB.append([])
-            if coherentStokesData and not (hasCoherentTab(targetTAB[-1]) or (targetBeams[nr_beams][5] > 0) or flysEye):
+            targetTAB[-1] = expandTiedArrayBeams(targetTAB[-1], targetBeam.ra, targetBeam.dec)
+            if coherentStokesData and not (hasCoherentTab(targetTAB[-1]) or (targetBeam.nrTabRings > 0) or flysEye):
                 raise GenException(
                     "Target Beam %i: no coherent TAB specified while coherent Stokes data requested" % nr_beams)
             nr_beams += 1
-    totSubbands = sum([int(targetBeams[i][4]) for i in range(len(targetBeams))])
+    totSubbands = sum([int(targetBeam.nrSubbands) for targetBeam in targetBeams])
     maxSubbands = MAX_NR_SUBBANDS[NUMBER_OF_BITS_PER_SAMPLE.index(numberOfBitsPerSample)]
-    print("total subbands for all target beams = %s" % totSubbands)
+    printLine("total subbands for all target beams = %s" % totSubbands)
     if totSubbands > maxSubbands:  # TODO this doesn't count the calibrator beam!
         raise GenException(
             "the total number of subbands (%s) for all target beams exceeds the maximum number of subbands (%s) for %s bit mode" % (
@@ -1638,328 +2251,515 @@ def checkAntennaModeInstrumentFilterAndClockCombination(antennaMode, instrumentF
 def determineNrImages(targetBeams, nrSubbandsPerImage, variableName):
     nrImages = []
     for beam in targetBeams:
-        if beam[7]:  ##Make pipelines
-            if int(beam[4]) % nrSubbandsPerImage != 0:
+        if beam.createPipeline:  ##Make pipelines
+            if int(beam.nrSubbands) % nrSubbandsPerImage != 0:
                 raise GenException("nrSubbands (%s) should be integer dividable by the %s (%s) for target beam %i" % (
-                beam[4], variableName, nrSubbandsPerImage, targetBeams.index(beam) + 1))
-            nrImages.append(int(beam[4]) / nrSubbandsPerImage)
+                beam.nrSubbands, variableName, nrSubbandsPerImage, targetBeams.index(beam) + 1))
+            nrImages.append(int(beam.nrSubbands) / nrSubbandsPerImage)
         else:
             nrImages.append(0)
     return nrImages
 
 
+def keyReader(reader, keyname=None):
+    """
+    Adapt one of the read*Key(keyname, value) functions to the signature of
+    the readers in BLOCK_KEYS. keyname defaults to the key itself.
+    """
+    return lambda key, value, s, section, blockNr: reader(keyname or key, value)
+
+
+def valueReader(reader):
+    """
+    Adapt a reader that only takes the value to the signature of the readers
+    in BLOCK_KEYS
+    """
+    return lambda key, value, s, section, blockNr: reader(value)
+
+
+def readRepeat(key, value, s, section, blockNr):
+    try:
+        nrRepeats = int(value)
+        printLine("number of repeats = %s" % nrRepeats)
+    except:
+        raise GenException("the repeat parameter is not valid for BLOCK: %i" % blockNr)
+    return nrRepeats
+
+
+def readNrTasks(key, value, s, section, blockNr):
+    try:
+        nr_tasks = int(value)
+        printLine("number of tasks = %i" % nr_tasks)
+    except:
+        raise GenException("the number of tasks parameter is not valid for BLOCK: %i" % blockNr)
+    return nr_tasks
+
+
+def readNrCoresPerTask(key, value, s, section, blockNr):
+    try:
+        nr_cores_per_task = int(value)
+        printLine("number of cores per task = %i" % nr_cores_per_task)
+    except:
+        raise GenException("the number of cores per task parameter is not valid for BLOCK: %i" % blockNr)
+    return nr_cores_per_task
+
+
+def readNrNodes(key, value, s, section, blockNr):
+    try:
+        nr_tasks = int(value) * DEFAULT_TASKS_PER_NODE
+        nr_cores_per_task = DEFAULT_CORES_PER_TASK
+        printLine("number of nodes found, converted to number of tasks = %i, number of cores per task = %i" % (
+        nr_tasks, nr_cores_per_task))
+    except:
+        raise GenException("the number of nodes parameter is not valid for BLOCK: %i" % blockNr)
+    return nr_tasks, nr_cores_per_task
+
+
+def readGlobalTAB(key, value, s, section, blockNr):
+    return readTiedArrayBeams(section['TABs'])  # the TAB lines directly following Global_TAB
+
+
+def readCalibratorBeamKey(key, value, s, section, blockNr):
+    return readCalibratorBeam(section['beams'], s.globalSubbands, s.globalTABrings, s.globalBBS,
+                              s.globalDemix, s.globalTAB, s.coherentStokesData, s.flysEye)
+
+
+def readTargetBeamsKey(key, value, s, section, blockNr):
+    if s.numberOfBitsPerSample is None:  # needed to check the number of subbands of the target beams
+        raise GenException("the numberOfBitsPerSample should be specified before the targetBeams in BLOCK: %i" % blockNr)
+    return readTargetBeams(section['beams'], s.globalSubbands, s.globalBBS, s.globalDemix,
+                           s.globalPulsar, s.globalTAB, s.globalTABrings, s.coherentStokesData,
+                           s.flysEye, s.numberOfBitsPerSample)
+
+
+# The keys that can be used in a BLOCK. For each key: the settings field it sets (a tuple if the reader returns
+# several values), the reader, the default value of the field(s) (None if the field has none) and the error
+# raised by checkSettings if the key is required but missing (None if it is optional). Readers are called as
+# reader(key, value, settings, section, blockNr), where section holds the beam, pipeline and TAB lines that follow
+# the key line (see tokenizeBlock).
+BLOCK_KEYS = {
+    "processing": ("processing", valueReader(readProcessing), None,
+                   "the processing parameter has not been specified. It should be one of %s" % ", ".join(PROCESSING)),
+    "split_targets": ("split_targets", keyReader(readBoolKey), None,
+                      "the split_targets parameter is not specified for BLOCK: %(blockNr)i"),
+    "packageName": ("packageName", keyReader(readStringKey), None,
+                    "the packageName is not specified for BLOCK: %(blockNr)i"),
+    "packageDescription": ("packageDescription", keyReader(readOptionalStringKey), None,
+                           "the packageDescription is not specified for BLOCK: %(blockNr)i"),
+    "packageTag": ("packageTag", valueReader(readPackageTag), '', None),
+    "startTimeUTC": (("startTime", "set_starttime"), valueReader(readStartTimeUTC), (None, False), None),
+    "timeStep1": ("timeStep1", valueReader(lambda value: readTimeStep(1, value)), None, None),
+    "timeStep2": ("timeStep2", valueReader(lambda value: readTimeStep(2, value)), None, None),
+    "stationList": ("stationList", valueReader(readStationList), None,
+                    "the stationList is not specified for BLOCK: %(blockNr)i"),
+    "create_calibrator_observations": ("create_calibrator_observations", keyReader(readBoolKey), None, None),
+    "create_target_cal_beam": ("create_target_cal_beam", keyReader(readBoolKey), None, None),
+    "calibration": ("calibration_mode", keyReader(readListKey), None,
+                    "the calibration parameter is not specified for BLOCK: %(blockNr)i"),
+    "create_extra_ncp_beam": ("create_extra_ncp_beam", valueReader(readCreate_extra_ncp_beam), None, None),
+    "antennaMode": ("antennaMode", keyReader(readListKey), None,
+                    "the antennaMode is not specified for BLOCK: %(blockNr)i"),
+    "clock": ("clock", keyReader(readListKey), None, "the clock is not specified for BLOCK: %(blockNr)i"),
+    "instrumentFilter": ("instrumentFilter", keyReader(readListKey), None,
+                         "the instrumentFilter is not specified for BLOCK: %(blockNr)i"),
+    # TODO should check if it's a valid float?
+    "integrationTime": ("integrationTime", keyReader(readStringKey), None,
+                        "the integrationTime is not specified for BLOCK: %(blockNr)i"),
+    "correlatedData": ("correlatedData", keyReader(readBoolKey), None,
+                       "the correlatedData is not specified for BLOCK: %(blockNr)i"),
+    "coherentStokesData": ("coherentStokesData", keyReader(readBoolKey), False, None),
+    "incoherentStokesData": ("incoherentStokesData", keyReader(readBoolKey), None, None),
+    "coherentDedisperseChannels": ("coherentDedisperseChannels", keyReader(readBoolKey), None,
+                                   "the coherentDedisperseChannels is not specified for BLOCK: %(blockNr)i"),
+    "flysEye": ("flysEye", keyReader(readBoolKey), False, None),
+    "calibratorDuration_s": ("calibratorDuration_s", keyReader(readIntKey), None, None),
+    "targetDuration_s": ("targetDuration_s", keyReader(readIntKey), None,
+                         "the targetDuration_s is not specified for BLOCK: %(blockNr)i"),
+    "numberOfBitsPerSample": ("numberOfBitsPerSample", keyReader(readIntListKey), None,
+                              "the numberOfBitsPerSample is not specified for BLOCK: %(blockNr)i"),
+    # TODO should this be Int?
+    "channelsPerSubband": ("channelsPerSubband", keyReader(readStringKey), None,
+                           "the channelsPerSubband is not specified for BLOCK: %(blockNr)i"),
+    "subbandsPerFileCS": ("subbandsPerFileCS", keyReader(readIntKey), '', None),
+    "numberCollapsedChannelsCS": ("numberCollapsedChannelsCS", keyReader(readIntKey), '', None),
+    "stokesDownsamplingStepsCS": ("stokesDownsamplingStepsCS", keyReader(readIntKey), '', None),
+    "whichCS": ("whichCS", keyReader(readListKey), '', None),
+    "subbandsPerFileIS": ("subbandsPerFileIS", keyReader(readIntKey), '', None),
+    "numberCollapsedChannelsIS": ("numberCollapsedChannelsIS", keyReader(readIntKey), '', None),
+    "stokesDownsamplingStepsIS": ("stokesDownsamplingStepsIS", keyReader(readIntKey), '', None),
+    "whichIS": ("whichIS", keyReader(readListKey), '', None),
+    "nrSubbandsPerImage": ("nrSubbandsPerImage", keyReader(readIntKey), None, None),
+    "imagingPipeline": ("imagingPipeline", keyReader(readListKey), None, None),
+    "imagingDuration_s": ("imaging_pipe_duration", keyReader(readIntKey, "imaging_pipe_duration"), None, None),
+    "maxBaseline_m": ("maxBaseline", keyReader(readIntKey, "maxBaseline"), None, None),
+    "fieldOfView_deg": ("fieldOfView", keyReader(readFloatKey, "fieldOfView"), None, None),
+    "weightingScheme": ("weightingScheme", keyReader(readListKey), None, None),
+    "robustParameter": ("robustParameter", keyReader(readFloatKey), None, None),
+    "nrOfIterations": ("nrOfIterations", keyReader(readIntKey), None, None),
+    "cleaningThreshold": ("cleaningThreshold", keyReader(readFloatKey), None, None),
+    "uvMin_klambda": ("uvMin", keyReader(readFloatKey, "uvMin"), None, None),
+    "uvMax_klambda": ("uvMax", keyReader(readFloatKey, "uvMax"), None, None),
+    "stokesToImage": ("stokesToImage", keyReader(readStringKey), None, None),
+    "skyModel": ("skyModel", keyReader(readStringKey), None, None),
+    "tbbPiggybackAllowed": ("tbbPiggybackAllowed", keyReader(readBoolKey), True, None),
+    "aartfaacPiggybackAllowed": ("aartfaacPiggybackAllowed", keyReader(readBoolKey), True, None),
+    "flaggingStrategy": ("flaggingStrategy", keyReader(readStringKey), None, None),
+    "subbandsPerSubbandGroup": ("subbandsPerSubbandGroup", keyReader(readIntKey), None, None),
+    "subbandGroupsPerMS": ("subbandGroupsPerMS", keyReader(readIntKey), None, None),
+    "Global_BBS": ("globalBBS", valueReader(readGlobalBBS), None, None),
+    "Imaging_BBS": ("imagingBBS", valueReader(readImagingBBS), None, None),
+    "Global_Demix": ("globalDemix", valueReader(readGlobalDemix), None, None),
+    "Global_Pulsar": ("globalPulsar", valueReader(readGlobalPulsar), None, None),
+    "Global_Subbands": ("globalSubbands", valueReader(readGlobalSubbands), [], None),
+    "Global_TAB": ("globalTAB", readGlobalTAB, [], None),
+    "Global_TABrings": ("globalTABrings", valueReader(readGlobalTABrings), [], None),
+    "calibratorBeam": (("calibratorBeam", "calibratorBBS", "calibratorDemix", "calibratorTAB",
+                        "create_calibrator_pipeline"), readCalibratorBeamKey, (None,) * 5, None),
+    "targetBeams": (("targetBeams", "targetBBS", "targetDemix", "targetPulsar", "targetTAB", "nr_beams"),
+                    readTargetBeamsKey, (None,) * 5 + (0,), None),
+    "repeat": ("nrRepeats", readRepeat, 1, None),
+    "cluster": ("cluster", keyReader(readStringKey), 'CEP4', None),
+    "nr_tasks": ("nr_tasks", readNrTasks, None, None),
+    "nr_cores_per_task": ("nr_cores_per_task", readNrCoresPerTask, None, None),
+    "nr_nodes": (("nr_tasks", "nr_cores_per_task"), readNrNodes, (None, None), None),
+    "storagemanager": ("storagemanager", lambda key, value, s, section, blockNr: value, None, None),
+}
+
+# All settings fields that are set by a key, in the order of BLOCK_KEYS
+BLOCK_FIELDS = []
+# (field, default) for all settings fields that have a default value
+BLOCK_DEFAULTS = []
+# (field, error message) for all required settings fields
+BLOCK_REQUIRED = []
+for fields, reader, defaults, required in BLOCK_KEYS.values():
+    if not isinstance(fields, tuple):
+        fields, defaults = (fields,), (defaults,)
+    BLOCK_FIELDS += [field for field in fields if field not in BLOCK_FIELDS]
+    BLOCK_DEFAULTS += [(field, default) for (field, default) in zip(fields, defaults) if default is not None]
+    if required:
+        BLOCK_REQUIRED.append((fields[0], required))
+
+
+class BlockSettings(Record):
+    '''
+    The settings of a BLOCK: the fields set by the keys in BLOCK_KEYS, followed by the ones that checkSettings and
+    writeBlock derive from them. A field that is None has not been specified.
+    '''
+    __slots__ = tuple(BLOCK_FIELDS) + ('do_imaging', 'imaging_pipe_type', 'imaging_pipe_default_template', 'nrImages',
+                                       'writePackageTag', 'startTimeObs')
+    DEFAULTS = dict(BLOCK_DEFAULTS)
+
+
 def readBlock(lines, projectName, blockNr):
-    s = {  ##settings
-        "set_starttime": False,
-        "nrRepeats": 1,
-        "globalSubbands": [],
-        "globalBBS": [],
-        "globalDemix": [],
-        "globalPulsar": [],
-        "globalTAB": [],
-        "globalTABrings": [],
-        "coherentStokesData": False,
-        "flysEye": False,
-        "numberOfBitsPerSample": 0}
-
-    for lineNr, cline in enumerate(lines):
-        if "=" in cline and not cline.startswith(('BBS', 'Demix', 'Pulsar')):  # we skip beam and pipelines lines
-            key, value = readKeyValuePair(cline)
-            if key == "processing":
-                s["processing"] = readProcessing(value)
-            elif key == "split_targets":
-                s["split_targets"] = readBoolKey("split_targets", value)
-            elif key == "packageName":
-                s["packageName"] = readStringKey("packageName", value)
-            elif key == "packageDescription":
-                s["packageDescription"] = readOptionalStringKey("packageDescription", value)
-            elif key == "packageTag":
-                s["packageTag"] = readPackageTag(value)
-            elif key == "startTimeUTC":
-                s["startTime"], s["set_starttime"] = readStartTimeUTC(value)
-            elif key == "timeStep1":
-                s["timeStep1"] = readTimeStep(1, value)
-            elif key == "timeStep2":
-                s["timeStep2"] = readTimeStep(2, value)
-            elif key == "stationList":
-                s["stationList"] = readStationList(value)
-            elif key == "create_calibrator_observations":
-                s["create_calibrator_observations"] = readBoolKey("create_calibrator_observations", value)
-            elif key == "create_target_cal_beam":
-                s["create_target_cal_beam"] = readBoolKey("create_target_cal_beam", value)
-            elif key == "calibration":
-                s["calibration_mode"] = readListKey("calibration", value)
-            elif key == "create_extra_ncp_beam":
-                s["create_extra_ncp_beam"] = readCreate_extra_ncp_beam(value)
-            elif key == "antennaMode":
-                s["antennaMode"] = readListKey("antennaMode", value)
-            elif key == "clock":
-                s["clock"] = readListKey("clock", value)
-            elif key == "instrumentFilter":
-                s["instrumentFilter"] = readListKey("instrumentFilter", value)
-            elif key == "integrationTime":
-                # TODO should check if it's a valid float?
-                s["integrationTime"] = readStringKey("integrationTime", value)
-            elif key == "correlatedData":
-                s["correlatedData"] = readBoolKey("correlatedData", value)
-            elif key == "coherentStokesData":
-                s["coherentStokesData"] = readBoolKey("coherentStokesData", value)
-            elif key == "incoherentStokesData":
-                s["incoherentStokesData"] = readBoolKey("incoherentStokesData", value)
-            elif key == "coherentDedisperseChannels":
-                s["coherentDedisperseChannels"] = readBoolKey("coherentDedisperseChannels", value)
-            elif key == "flysEye":
-                s["flysEye"] = readBoolKey("flysEye", value)
-            elif key == "calibratorDuration_s":
-                s["calibratorDuration_s"] = readIntKey("calibratorDuration_s", value)
-            elif key == "targetDuration_s":
-                s["targetDuration_s"] = readIntKey("targetDuration_s", value)
-            elif key == "numberOfBitsPerSample":
-                s["numberOfBitsPerSample"] = readIntListKey("numberOfBitsPerSample", value)
-            elif key == "channelsPerSubband":
-                # TODO should this be Int?
-                s["channelsPerSubband"] = readStringKey("channelsPerSubband", value)
-            elif key == "subbandsPerFileCS":
-                s["subbandsPerFileCS"] = readIntKey("subbandsPerFileCS", value)
-            elif key == "numberCollapsedChannelsCS":
-                s["numberCollapsedChannelsCS"] = readIntKey("numberCollapsedChannelsCS", value)
-            elif key == "stokesDownsamplingStepsCS":
-                s["stokesDownsamplingStepsCS"] = readIntKey("stokesDownsamplingStepsCS", value)
-            elif key == "whichCS":
-                s["whichCS"] = readListKey("whichCS", value)
-            elif key == "subbandsPerFileIS":
-                s["subbandsPerFileIS"] = readIntKey("subbandsPerFileIS", value)
-            elif key == "numberCollapsedChannelsIS":
-                s["numberCollapsedChannelsIS"] = readIntKey("numberCollapsedChannelsIS", value)
-            elif key == "stokesDownsamplingStepsIS":
-                s["stokesDownsamplingStepsIS"] = readIntKey("stokesDownsamplingStepsIS", value)
-            elif key == "whichIS":
-                s["whichIS"] = readListKey("whichIS", value)
-            elif key == "nrSubbandsPerImage":
-                s["nrSubbandsPerImage"] = readIntKey("nrSubbandsPerImage", value)
-            elif key == "imagingPipeline":
-                s["imagingPipeline"] = readListKey("imagingPipeline", value)
-            elif key == "imagingDuration_s":
-                s["imaging_pipe_duration"] = readIntKey("imaging_pipe_duration", value)
-            elif key == "maxBaseline_m":
-                s["maxBaseline"] = readIntKey("maxBaseline", value)
-            elif key == "fieldOfView_deg":
-                s["fieldOfView"] = readFloatKey("fieldOfView", value)
-            elif key == "weightingScheme":
-                s["weightingScheme"] = readListKey("weightingScheme", value)
-            elif key == "robustParameter":
-                s["robustParameter"] = readFloatKey("robustParameter", value)
-            elif key == "nrOfIterations":
-                s["nrOfIterations"] = readIntKey("nrOfIterations", value)
-            elif key == "cleaningThreshold":
-                s["cleaningThreshold"] = readFloatKey("cleaningThreshold", value)
-            elif key == "uvMin_klambda":
-                s["uvMin"] = readFloatKey("uvMin", value)
-            elif key == "uvMax_klambda":
-                s["uvMax"] = readFloatKey("uvMax", value)
-            elif key == "stokesToImage":
-                s["stokesToImage"] = readStringKey("stokesToImage", value)
-            elif key == "skyModel":
-                s["skyModel"] = readStringKey("skyModel", value)
-            elif key == "tbbPiggybackAllowed":
-                s["tbbPiggybackAllowed"] = readBoolKey("tbbPiggybackAllowed", value)
-            elif key == "aartfaacPiggybackAllowed":
-                s["aartfaacPiggybackAllowed"] = readBoolKey("aartfaacPiggybackAllowed", value)
-            elif key == "flaggingStrategy":
-                s["flaggingStrategy"] = readStringKey("flaggingStrategy", value)
-            elif key == "subbandsPerSubbandGroup":
-                s["subbandsPerSubbandGroup"] = readIntKey("subbandsPerSubbandGroup", value)
-            elif key == "subbandGroupsPerMS":
-                s["subbandGroupsPerMS"] = readIntKey("subbandGroupsPerMS", value)
-            elif key == "Global_BBS":
-                s["globalBBS"] = readGlobalBBS(value)
-            elif key == "Imaging_BBS":
-                s["imagingBBS"] = readImagingBBS(value)
-            elif key == "Global_Demix":
-                s["globalDemix"] = readGlobalDemix(value)
-            elif key == "Global_Pulsar":
-                s["globalPulsar"] = readGlobalPulsar(value)
-            elif key == "Global_Subbands":
-                s["globalSubbands"] = readGlobalSubbands(value)
-            elif key == "Global_TAB":
-                s["globalTAB"] = readTiedArrayBeams(lines) #, lineNr, nr_lines) # FIXME: readTiedArrayBeams takes single arg, also nr_lines is undefined!!!
-            elif key == "Global_TABrings":
-                s["globalTABrings"] = readGlobalTABrings(value)
-            elif key == "calibratorBeam":
-                s["calibratorBeam"], s["calibratorBBS"], s["calibratorDemix"], s["calibratorTAB"], \
-                s["create_calibrator_pipeline"] = \
-                    readCalibratorBeam(lineNr + 1, lines, s["globalSubbands"], s["globalTABrings"], s["globalBBS"],
-                                       s["globalDemix"], s["globalTAB"], s["coherentStokesData"], s["flysEye"])
-            elif key == 'targetBeams':
-                s["targetBeams"], s["targetBBS"], s["targetDemix"], s["targetPulsar"], s["targetTAB"], s["nr_beams"] = \
-                    readTargetBeams(lineNr + 1, lines, s["globalSubbands"], s["globalBBS"], s["globalDemix"],
-                                    s["globalPulsar"], s["globalTAB"], s["globalTABrings"], s["coherentStokesData"],
-                                    s["flysEye"], s["numberOfBitsPerSample"])
-            elif key == "repeat":
-                try:
-                    s["nrRepeats"] = int(value)
-                    print("number of repeats = %s" % s["nrRepeats"])
-                except:
-                    raise GenException("the repeat parameter is not valid for BLOCK: %i" % blockNr)
-            elif key == "cluster":
-                s["cluster"] = readStringKey("cluster", value)
-            elif key == "nr_tasks":
-                try:
-                    s["nr_tasks"] = int(value)
-                    print("number of tasks = %i" % s["nr_tasks"])
-                except:
-                    raise GenException("the number of tasks parameter is not valid for BLOCK: %i" % blockNr)
-            elif key == "nr_cores_per_task":
-                try:
-                    s["nr_cores_per_task"] = int(value)
-                    print("number of cores per task = %i" % s["nr_cores_per_task"])
-                except:
-                    raise GenException("the number of cores per task parameter is not valid for BLOCK: %i" % blockNr)
-            elif key == "nr_nodes":
-                try:
-                    s["nr_tasks"] = int(value) * DEFAULT_TASKS_PER_NODE
-                    s["nr_cores_per_task"] = DEFAULT_CORES_PER_TASK
-                    print("number of nodes found, converted to number of tasks = %i, number of cores per task = %i" % (
-                    s["nr_tasks"], s["nr_cores_per_task"]))
-                except:
-                    raise GenException("the number of nodes parameter is not valid for BLOCK: %i" % blockNr)
-            elif key == "storagemanager":
-                s["storagemanager"] = value
-            else:
-                raise GenException("unknown key:'%s' in BLOCK: %i" % (key, blockNr))
+    s = BlockSettings()
+
+    for key, value, section in tokenizeBlock(lines):
+        try:
+            fields, reader, defaults, required = BLOCK_KEYS[key]
+        except KeyError:
+            raise GenException("unknown key:'%s' in BLOCK: %i" % (key, blockNr))
+        value = reader(key, value, s, section, blockNr)
+        if isinstance(fields, tuple):
+            for field, fieldValue in zip(fields, value):
+                setattr(s, field, fieldValue)
+        else:
+            setattr(s, fields, value)
     return s  ##settings
 
 
 def checkSettings(settings, blockNr):
-    if "calibration_mode" not in settings:
-        raise GenException("the calibration parameter is not specified for BLOCK: %i" % blockNr)
-    elif settings["calibration_mode"] == "internal":
-        settings["create_target_cal_beam"] = True
-        if not "create_calibrator_observations" in settings:
-            settings["create_calibrator_observations"] = False
-    elif settings["calibration_mode"] == "external":
-        settings["create_calibrator_observations"] = True
-    elif settings["calibration_mode"] == "none":
-        settings["create_calibrator_observations"] = False
-    if "split_targets" not in settings:
-        raise GenException("the split_targets parameter is not specified for BLOCK: %i" % blockNr)
-    if "processing" not in settings:
-        raise GenException(
-            "the processing parameter has not been specified. It should be one of %s" % ", ".join(PROCESSING));
-    elif settings["processing"] == 'Pulsar':
-        if not (("coherentStokesData" in settings and settings["coherentStokesData"])
-                or ("incoherentStokesData" in settings and settings["incoherentStokesData"])):
+    for field, message in BLOCK_REQUIRED:
+        if getattr(settings, field) is None:
+            raise GenException(message % {'blockNr': blockNr})
+    if settings.calibration_mode == "internal":
+        settings.create_target_cal_beam = True
+        if settings.create_calibrator_observations is None:
+            settings.create_calibrator_observations = False
+    elif settings.calibration_mode == "external":
+        settings.create_calibrator_observations = True
+    elif settings.calibration_mode == "none":
+        settings.create_calibrator_observations = False
+    if settings.processing == 'Pulsar':
+        if not (settings.coherentStokesData or settings.incoherentStokesData):
             raise GenException(
                 "Pulsar processing requires one or both of coherentStokesData / incoherentStokesData to be set for BLOCK: %i" % blockNr)
-    elif settings["processing"] == 'Imaging' and settings["calibration_mode"] == "none":
+    elif settings.processing == 'Imaging' and settings.calibration_mode == "none":
         raise GenException(
             "processing=imaging requires calibration. While calibration is set to 'none' for BLOCK: %i" % blockNr)
-    elif settings["processing"] == 'Prefactor' and settings["calibration_mode"] == "none":
+    elif settings.processing == 'Prefactor' and settings.calibration_mode == "none":
         raise GenException(
             "processing=prefactor requires calibration. While calibration is set to 'none' for BLOCK: %i" % blockNr)
-    if settings["nr_beams"] == 0:
+    if settings.nr_beams == 0:
         raise GenException("no target beams have been specified for BLOCK: %i" % blockNr)
-    elif settings["calibration_mode"] == "none":
-        settings["create_target_cal_beam"] = False
-    if "packageName" not in settings:
-        raise GenException("the packageName is not specified for BLOCK: %i" % blockNr)
-    if "stationList" not in settings:
-        raise GenException("the stationList is not specified for BLOCK: %i" % blockNr)
-    if "antennaMode" not in settings:
-        raise GenException("the antennaMode is not specified for BLOCK: %i" % blockNr)
-    if "instrumentFilter" not in settings:
-        raise GenException("the instrumentFilter is not specified for BLOCK: %i" % blockNr)
-    if "integrationTime" not in settings and (
-            "correlatedData" in settings and settings["correlatedData"]):  # TODO can it be false?
-        raise GenException("the integrationTime is not specified for BLOCK: %i" % blockNr)
-    if settings["create_calibrator_observations"] or settings["calibration_mode"] == "external":
-        if settings["calibratorDuration_s"] == 0:
+    elif settings.calibration_mode == "none":
+        settings.create_target_cal_beam = False
+    if settings.calibration_mode == "external" and settings.create_target_cal_beam is None:
+        raise GenException("the create_target_cal_beam is not specified for BLOCK: %i" % blockNr)
+    if settings.create_calibrator_observations or settings.calibration_mode == "external":
+        if settings.calibratorDuration_s in (None, 0):
             raise GenException("the calibratorDuration_s is not specified for BLOCK: %i" % blockNr)
-    if (settings["calibration_mode"] != "none") and not settings["calibratorBeam"]:
+    if settings.set_starttime:  # the time steps are only used to compute the start times of the observations
+        if settings.timeStep1 in (None, ''):
+            raise GenException("the timeStep1 is not specified for BLOCK: %i" % blockNr)
+        if settings.create_calibrator_observations and settings.timeStep2 in (None, ''):
+            raise GenException("the timeStep2 is not specified for BLOCK: %i" % blockNr)
+    if (settings.calibration_mode != "none") and not settings.calibratorBeam:
         raise GenException(
             "the calibratorBeam is not specified while calibration parameter is not set to 'none' for BLOCK: %i" % blockNr)
-    if (not "calibratorBeam" in settings and settings[
-        "calibration_mode"] != "none"):  # calibration_mode is no calibrator beam
+    if (settings.calibratorBeam is None and settings.calibration_mode != "none"):  # calibration_mode is no calibrator beam
         raise GenException("the calibratorBeam is not specified for BLOCK: %i" % blockNr)
-    if ("targetDuration_s" not in settings):
-        raise GenException("the targetDuration_s is not specified for BLOCK: %i" % blockNr)
-    if "numberOfBitsPerSample" not in settings:
-        raise GenException("the numberOfBitsPerSample is not specified for BLOCK: %i" % blockNr)
-    if "channelsPerSubband" not in settings:
-        raise GenException("the channelsPerSubband is not specified for BLOCK: %i" % blockNr)
-    if "flysEye" in settings and settings["flysEye"] and not "coherentStokesData" in settings:
+    if settings.flysEye and settings.coherentStokesData is None:
         raise GenException(
             "FlysEye cannot be switched on when coherentStokesData is switched off, specified in BLOCK: %i" % blockNr)
 
-    if (settings["processing"] == 'Imaging') or (settings["processing"] == 'Prefactor'):
-        if "imagingPipeline" in settings:
-            if settings["imagingPipeline"] == 'none': # We also allow this for Prefactor, to not over complicate things
-                settings["do_imaging"] = False
+    if (settings.processing == 'Imaging') or (settings.processing == 'Prefactor'):
+        if settings.imagingPipeline is not None:
+            if settings.imagingPipeline == 'none': # We also allow this for Prefactor, to not over complicate things
+                settings.do_imaging = False
             else:
-                if not "nrSubbandsPerImage" in settings:
+                if settings.nrSubbandsPerImage is None:
                     raise GenException("the nrSubbandsPerImage is not specified for BLOCK: %i" % blockNr)
 
-                settings["do_imaging"] = True
-                if settings["imagingPipeline"] == 'standard':
-                    settings["imaging_pipe_type"] = 'ImagingPipelineType'
-                    if settings["antennaMode"].startswith("HBA"):
-                        settings["imaging_pipe_default_template"] = "Imaging Pipeline HBA"
+                settings.do_imaging = True
+                if settings.imagingPipeline == 'standard':
+                    settings.imaging_pipe_type = 'ImagingPipelineType'
+                    if settings.antennaMode.startswith("HBA"):
+                        settings.imaging_pipe_default_template = "Imaging Pipeline HBA"
                     else:
-                        settings["imaging_pipe_default_template"] = "Imaging Pipeline LBA"
-                elif settings["imagingPipeline"] == 'MSSS':
-                    settings["imaging_pipe_type"] = 'ImagingPipelineMSSSType'
-                    settings["imaging_pipe_default_template"] = "MSSS Imaging Pipeline"
+                        settings.imaging_pipe_default_template = "Imaging Pipeline LBA"
+                elif settings.imagingPipeline == 'MSSS':
+                    settings.imaging_pipe_type = 'ImagingPipelineMSSSType'
+                    settings.imaging_pipe_default_template = "MSSS Imaging Pipeline"
                 #TODO: Will need to be uncommented when a 'PREFACTOR' default template goes into production.
-                #elif settings["imagingPipeline"] == 'Prefactor':
-                #    settings["imaging_pipe_type"] = 'Prefactor'
-                #    settings["imaging_pipe_default_template"] = "PREFACTOR"
-                settings["imaging_pipe_duration"] = 0  # img pipeline duration placeholder, MoM rejects <duration></duration>
+                #elif settings.imagingPipeline == 'Prefactor':
+                #    settings.imaging_pipe_type = 'Prefactor'
+                #    settings.imaging_pipe_default_template = "PREFACTOR"
+                settings.imaging_pipe_duration = 0  # img pipeline duration placeholder, MoM rejects <duration></duration>
                 # determine nrImages
-                settings["nrImages"] = determineNrImages(settings["targetBeams"], settings["nrSubbandsPerImage"],
+                settings.nrImages = determineNrImages(settings.targetBeams, settings.nrSubbandsPerImage,
                                                          "nrSubbandsPerImage")
         else:
             raise GenException(
-                "the 'imagingPipeline' type parameter has not been specified while processing is set to %s" % settings["processing"] +
+                "the 'imagingPipeline' type parameter has not been specified while processing is set to %s" % settings.processing +
                 ". imagingPipeline should be one of: MSSS, standard or none");
     else:
-        settings["do_imaging"] = False
+        settings.do_imaging = False
 
-    if settings["processing"] == "LongBaseline":  # TODO issue 8357, needs better function name
-        if (settings["calibration_mode"] == "none"):
+    if settings.processing == "LongBaseline":  # TODO issue 8357, needs better function name
+        if (settings.calibration_mode == "none"):
             raise GenException("LongBaseline does not work with calibration=none for BLOCK: %i" % blockNr)
-        determineNrImages(settings["targetBeams"], settings["subbandsPerSubbandGroup"], "subbandsPerSubbandGroup")
-        determineNrImages(settings["targetBeams"], settings["subbandGroupsPerMS"], "subbandGroupsPerMS")
-
-    if not "flaggingStrategy" in settings:
-        if settings["antennaMode"].startswith("LBA"):
-            settings["flaggingStrategy"] = "LBAdefault"
+        for field in ("subbandsPerSubbandGroup", "subbandGroupsPerMS"):
+            if getattr(settings, field) is None:
+                raise GenException("the %s is not specified for BLOCK: %i" % (field, blockNr))
+        determineNrImages(settings.targetBeams, settings.subbandsPerSubbandGroup, "subbandsPerSubbandGroup")
+        determineNrImages(settings.targetBeams, settings.subbandGroupsPerMS, "subbandGroupsPerMS")
+
+    if settings.flaggingStrategy is None:
+        if settings.antennaMode.startswith("LBA"):
+            settings.flaggingStrategy = "LBAdefault"
         else:
-            settings["flaggingStrategy"] = "HBAdefault"
+            settings.flaggingStrategy = "HBAdefault"
 
-    checkAntennaModeInstrumentFilterAndClockCombination(settings["antennaMode"], settings["instrumentFilter"],
-                                                        settings["clock"])
+    checkAntennaModeInstrumentFilterAndClockCombination(settings.antennaMode, settings.instrumentFilter,
+                                                        settings.clock)
 
-    settings["writePackageTag"] = "packageTag" in settings and settings["packageTag"]
+    settings.writePackageTag = settings.packageTag != ''
 
-    if "nr_tasks" in settings:
-        if "nr_cores_per_task" not in settings:
+    if settings.nr_tasks is not None:
+        if settings.nr_cores_per_task is None:
             printInfo("number of tasks found, but no number of cores, taking default number of cores per task = %i" % (
             DEFAULT_CORES_PER_TASK,))
+            settings.nr_cores_per_task = DEFAULT_CORES_PER_TASK
 
-    if "storagemanager" in settings:
-        if settings["storagemanager"] not in ["", "dysco"]:
+    if settings.storagemanager is not None:
+        if settings.storagemanager not in ["", "dysco"]:
             raise GenException("The storagemanager was set to an invalid value of: %s for BLOCK: %i" %
-                               (settings["storagemanager"], blockNr))
+                               (settings.storagemanager, blockNr))
 
     return settings
 
 
-def writeImagingPipeline(ofile, nr_beams, targetBeams, blockTopo, nrRepeats,
+class TaskNode(Record):
+    '''
+    An observation, measurement or pipeline in a TaskGraph. Its XML is written by writer(ofile, *args, **kwargs).
+    writer, args and kwargs are None for the nodes of a repeat written from a RepeatTemplate, as the template holds
+    their XML.
+    '''
+    __slots__ = ('topology', 'kind', 'name', 'predecessors', 'inputs', 'outputs', 'writer', 'args', 'kwargs')
+
+    def toDict(self):
+        return {'topology': self.topology, 'kind': self.kind, 'name': self.name, 'predecessors': self.predecessors,
+                'inputs': self.inputs, 'outputs': self.outputs}
+
+
+# The writers that add a node to a TaskGraph. For each writer: the kind of node and the names of the arguments that
+# hold its topology, its name, its predecessor topologies (a comma separated string) and its input and output data
+# product topologies (each a string or a list of strings).
+NODE_WRITERS = {
+    writeXMLObs: ('observation', 'topo', 'name', 'predecessor_topo', (), ()),
+    writeXMLBeam: ('measurement', 'topo', 'name', None, (), ()),
+    writeXMLCalPipe: ('pipeline', 'topo', 'name', 'pred_topo', ('uvintopo',), ('instrouttopo', 'uvouttopo')),
+    writeXMLTargetPipeline: ('pipeline', 'topo', 'name', 'pred_topo', ('uvintopo', 'instrintopo'),
+                             ('uvouttopo', 'instrouttopo')),
+    writeXMLAvgPipeline: ('pipeline', 'topo', 'name', 'pred_topo', ('uvintopo',), ('uvouttopo',)),
+    writeXMLPulsarPipe: ('pipeline', 'topo', 'name', 'pred_topo', ('bfintopo',), ('pouttopo',)),
+    writeXMLLongBaselinePipe: ('pipeline', 'topo', 'name', 'pred_topo', ('uvintopo',), ('uvouttopo',)),
+    writeXMLImagingPipe: ('pipeline', 'topo', 'name', 'pred_topo', ('uvintopos',), ('skyouttopo',)),
+}
+
+
+def argumentPositions(writer):
+    '''
+    Returns (name, index in args) for the arguments of writer(ofile, *args, **kwargs) that NODE_WRITERS refers to
+    '''
+    kind, topologyName, nameName, predecessorName, inputNames, outputNames = NODE_WRITERS[writer]
+    names = (topologyName, nameName, predecessorName) + inputNames + outputNames
+    parameters = list(inspect.signature(writer).parameters)[1:]
+    return tuple((name, parameters.index(name)) for name in names if name)
+
+
+# Binding the arguments with inspect.Signature for every node made writing the XML several times slower
+NODE_ARGUMENTS = {writer: argumentPositions(writer) for writer in NODE_WRITERS}
+
+
+def topologyList(arguments, names):
+    topologies = []
+    for name in names:
+        value = arguments[name]
+        topologies += [value] if isinstance(value, str) else value
+    return [topology for topology in topologies if topology]
+
+
+class TaskGraph(object):
+    '''
+    The observations, measurements and pipelines of a BLOCK, with the predecessor and data product dependencies
+    between them. writeRepeat and writeImagingPipeline add the nodes (and the XML that goes around them) in document
+    order; validate() checks the dependencies and serialize() writes the XML in a separate pass. A data product is
+    produced by the node whose topology is the longest prefix of its topology, e.g. 1.T.SAP000.uv.dps by 1.T.SAP000.
+    '''
+
+    def __init__(self, blockNr=None):
+        self.blockNr = blockNr
+        self.nodes = {}  # topology -> TaskNode, in document order
+        self.steps = []  # (writer, args, kwargs) for all XML, in document order
+
+    def add(self, writer, *args, **kwargs):
+        '''
+        Add the node written by writer(ofile, *args, **kwargs), which must be one of NODE_WRITERS
+        '''
+        kind, topologyName, nameName, predecessorName, inputNames, outputNames = NODE_WRITERS[writer]
+        arguments = {name: args[index] if index < len(args) else kwargs[name]
+                     for name, index in NODE_ARGUMENTS[writer]}
+        predecessors = arguments[predecessorName].split(',') if predecessorName else []
+        node = TaskNode(arguments[topologyName], kind, arguments[nameName],
+                        [topology.strip() for topology in predecessors if topology.strip()],
+                        topologyList(arguments, inputNames), topologyList(arguments, outputNames), writer, args, kwargs)
+        self.insert(node)
+        self.steps.append((writer, args, kwargs))
+        return node
+
+    def insert(self, node):
+        '''
+        Add node to the graph without adding its XML. Only the first node with a topology is part of the graph: Prefactor
+        with internal calibration writes two calibrator pipelines with the same .CPP topology, which is valid input.
+        '''
+        if node.topology not in self.nodes:
+            self.nodes[node.topology] = node
+
+    def write(self, writer, *args, **kwargs):
+        '''
+        Add XML that is not a node, like the start and end of a folder or observation
+        '''
+        self.steps.append((writer, args, kwargs))
+
+    def groups(self):
+        '''
+        Returns the observations below each topology that is a prefix of an observation topology, in document order
+        '''
+        groups = {}
+        for node in self.nodes.values():
+            if node.kind == 'observation':
+                parts = node.topology.split('.')
+                for end in range(1, len(parts)):
+                    groups.setdefault('.'.join(parts[:end]), []).append(node.topology)
+        return groups
+
+    def resolve(self, topology, groups=None):
+        '''
+        Returns the nodes a predecessor topology refers to: the node itself or, if there is no such node, the group of
+        observations below it (the target observations B0.1.T.0, B0.1.T.1, ... for B0.1.T with split targets).
+        groups is the result of groups(), to resolve many topologies.
+        '''
+        if topology in self.nodes:
+            return [topology]
+        return (self.groups() if groups is None else groups).get(topology, [])
+
+    def producer(self, dataProduct):
+        topology = dataProduct
+        while '.' in topology:
+            topology = topology.rsplit('.', 1)[0]
+            if topology in self.nodes:
+                return topology
+        return None
+
+    def edges(self):
+        '''
+        Returns the (source, target, type, topology) edges, where type is 'predecessor' or 'dataproduct' and
+        topology is the predecessor or data product that target refers to. source is None if it does not exist.
+        '''
+        edges = []
+        groups = self.groups()
+        for node in self.nodes.values():
+            for predecessor in node.predecessors:
+                edges += [(source, node.topology, 'predecessor', predecessor)
+                          for source in self.resolve(predecessor, groups) or [None]]
+            edges += [(self.producer(dataProduct), node.topology, 'dataproduct', dataProduct)
+                      for dataProduct in node.inputs]
+        return edges
+
+    def validate(self):
+        '''
+        Check the dependencies in O(nodes + edges) with Kahn's algorithm. Raises GenException if they have a cycle.
+        Predecessors and input data products that are not in the BLOCK are skipped without a warning: the writers
+        refer to tasks outside the BLOCK on purpose (e.g. the calibrator of a split_targets Prefactor BLOCK, or the
+        predecessors of a calibrator pipeline), and MoM resolves them.
+        '''
+        successors = {topology: [] for topology in self.nodes}
+        inDegree = dict.fromkeys(self.nodes, 0)
+        for source, target, edgeType, topology in self.edges():
+            if source is None:
+                continue
+            successors[source].append(target)
+            inDegree[target] += 1
+        ready = deque(topology for topology, degree in inDegree.items() if degree == 0)
+        nrSorted = 0
+        while ready:
+            topology = ready.popleft()
+            nrSorted += 1
+            for successor in successors[topology]:
+                inDegree[successor] -= 1
+                if inDegree[successor] == 0:
+                    ready.append(successor)
+        if nrSorted < len(self.nodes):
+            raise GenException("cyclic dependency between %s in BLOCK: %s" % (
+                ", ".join(topology for topology, degree in inDegree.items() if degree > 0), self.blockNr))
+
+    def serialize(self, ofile):
+        for writer, args, kwargs in self.steps:
+            writer(ofile, *args, **kwargs)
+
+    def toDict(self):
+        return {'block': self.blockNr, 'nodes': [node.toDict() for node in self.nodes.values()],
+                'edges': [{'from': source, 'to': target, 'type': edgeType, 'topology': topology}
+                          for (source, target, edgeType, topology) in self.edges()]}
+
+
+def writeImagingPipeline(graph, nr_beams, targetBeams, blockTopo, nrRepeats,
                          imaging_pipe_inputs, imaging_pipe_predecessors, writePackageTag, packageTag,
                          nrImages, imagingPipelineSettings, imagingBBS, cluster, status, nr_tasks, nr_cores_per_task,
                          miscParameters):
     for beamNr in range(0, nr_beams):
-        create_pipeline = targetBeams[beamNr][7]
+        create_pipeline = targetBeams[beamNr].createPipeline
         if create_pipeline:
             imaging_pipe_topology = blockTopo + 'PI' + str(beamNr)  # 1.PI
             imaging_pipe_output_topology = imaging_pipe_topology + '.sky.dps'  # 1.PI.dps
@@ -1970,19 +2770,19 @@ def writeImagingPipeline(ofile, nr_beams, targetBeams, blockTopo, nrRepeats,
             # ****** ADD AN IMAGING PIPELINE FOR EVERY TARGET BEAM ******
 
             if writePackageTag:
-                imaging_pipe_name = packageTag + "/" + targetBeams[beamNr][2] + "/IM"
+                imaging_pipe_name = packageTag + "/" + targetBeams[beamNr].target + "/IM"
             else:
-                imaging_pipe_name = targetBeams[beamNr][2] + "/IM"
+                imaging_pipe_name = targetBeams[beamNr].target + "/IM"
 
             temp = {"imaging_pipe_topology": imaging_pipe_topology,
                     "imaging_pipe_predecessors_string": imaging_pipe_predecessors_string,
                     "imaging_pipe_name": imaging_pipe_name, "beamNr": beamNr,
                     "nrImages": nrImages[beamNr], "nrRepeats": nrRepeats, "initial_status": status}
 
-            writeImagingPipelineXML(ofile, merge_dicts(temp, imagingPipelineSettings), imagingBBS, cluster, status,
-                                    nr_tasks, nr_cores_per_task, miscParameters)
-            writeImagingPipelineInputDataproducts(ofile, imaging_pipe_inputs[beamNr])
-            writeSkyImageOutputDataproduct(ofile, imaging_pipe_output_topology, cluster)
+            graph.add(writeXMLImagingPipe, imaging_pipe_topology, imaging_pipe_predecessors_string, imaging_pipe_name,
+                      merge_dicts(temp, imagingPipelineSettings), imaging_pipe_inputs[beamNr],
+                      imaging_pipe_output_topology, imagingBBS, cluster, status, nr_tasks, nr_cores_per_task,
+                      miscParameters)
 
 
 def determineBfDataExtension(coherentStokesData, incoherentStokesData):
@@ -1997,7 +2797,7 @@ def determineBfDataExtension(coherentStokesData, incoherentStokesData):
     return bfDataExtension
 
 
-def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_inputs,
+def writeRepeat(graph, projectName, blockTopo, repeatNr, settings, imaging_pipe_inputs,
                 imaging_pipe_predecessors, status, nr_tasks, nr_cores_per_task, miscParameters):
 
     # This is to get rid of the crazy hack that declared all keys in settings as a local variable. I first tried to
@@ -2007,14 +2807,14 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
     # accessing things on demand in the code paths where they are actually required, to have no impact on behavior.
 
     # These items from settings are used on top level, so they must be there:
-    try:
-        processing = settings['processing']
-        coherentStokesData = settings['coherentStokesData']
-        incoherentStokesData = settings['incoherentStokesData']
-        nr_beams = settings['nr_beams']
-    except KeyError as ex:
-        print(ex)
-        raise GenException("Could not read required setting! (%s)" % ex.message)
+    missing = [name for name in ("processing", "coherentStokesData", "incoherentStokesData", "nr_beams")
+               if getattr(settings, name) is None]
+    if missing:
+        raise GenException("Could not read required setting! (%s)" % ", ".join(missing))
+    processing = settings.processing
+    coherentStokesData = settings.coherentStokesData
+    incoherentStokesData = settings.incoherentStokesData
+    nr_beams = settings.nr_beams
 
     repeatTopo = blockTopo + str(repeatNr)
 
@@ -2043,14 +2843,14 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
     prepipe_calibrator_topology = repeatTopo + '.CPP'  # 1.CPP , work around for bug SW-681 in MoM, avoid re-using a topology.
 
     if processing == 'Imaging':
-        if settings['calibration_mode'] == "internal":
+        if settings.calibration_mode == "internal":
             cal_obs_pipe_default_template = "Calibrator Pipeline (export)"
             cal_tar_pipe_default_template = "Calibrator Pipeline (no export)"
             cal_pipe_calibrator_description = "Cal Pipe Calibrator"
             cal_pipe_target_description = "Cal Pipe Target"
             tar_pipe_predecessor = tar_obs_topology + ',' + cal_pipe_target_topology  # 1.T,1.CPT
             tar_pipe_input_INST_topo = cal_pipe_target_topology + '.inst.dps'  # 1.P1.dps
-        elif settings['calibration_mode'] == "external":
+        elif settings.calibration_mode == "external":
             cal_obs_pipe_default_template = "Calibrator Pipeline (export)"
             cal_tar_pipe_default_template = "Calibrator Pipeline (no export)"
             cal_pipe_calibrator_description = "Cal Pipe Calibrator"
@@ -2075,14 +2875,14 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
         # pulsar_pipe_predecessor = tar_obs_topology
         pulsar_pipe_default_template = "Pulsar Pipeline"
     elif processing == 'LongBaseline':
-        if settings['calibration_mode'] == "internal":  # internal calibration (previously Calbeam)
+        if settings.calibration_mode == "internal":  # internal calibration (previously Calbeam)
             cal_obs_pipe_default_template = "Calibrator Pipeline (export)"
             cal_tar_pipe_default_template = "Calibrator Pipeline (no export)"
             cal_pipe_calibrator_description = "Cal Pipe Calibrator"
             cal_pipe_target_description = "Cal Pipe Target"
             tar_pipe_predecessor = tar_obs_topology + ',' + cal_pipe_target_topology  # 1.T,1.CPT
             tar_pipe_input_INST_topo = cal_pipe_target_topology + '.inst.dps'  # 1.P1.dps
-        elif settings['calibration_mode'] == "external":  # external calibration (previously calObs)
+        elif settings.calibration_mode == "external":  # external calibration (previously calObs)
             cal_obs_pipe_default_template = "Calibrator Pipeline (export)"
             cal_tar_pipe_default_template = "Calibrator Pipeline (no export)"
             cal_pipe_calibrator_description = "Cal Pipe Calibrator"
@@ -2102,7 +2902,7 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
         cal_pipe_calibrator_description = "Prefactor Calibrator C"
         cal_pipe_target_description = "Prefactor Calibrator T" #Maybe this is for "internal" calibration? It's not for the Target Calibration
         cal_pipe_predecessor = prepipe_calibrator_topology #1.CPP
-        if settings['calibration_mode'] == "internal":
+        if settings.calibration_mode == "internal":
             tar_pipe_input_INST_topo = cal_pipe_target_topology + '.inst.dps'  # 1.P1.dps
         #    raise GenException('Prefactor mode currently does not support an internal calibration beam.')
         else:
@@ -2112,11 +2912,11 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
 
     for beamNr in range(0, nr_beams):
         beam_nr_str = str(beamNr)
-        if settings['create_calibrator_observations']:
-            if settings['writePackageTag']:
-                cal_obs_name = settings['packageTag'] + "/" + settings['calibratorBeam'][2] + "/" + str(repeatNr) + "/CO"
+        if settings.create_calibrator_observations:
+            if settings.writePackageTag:
+                cal_obs_name = settings.packageTag + "/" + settings.calibratorBeam.target + "/" + str(repeatNr) + "/CO"
             else:
-                cal_obs_name = settings['calibratorBeam'][2] + "/" + str(repeatNr) + "/CO"
+                cal_obs_name = settings.calibratorBeam.target + "/" + str(repeatNr) + "/CO"
 
         # TODO: for multiObs this is not ok. The SAP numbers should start from scratch again with every new target observation
         # and there should be a .beamnr added before the .SAP in the topology
@@ -2140,11 +2940,11 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
             LB_pipeline_input_uv_topologies.append(LB_preproc_pipe_output_MS_topologies[beamNr])
             LB_pipeline_output_uv_topologies.append(LB_pipeline_topologies[beamNr] + ".uv.dps")
 
-        if settings['do_imaging']:
+        if settings.do_imaging:
             imaging_pipe_inputs[beamNr].append(tar_pipe_topologies[beamNr] + ".uv.dps")
             imaging_pipe_predecessors[beamNr].append(tar_pipe_topologies[beamNr])
 
-    if "create_extra_ncp_beam" in settings and settings["create_extra_ncp_beam"]:
+    if settings.create_extra_ncp_beam:
         tarObsCalBeamDataTopoStr = tar_obs_topology + ".SAP%03i" % (nr_beams + 1,)
     else:
         tarObsCalBeamDataTopoStr = tar_obs_topology + ".SAP%03i" % (nr_beams,)
@@ -2153,116 +2953,116 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
     tar_obs_uv_data_topologies.append(tarObsCalBeamDataTopoStr + ".uv.dps")
 
     tar_obs_predecessor = ''
-    if settings['create_calibrator_observations']:
+    if settings.create_calibrator_observations:
         tar_obs_predecessor = cal_obs_topology  # 1.C
-        if settings['set_starttime']:
-            startTimeStr = settings['startTimeObs'].strftime('%Y-%m-%dT%H:%M:%S')
-            endTimeStr = (settings['startTimeObs'] + timedelta(seconds=settings['calibratorDuration_s'])).strftime('%Y-%m-%dT%H:%M:%S')
+        if settings.set_starttime:
+            startTimeStr = settings.startTimeObs.strftime('%Y-%m-%dT%H:%M:%S')
+            endTimeStr = (settings.startTimeObs + timedelta(seconds=settings.calibratorDuration_s)).strftime('%Y-%m-%dT%H:%M:%S')
         else:
             startTimeStr = ''
             endTimeStr = ''
 
-        writeXMLObs(ofile,
-                    cal_obs_name,              # FIXME: Might be undefined
-                    cal_obs_name + ' (Calibration Observation)',
-                    cal_obs_topology,
-                    '',
-                    cal_obs_name,
-                    projectName,
-                    settings['tbbPiggybackAllowed'],
-                    settings['aartfaacPiggybackAllowed'],
-                    settings['correlatedData'],
-                    coherentStokesData,
-                    incoherentStokesData,
-                    settings['antennaMode'],
-                    settings['clock'],
-                    settings['instrumentFilter'],
-                    settings['integrationTime'],
-                    settings['channelsPerSubband'],
-                    settings['coherentDedisperseChannels'],
-                    settings['flysEye'],
-                    settings['subbandsPerFileCS'],
-                    settings['numberCollapsedChannelsCS'],
-                    settings['stokesDownsamplingStepsCS'],
-                    settings['whichCS'],
-                    settings['subbandsPerFileIS'],
-                    settings['numberCollapsedChannelsIS'],
-                    settings['stokesDownsamplingStepsIS'],
-                    settings['whichIS'],
-                    settings['stationList'],
-                    startTimeStr,
-                    endTimeStr,
-                    settings['calibratorDuration_s'],
-                    settings['numberOfBitsPerSample'],
-                    status)
-
-        calibratorBeam = settings['calibratorBeam']
-        writeXMLBeam(ofile,
-                     calibratorBeam[2],
-                     calibratorBeam[2],
-                     cal_obs_beam0_topology,
-                     'Calibration',
-                     calibratorBeam[2],
-                     calibratorBeam[0],
-                     calibratorBeam[1],
-                     calibratorBeam[3],
-                     settings['flysEye'],
-                     str(calibratorBeam[5]),
-                     str(calibratorBeam[6]),
-                     writeTABXML(settings['calibratorTAB']),
-                     writeDataProducts(cal_obs_beam0_topology,
-                                       settings['correlatedData'],
-                                       coherentStokesData,
-                                       incoherentStokesData,
-                                       settings['cluster']),
-                     status)
-        writeXMLObsEnd(ofile)
+        graph.add(writeXMLObs,
+                  cal_obs_name,              # FIXME: Might be undefined
+                  cal_obs_name + ' (Calibration Observation)',
+                  cal_obs_topology,
+                  '',
+                  cal_obs_name,
+                  projectName,
+                  settings.tbbPiggybackAllowed,
+                  settings.aartfaacPiggybackAllowed,
+                  settings.correlatedData,
+                  coherentStokesData,
+                  incoherentStokesData,
+                  settings.antennaMode,
+                  settings.clock,
+                  settings.instrumentFilter,
+                  settings.integrationTime,
+                  settings.channelsPerSubband,
+                  settings.coherentDedisperseChannels,
+                  settings.flysEye,
+                  settings.subbandsPerFileCS,
+                  settings.numberCollapsedChannelsCS,
+                  settings.stokesDownsamplingStepsCS,
+                  settings.whichCS,
+                  settings.subbandsPerFileIS,
+                  settings.numberCollapsedChannelsIS,
+                  settings.stokesDownsamplingStepsIS,
+                  settings.whichIS,
+                  settings.stationList,
+                  startTimeStr,
+                  endTimeStr,
+                  settings.calibratorDuration_s,
+                  settings.numberOfBitsPerSample,
+                  status)
+
+        calibratorBeam = settings.calibratorBeam
+        graph.add(writeXMLBeam,
+                  calibratorBeam.target,
+                  calibratorBeam.target,
+                  cal_obs_beam0_topology,
+                  'Calibration',
+                  calibratorBeam.target,
+                  calibratorBeam.ra,
+                  calibratorBeam.dec,
+                  calibratorBeam.subbands,
+                  settings.flysEye,
+                  str(calibratorBeam.nrTabRings),
+                  str(calibratorBeam.tabRingSize),
+                  writeTABXML(settings.calibratorTAB),
+                  writeDataProducts(cal_obs_beam0_topology,
+                                    settings.correlatedData,
+                                    coherentStokesData,
+                                    incoherentStokesData,
+                                    settings.cluster),
+                  status)
+        graph.write(writeXMLObsEnd)
 
     # target start and end time:
-    if settings['set_starttime']:
-        if settings['create_calibrator_observations']:
-            settings['startTimeObs'] = settings['startTimeObs'] + timedelta(seconds=settings['timeStep1'] + settings['calibratorDuration_s'])
-        startTimeStr = settings['startTimeObs'].strftime('%Y-%m-%dT%H:%M:%S')
-        endTimeStr = (settings['startTimeObs'] + timedelta(seconds=settings['targetDuration_s'])).strftime('%Y-%m-%dT%H:%M:%S')
+    if settings.set_starttime:
+        if settings.create_calibrator_observations:
+            settings.startTimeObs = settings.startTimeObs + timedelta(seconds=settings.timeStep1 + settings.calibratorDuration_s)
+        startTimeStr = settings.startTimeObs.strftime('%Y-%m-%dT%H:%M:%S')
+        endTimeStr = (settings.startTimeObs + timedelta(seconds=settings.targetDuration_s)).strftime('%Y-%m-%dT%H:%M:%S')
     else:
         startTimeStr = ''
         endTimeStr = ''
 
-    if settings['create_calibrator_observations'] and settings['create_calibrator_pipeline']:
+    if settings.create_calibrator_observations and settings.create_calibrator_pipeline:
 
-        if settings['writePackageTag']:
-            cal_pipe_name = settings['packageTag'] + "/" + settings['calibratorBeam'][2] + "/" + str(repeatNr) + "/CPC"
+        if settings.writePackageTag:
+            cal_pipe_name = settings.packageTag + "/" + settings.calibratorBeam.target + "/" + str(repeatNr) + "/CPC"
         else:
-            cal_pipe_name = settings['calibratorBeam'][2] + "/" + str(repeatNr) + "/CPC"
+            cal_pipe_name = settings.calibratorBeam.target + "/" + str(repeatNr) + "/CPC"
 
         if processing == 'Imaging' or processing == 'LongBaseline':
-            calibratorBBS = settings['calibratorBBS']
+            calibratorBBS = settings.calibratorBBS
             if not calibratorBBS:
                 raise GenException("BBS SkyModel is not specified for pipeline coupled to calibrator beam")
 
-            writeXMLCalPipe(ofile,
-                            cal_pipe_calibrator_topology,
-                            cal_obs_topology,
-                            cal_pipe_name,
-                            cal_pipe_calibrator_description,
-                            cal_obs_pipe_default_template,
-                            settings['flaggingStrategy'],
-                            settings['calibratorBeam'][8],
-                            calibratorBBS[0][0],
-                            settings['calibratorDemix'][0],
-                            calibratorBBS[0][1:],
-                            cal_obs_beam0_topology + '.uv.dps',
-                            cal_pipe_calibrator_topology + '.inst.dps',
-                            cal_pipe_calibrator_topology + '.inst.dps',
-                            cal_pipe_calibrator_topology + '.uv.dps',
-                            settings['cluster'],
-                            status,
-                            nr_tasks,
-                            nr_cores_per_task,
-                            miscParameters)
+            graph.add(writeXMLCalPipe,
+                      cal_pipe_calibrator_topology,
+                      cal_obs_topology,
+                      cal_pipe_name,
+                      cal_pipe_calibrator_description,
+                      cal_obs_pipe_default_template,
+                      settings.flaggingStrategy,
+                      settings.calibratorBeam.duration,
+                      calibratorBBS[0].skyModel,
+                      settings.calibratorDemix[0],
+                      calibratorBBS[0],
+                      cal_obs_beam0_topology + '.uv.dps',
+                      cal_pipe_calibrator_topology + '.inst.dps',
+                      cal_pipe_calibrator_topology + '.inst.dps',
+                      cal_pipe_calibrator_topology + '.uv.dps',
+                      settings.cluster,
+                      status,
+                      nr_tasks,
+                      nr_cores_per_task,
+                      miscParameters)
 
         elif processing == 'Preprocessing':
-            calibratorDemix = settings['calibratorDemix']
+            calibratorDemix = settings.calibratorDemix
             for i in range(0, len(calibratorDemix)):
                 if len(calibratorDemix) > 1:  # TODO a cludge right now, but want to refactor how to call the writeXML soon
                     cal_pipe_calibrator_topology_tmp = cal_pipe_calibrator_topology + ".%i" % i
@@ -2271,252 +3071,252 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
                     cal_pipe_calibrator_topology_tmp = cal_pipe_calibrator_topology
                     cal_pipe_name_tmp = cal_pipe_name
 
-                writeXMLAvgPipeline(ofile,
-                                    cal_pipe_calibrator_topology_tmp,
-                                    cal_obs_topology,
-                                    cal_pipe_name_tmp,
-                                    cal_pipe_calibrator_description,
-                                    cal_obs_pipe_default_template,
-                                    settings['flaggingStrategy'],
-                                    settings['calibratorBeam'][8],
-                                    calibratorDemix[i],
-                                    cal_obs_beam0_topology + '.uv.dps',
-                                    cal_pipe_calibrator_topology_tmp + '.uv.dps',
-                                    settings['cluster'],
-                                    status,
-                                    nr_tasks,
-                                    nr_cores_per_task,
-                                    miscParameters)
+                graph.add(writeXMLAvgPipeline,
+                          cal_pipe_calibrator_topology_tmp,
+                          cal_obs_topology,
+                          cal_pipe_name_tmp,
+                          cal_pipe_calibrator_description,
+                          cal_obs_pipe_default_template,
+                          settings.flaggingStrategy,
+                          settings.calibratorBeam.duration,
+                          calibratorDemix[i],
+                          cal_obs_beam0_topology + '.uv.dps',
+                          cal_pipe_calibrator_topology_tmp + '.uv.dps',
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task,
+                          miscParameters)
 
         elif processing == 'Calibration':
 
-            calibratorBBS = settings['calibratorBBS']
+            calibratorBBS = settings.calibratorBBS
             if not calibratorBBS:
                 raise GenException("BBS SkyModel is not specified for pipeline coupled to calibrator beam")
 
-            # TODO ['', '', '', '', '', '', ''] is really ugly, this will break the regression test
-            writeXMLCalPipe(ofile,
-                            cal_pipe_calibrator_topology,
-                            cal_obs_topology,
-                            cal_pipe_name,
-                            cal_pipe_calibrator_description,
-                            cal_obs_pipe_default_template,
-                            settings['flaggingStrategy'],
-                            settings['calibratorBeam'][8],
-                            calibratorBBS[0][0],
-                            settings['calibratorDemix'][0],
-                            ['', '', '', '', '', '', ''],
-                            cal_obs_beam0_topology + '.uv.dps',
-                            cal_pipe_calibrator_topology + '.inst.dps',
-                            cal_pipe_calibrator_topology + '.inst.dps',
-                            cal_pipe_calibrator_topology + '.uv.dps',
-                            settings['cluster'],
-                            status,
-                            nr_tasks,
-                            nr_cores_per_task,
-                            miscParameters)
+            # TODO the empty BBS parameters are really ugly, leaving them out will break the regression test
+            graph.add(writeXMLCalPipe,
+                      cal_pipe_calibrator_topology,
+                      cal_obs_topology,
+                      cal_pipe_name,
+                      cal_pipe_calibrator_description,
+                      cal_obs_pipe_default_template,
+                      settings.flaggingStrategy,
+                      settings.calibratorBeam.duration,
+                      calibratorBBS[0].skyModel,
+                      settings.calibratorDemix[0],
+                      BBSParameters(beamModelEnable=''),
+                      cal_obs_beam0_topology + '.uv.dps',
+                      cal_pipe_calibrator_topology + '.inst.dps',
+                      cal_pipe_calibrator_topology + '.inst.dps',
+                      cal_pipe_calibrator_topology + '.uv.dps',
+                      settings.cluster,
+                      status,
+                      nr_tasks,
+                      nr_cores_per_task,
+                      miscParameters)
 
         elif processing == 'Prefactor':
-            calibratorBBS = settings['calibratorBBS']
+            calibratorBBS = settings.calibratorBBS
             if not calibratorBBS:
                 raise GenException("BBS SkyModel is not specified for pipeline coupled to calibrator beam")
-            calibratorDemix = settings['calibratorDemix']
+            calibratorDemix = settings.calibratorDemix
             if len(calibratorDemix) > 1:
                 raise GenException("calibratorDemix > 1 not supported in Prefactor right now.")
-            writeXMLAvgPipeline(ofile,
-                                prepipe_calibrator_topology,
-                                cal_obs_topology,
-                                cal_pipe_name[:-1] + "P", # To work around bug SW-681 in MoM, we should not re-use a topology
-                                prepipe_calibrator_description,
-                                cal_prepipe_default_template,
-                                settings['flaggingStrategy'],
-                                settings['calibratorBeam'][8],
-                                calibratorDemix[0],
-                                cal_obs_beam0_topology + '.uv.dps',
-                                prepipe_calibrator_topology + '.uv.dps',
-                                settings['cluster'],
-                                status,
-                                nr_tasks,
-                                nr_cores_per_task,
-                                miscParameters)
-
-            # TODO ['', '', '', '', '', '', ''] is really ugly, this will break the regression test
-            writeXMLCalPipe(ofile,
-                            cal_pipe_calibrator_topology,
-                            cal_pipe_predecessor,
-                            cal_pipe_name,
-                            cal_pipe_calibrator_description,
-                            cal_obs_pipe_default_template,
-                            settings['flaggingStrategy'],
-                            settings['calibratorBeam'][8],
-                            calibratorBBS[0][0],
-                            settings['calibratorDemix'][0],
-                            ['', '', '', '', '', '', ''],
-                            cal_pipe_predecessor + '.uv.dps',
-                            cal_pipe_calibrator_topology + '.inst.dps',
-                            cal_pipe_calibrator_topology + '.inst.dps',
-                            cal_pipe_calibrator_topology + '.uv.dps',
-                            settings['cluster'],
-                            status,
-                            nr_tasks,
-                            nr_cores_per_task,
-                            miscParameters)
-
-
-    if not settings['split_targets']:
-        if settings['writePackageTag']:
-            tar_obs_name = settings['packageTag'] + "/" + settings['targetBeams'][0][2] + "/" + str(repeatNr) + "/TO"
+            graph.add(writeXMLAvgPipeline,
+                      prepipe_calibrator_topology,
+                      cal_obs_topology,
+                      cal_pipe_name[:-1] + "P", # To work around bug SW-681 in MoM, we should not re-use a topology
+                      prepipe_calibrator_description,
+                      cal_prepipe_default_template,
+                      settings.flaggingStrategy,
+                      settings.calibratorBeam.duration,
+                      calibratorDemix[0],
+                      cal_obs_beam0_topology + '.uv.dps',
+                      prepipe_calibrator_topology + '.uv.dps',
+                      settings.cluster,
+                      status,
+                      nr_tasks,
+                      nr_cores_per_task,
+                      miscParameters)
+
+            # TODO the empty BBS parameters are really ugly, leaving them out will break the regression test
+            graph.add(writeXMLCalPipe,
+                      cal_pipe_calibrator_topology,
+                      cal_pipe_predecessor,
+                      cal_pipe_name,
+                      cal_pipe_calibrator_description,
+                      cal_obs_pipe_default_template,
+                      settings.flaggingStrategy,
+                      settings.calibratorBeam.duration,
+                      calibratorBBS[0].skyModel,
+                      settings.calibratorDemix[0],
+                      BBSParameters(beamModelEnable=''),
+                      cal_pipe_predecessor + '.uv.dps',
+                      cal_pipe_calibrator_topology + '.inst.dps',
+                      cal_pipe_calibrator_topology + '.inst.dps',
+                      cal_pipe_calibrator_topology + '.uv.dps',
+                      settings.cluster,
+                      status,
+                      nr_tasks,
+                      nr_cores_per_task,
+                      miscParameters)
+
+
+    if not settings.split_targets:
+        if settings.writePackageTag:
+            tar_obs_name = settings.packageTag + "/" + settings.targetBeams[0].target + "/" + str(repeatNr) + "/TO"
         else:
-            tar_obs_name = settings['targetBeams'][0][2] + "/" + str(repeatNr) + "/TO"
-
-        writeXMLObs(ofile,
-                    tar_obs_name,
-                    tar_obs_name + ' (Target Observation)',
-                    tar_obs_topology,
-                    tar_obs_predecessor,
-                    tar_obs_name,
-                    projectName,
-                    settings['tbbPiggybackAllowed'],
-                    settings['aartfaacPiggybackAllowed'],
-                    settings['correlatedData'],
-                    coherentStokesData,
-                    incoherentStokesData,
-                    settings['antennaMode'],
-                    settings['clock'],
-                    settings['instrumentFilter'],
-                    settings['integrationTime'],
-                    settings['channelsPerSubband'],
-                    settings['coherentDedisperseChannels'],
-                    settings['flysEye'],
-                    settings['subbandsPerFileCS'],
-                    settings['numberCollapsedChannelsCS'],
-                    settings['stokesDownsamplingStepsCS'],
-                    settings['whichCS'],
-                    settings['subbandsPerFileIS'],
-                    settings['numberCollapsedChannelsIS'],
-                    settings['stokesDownsamplingStepsIS'],
-                    settings['whichIS'],
-                    settings['stationList'],
-                    startTimeStr,
-                    endTimeStr,
-                    settings['targetDuration_s'],
-                    settings['numberOfBitsPerSample'],
-                    status)
-
-        if settings['set_starttime']:
-            if settings['create_calibrator_observations']:
-                settings['startTimeObs'] = settings['startTimeObs'] + timedelta(seconds=settings['timeStep2'] + settings['targetDuration_s'])
+            tar_obs_name = settings.targetBeams[0].target + "/" + str(repeatNr) + "/TO"
+
+        graph.add(writeXMLObs,
+                  tar_obs_name,
+                  tar_obs_name + ' (Target Observation)',
+                  tar_obs_topology,
+                  tar_obs_predecessor,
+                  tar_obs_name,
+                  projectName,
+                  settings.tbbPiggybackAllowed,
+                  settings.aartfaacPiggybackAllowed,
+                  settings.correlatedData,
+                  coherentStokesData,
+                  incoherentStokesData,
+                  settings.antennaMode,
+                  settings.clock,
+                  settings.instrumentFilter,
+                  settings.integrationTime,
+                  settings.channelsPerSubband,
+                  settings.coherentDedisperseChannels,
+                  settings.flysEye,
+                  settings.subbandsPerFileCS,
+                  settings.numberCollapsedChannelsCS,
+                  settings.stokesDownsamplingStepsCS,
+                  settings.whichCS,
+                  settings.subbandsPerFileIS,
+                  settings.numberCollapsedChannelsIS,
+                  settings.stokesDownsamplingStepsIS,
+                  settings.whichIS,
+                  settings.stationList,
+                  startTimeStr,
+                  endTimeStr,
+                  settings.targetDuration_s,
+                  settings.numberOfBitsPerSample,
+                  status)
+
+        if settings.set_starttime:
+            if settings.create_calibrator_observations:
+                settings.startTimeObs = settings.startTimeObs + timedelta(seconds=settings.timeStep2 + settings.targetDuration_s)
             else:
-                settings['startTimeObs'] = settings['startTimeObs'] + timedelta(seconds=settings['timeStep1'] + settings['targetDuration_s'])
+                settings.startTimeObs = settings.startTimeObs + timedelta(seconds=settings.timeStep1 + settings.targetDuration_s)
 
         for beamNr in range(0, nr_beams):
-            targetBeams = settings['targetBeams']
-            writeXMLBeam(ofile,
-                         targetBeams[beamNr][2],
-                         targetBeams[beamNr][2],
-                         tar_obs_beam_topologies[beamNr],
-                         'Target',
-                         targetBeams[beamNr][2],
-                         targetBeams[beamNr][0],
-                         targetBeams[beamNr][1],
-                         targetBeams[beamNr][3],
-                         settings['flysEye'],
-                         targetBeams[beamNr][5],
-                         targetBeams[beamNr][6],
-                         writeTABXML(settings['targetTAB'][beamNr]),
-                         writeDataProducts(tar_obs_beam_topologies[beamNr],
-                                           settings['correlatedData'],
-                                           coherentStokesData,
-                                           incoherentStokesData,
-                                           settings['cluster']),
-                         status)
+            targetBeams = settings.targetBeams
+            graph.add(writeXMLBeam,
+                      targetBeams[beamNr].target,
+                      targetBeams[beamNr].target,
+                      tar_obs_beam_topologies[beamNr],
+                      'Target',
+                      targetBeams[beamNr].target,
+                      targetBeams[beamNr].ra,
+                      targetBeams[beamNr].dec,
+                      targetBeams[beamNr].subbands,
+                      settings.flysEye,
+                      targetBeams[beamNr].nrTabRings,
+                      targetBeams[beamNr].tabRingSize,
+                      writeTABXML(settings.targetTAB[beamNr]),
+                      writeDataProducts(tar_obs_beam_topologies[beamNr],
+                                        settings.correlatedData,
+                                        coherentStokesData,
+                                        incoherentStokesData,
+                                        settings.cluster),
+                      status)
 
         # create the extra polarization beam?
-        if "create_extra_ncp_beam" in settings and settings["create_extra_ncp_beam"]:
+        if settings.create_extra_ncp_beam:
             polBeamTopo = tar_obs_topology + ".SAP" + str(beamNr + 1).rjust(3, '0')   # FIXME beamNr referenced outside loop?!
-            targetBeams = settings['targetBeams']
-            writeXMLBeam(ofile,
-                         targetBeams[0][2],
-                         targetBeams[0][2],
-                         targetBeams[0][2],
-                         'Target',
-                         targetBeams[0][0],
-                         settings['flysEye'],
-                         targetBeams[0][5],
-                         targetBeams[0][6],
-                         writeTABXML(settings['targetTAB'][0]),
-                         writeDataProducts(polBeamTopo,
-                                           settings['correlatedData'],
-                                           coherentStokesData,
-                                           incoherentStokesData,
-                                           settings['cluster']),
-                         status)                                            # FIXME missing parameters
+            targetBeams = settings.targetBeams
+            graph.add(writeXMLBeam,
+                      targetBeams[0].target,
+                      targetBeams[0].target,
+                      targetBeams[0].target,
+                      'Target',
+                      targetBeams[0].ra,
+                      settings.flysEye,
+                      targetBeams[0].nrTabRings,
+                      targetBeams[0].tabRingSize,
+                      writeTABXML(settings.targetTAB[0]),
+                      writeDataProducts(polBeamTopo,
+                                        settings.correlatedData,
+                                        coherentStokesData,
+                                        incoherentStokesData,
+                                        settings.cluster),
+                      status)                                            # FIXME missing parameters
 
         # create a calibrator beam in the target observation?
-        if settings['create_target_cal_beam']:
-            if "create_extra_ncp_beam" in settings and settings["create_extra_ncp_beam"]:
+        if settings.create_target_cal_beam:
+            if settings.create_extra_ncp_beam:
                 calBeamTopo = tar_obs_topology + ".SAP" + str(beamNr + 2).rjust(3, '0')
             else:
                 calBeamTopo = tar_obs_topology + ".SAP" + str(beamNr + 1).rjust(3, '0')
 
-            calibratorBeam = settings['calibratorBeam']
-            writeXMLBeam(ofile,
-                         calibratorBeam[2],
-                         calibratorBeam[2],
-                         calBeamTopo,
-                         'Calibration',
-                         calibratorBeam[2],
-                         calibratorBeam[0],
-                         calibratorBeam[1],
-                         calibratorBeam[3],
-                         settings['flysEye'],
-                         calibratorBeam[5],
-                         calibratorBeam[6],
-                         writeTABXML(settings['calibratorTAB']),
-                         writeDataProducts(tar_obs_beam_topologies[nr_beams],
-                                           settings['correlatedData'],
-                                           coherentStokesData,
-                                           incoherentStokesData,
-                                           settings['cluster']),
-                         status)
-
-            writeXMLObsEnd(ofile)
-
-            if settings['writePackageTag']:
-                cal_pipe_target_name = settings['packageTag'] + "/" + calibratorBeam[2] + "/" + str(repeatNr) + "/CPT"
+            calibratorBeam = settings.calibratorBeam
+            graph.add(writeXMLBeam,
+                      calibratorBeam.target,
+                      calibratorBeam.target,
+                      calBeamTopo,
+                      'Calibration',
+                      calibratorBeam.target,
+                      calibratorBeam.ra,
+                      calibratorBeam.dec,
+                      calibratorBeam.subbands,
+                      settings.flysEye,
+                      calibratorBeam.nrTabRings,
+                      calibratorBeam.tabRingSize,
+                      writeTABXML(settings.calibratorTAB),
+                      writeDataProducts(tar_obs_beam_topologies[nr_beams],
+                                        settings.correlatedData,
+                                        coherentStokesData,
+                                        incoherentStokesData,
+                                        settings.cluster),
+                      status)
+
+            graph.write(writeXMLObsEnd)
+
+            if settings.writePackageTag:
+                cal_pipe_target_name = settings.packageTag + "/" + calibratorBeam.target + "/" + str(repeatNr) + "/CPT"
             else:
-                cal_pipe_target_name = calibratorBeam[2] + "/" + str(repeatNr) + "/CPT"
+                cal_pipe_target_name = calibratorBeam.target + "/" + str(repeatNr) + "/CPT"
 
-            create_pipeline = calibratorBeam[7]
+            create_pipeline = calibratorBeam.createPipeline
             if create_pipeline:
                 if processing == 'Imaging' or processing == 'LongBaseline':
-                    calibratorBBS = settings['calibratorBBS']
+                    calibratorBBS = settings.calibratorBBS
                     if not calibratorBBS:
                         raise GenException("BBS SkyModel is not specified for pipeline coupled to calibration beam")
 
-                    writeXMLCalPipe(ofile,
-                                    cal_pipe_target_topology,
-                                    tar_obs_topology,
-                                    cal_pipe_target_name,
-                                    cal_pipe_target_description,
-                                    cal_tar_pipe_default_template,
-                                    settings['flaggingStrategy'],
-                                    calibratorBeam[8],
-                                    calibratorBBS[0][0],
-                                    settings['calibratorDemix'][0],
-                                    calibratorBBS[0][1:],
-                                    tar_obs_uv_data_topologies[nr_beams],
-                                    cal_pipe_target_topology + '.inst.dps',
-                                    cal_pipe_target_topology + '.inst.dps',
-                                    cal_pipe_target_topology + '.uv.dps',
-                                    settings['cluster'],
-                                    status,
-                                    nr_tasks,
-                                    nr_cores_per_task,
-                                    miscParameters)
+                    graph.add(writeXMLCalPipe,
+                              cal_pipe_target_topology,
+                              tar_obs_topology,
+                              cal_pipe_target_name,
+                              cal_pipe_target_description,
+                              cal_tar_pipe_default_template,
+                              settings.flaggingStrategy,
+                              calibratorBeam.duration,
+                              calibratorBBS[0].skyModel,
+                              settings.calibratorDemix[0],
+                              calibratorBBS[0],
+                              tar_obs_uv_data_topologies[nr_beams],
+                              cal_pipe_target_topology + '.inst.dps',
+                              cal_pipe_target_topology + '.inst.dps',
+                              cal_pipe_target_topology + '.uv.dps',
+                              settings.cluster,
+                              status,
+                              nr_tasks,
+                              nr_cores_per_task,
+                              miscParameters)
 
                 elif processing == 'Preprocessing':
-                    calibratorDemix = settings['calibratorDemix']
+                    calibratorDemix = settings.calibratorDemix
                     for i in range(0, len(calibratorDemix)):
                         if len(calibratorDemix) > 1:  # TODO a cludge right now, but want to refactor how to call the writeXML soon
                             cal_pipe_target_topology_tmp = cal_pipe_target_topology + ".%i" % i
@@ -2525,171 +3325,171 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
                             cal_pipe_target_topology_tmp = cal_pipe_target_topology
                             cal_pipe_target_name_tmp = cal_pipe_target_name
 
-                        writeXMLAvgPipeline(ofile,
-                                            cal_pipe_target_topology_tmp,
-                                            tar_obs_topology,
-                                            cal_pipe_target_name_tmp,
-                                            cal_pipe_target_description, # FIXME: Might be undefined
-                                            cal_tar_pipe_default_template, # FIXME: Might be undefined
-                                            settings['flaggingStrategy'],
-                                            calibratorBeam[8],
-                                            calibratorDemix[i],
-                                            tar_obs_uv_data_topologies[nr_beams],
-                                            cal_pipe_target_topology_tmp + '.uv.dps',
-                                            settings['cluster'],
-                                            status,
-                                            nr_tasks,
-                                            nr_cores_per_task,
-                                            miscParameters)
+                        graph.add(writeXMLAvgPipeline,
+                                  cal_pipe_target_topology_tmp,
+                                  tar_obs_topology,
+                                  cal_pipe_target_name_tmp,
+                                  cal_pipe_target_description, # FIXME: Might be undefined
+                                  cal_tar_pipe_default_template, # FIXME: Might be undefined
+                                  settings.flaggingStrategy,
+                                  calibratorBeam.duration,
+                                  calibratorDemix[i],
+                                  tar_obs_uv_data_topologies[nr_beams],
+                                  cal_pipe_target_topology_tmp + '.uv.dps',
+                                  settings.cluster,
+                                  status,
+                                  nr_tasks,
+                                  nr_cores_per_task,
+                                  miscParameters)
 
                 elif processing == 'Calibration':
 
-                    calibratorBBS = settings['calibratorBBS']
+                    calibratorBBS = settings.calibratorBBS
                     if not calibratorBBS:
                         raise GenException("BBS SkyModel is not specified for pipeline coupled to calibration beam")
 
-                    writeXMLCalPipe(ofile,
-                                    cal_pipe_target_topology,
-                                    tar_obs_topology,
-                                    cal_pipe_target_name,
-                                    cal_pipe_target_description, # FIXME: Might be undefined
-                                    cal_tar_pipe_default_template, # FIXME: Might be undefined
-                                    settings['flaggingStrategy'],
-                                    calibratorBeam[8],
-                                    calibratorBBS[0][0],
-                                    settings['calibratorDemix'][0],
-                                    calibratorBBS[0][1:],
-                                    tar_obs_uv_data_topologies[nr_beams],
-                                    cal_pipe_target_topology + '.inst.dps',
-                                    cal_pipe_target_topology + '.inst.dps',
-                                    cal_pipe_target_topology + '.uv.dps',
-                                    settings['cluster'],
-                                    status,
-                                    nr_tasks,
-                                    nr_cores_per_task,
-                                    miscParameters)
+                    graph.add(writeXMLCalPipe,
+                              cal_pipe_target_topology,
+                              tar_obs_topology,
+                              cal_pipe_target_name,
+                              cal_pipe_target_description, # FIXME: Might be undefined
+                              cal_tar_pipe_default_template, # FIXME: Might be undefined
+                              settings.flaggingStrategy,
+                              calibratorBeam.duration,
+                              calibratorBBS[0].skyModel,
+                              settings.calibratorDemix[0],
+                              calibratorBBS[0],
+                              tar_obs_uv_data_topologies[nr_beams],
+                              cal_pipe_target_topology + '.inst.dps',
+                              cal_pipe_target_topology + '.inst.dps',
+                              cal_pipe_target_topology + '.uv.dps',
+                              settings.cluster,
+                              status,
+                              nr_tasks,
+                              nr_cores_per_task,
+                              miscParameters)
 
                 elif processing == 'Prefactor':
-                    calibratorBBS = settings['calibratorBBS']
+                    calibratorBBS = settings.calibratorBBS
                     if not calibratorBBS:
                         raise GenException("BBS SkyModel is not specified for pipeline coupled to calibration beam")
 
-                    calibratorDemix = settings['calibratorDemix']
+                    calibratorDemix = settings.calibratorDemix
                     if len(calibratorDemix) > 1:
                         raise GenException("calibratorDemix > 1 not supported in Prefactor right now.")
-                    writeXMLAvgPipeline(ofile,
-                                        prepipe_calibrator_topology,
-                                        cal_obs_topology,
-                                        cal_pipe_name[:-1] + "P", # To work around bug SW-681 in MoM, we should not re-use a topology
-                                        prepipe_calibrator_description,
-                                        cal_prepipe_default_template,
-                                        settings['flaggingStrategy'],
-                                        settings['calibratorBeam'][8],
-                                        calibratorDemix[0],
-                                        tar_obs_uv_data_topologies[nr_beams] + '.uv.dps',
-                                        prepipe_calibrator_topology + '.uv.dps',
-                                        settings['cluster'],
-                                        status,
-                                        nr_tasks,
-                                        nr_cores_per_task,
-                                        miscParameters)
-
-                    writeXMLCalPipe(ofile,
-                                    cal_pipe_target_topology,
-                                    cal_pipe_predecessor,
-                                    cal_pipe_target_name,
-                                    cal_pipe_target_description,  # FIXME: Might be undefined
-                                    cal_tar_pipe_default_template,  # FIXME: Might be undefined
-                                    settings['flaggingStrategy'],
-                                    calibratorBeam[8],
-                                    calibratorBBS[0][0],
-                                    settings['calibratorDemix'][0],
-                                    calibratorBBS[0][1:],
-                                    cal_pipe_predecessor  + '.uv.dps',
-                                    cal_pipe_target_topology + '.inst.dps',
-                                    cal_pipe_target_topology + '.inst.dps',
-                                    cal_pipe_target_topology + '.uv.dps',
-                                    settings['cluster'],
-                                    status,
-                                    nr_tasks,
-                                    nr_cores_per_task,
-                                    miscParameters)
+                    graph.add(writeXMLAvgPipeline,
+                              prepipe_calibrator_topology,
+                              cal_obs_topology,
+                              cal_pipe_name[:-1] + "P", # To work around bug SW-681 in MoM, we should not re-use a topology
+                              prepipe_calibrator_description,
+                              cal_prepipe_default_template,
+                              settings.flaggingStrategy,
+                              settings.calibratorBeam.duration,
+                              calibratorDemix[0],
+                              tar_obs_uv_data_topologies[nr_beams] + '.uv.dps',
+                              prepipe_calibrator_topology + '.uv.dps',
+                              settings.cluster,
+                              status,
+                              nr_tasks,
+                              nr_cores_per_task,
+                              miscParameters)
+
+                    graph.add(writeXMLCalPipe,
+                              cal_pipe_target_topology,
+                              cal_pipe_predecessor,
+                              cal_pipe_target_name,
+                              cal_pipe_target_description,  # FIXME: Might be undefined
+                              cal_tar_pipe_default_template,  # FIXME: Might be undefined
+                              settings.flaggingStrategy,
+                              calibratorBeam.duration,
+                              calibratorBBS[0].skyModel,
+                              settings.calibratorDemix[0],
+                              calibratorBBS[0],
+                              cal_pipe_predecessor  + '.uv.dps',
+                              cal_pipe_target_topology + '.inst.dps',
+                              cal_pipe_target_topology + '.inst.dps',
+                              cal_pipe_target_topology + '.uv.dps',
+                              settings.cluster,
+                              status,
+                              nr_tasks,
+                              nr_cores_per_task,
+                              miscParameters)
         else:
-            writeXMLObsEnd(ofile)
+            graph.write(writeXMLObsEnd)
 
     else:  # split target sources into separate observations
         for beamNr in range(0, nr_beams):
-            if settings['writePackageTag']:
-                tar_obs_name = settings['packageTag'] + "/" + settings['targetBeams'][beamNr][2] + "/" + str(repeatNr) + "/TO"
+            if settings.writePackageTag:
+                tar_obs_name = settings.packageTag + "/" + settings.targetBeams[beamNr].target + "/" + str(repeatNr) + "/TO"
             else:
-                tar_obs_name = settings['targetBeams'][beamNr][2] + "/" + str(repeatNr) + "/TO"
+                tar_obs_name = settings.targetBeams[beamNr].target + "/" + str(repeatNr) + "/TO"
 
             tar_obs_topology_MultiObs = tar_obs_topology + '.' + str(beamNr)
-            writeXMLObs(ofile,
-                        tar_obs_name,
-                        tar_obs_name + ' (Target Observation)',
-                        tar_obs_topology_MultiObs,
-                        '',
-                        tar_obs_name,
-                        projectName,
-                        settings['tbbPiggybackAllowed'],
-                        settings['aartfaacPiggybackAllowed'],
-                        settings['correlatedData'],
-                        coherentStokesData,
-                        incoherentStokesData,
-                        settings['antennaMode'],
-                        settings['clock'],
-                        settings['instrumentFilter'],
-                        settings['integrationTime'],
-                        settings['channelsPerSubband'],
-                        settings['coherentDedisperseChannels'],
-                        settings['flysEye'],
-                        settings['subbandsPerFileCS'],
-                        settings['numberCollapsedChannelsCS'],
-                        settings['stokesDownsamplingStepsCS'],
-                        settings['whichCS'],
-                        settings['subbandsPerFileIS'],
-                        settings['numberCollapsedChannelsIS'],
-                        settings['stokesDownsamplingStepsIS'],
-                        settings['whichIS'],
-                        settings['stationList'],
-                        startTimeStr,
-                        endTimeStr,
-                        settings['targetDuration_s'],
-                        settings['numberOfBitsPerSample'],
-                        status)
-
-            targetBeams = settings['targetBeams']
-            writeXMLBeam(ofile,
-                         targetBeams[beamNr][2],
-                         targetBeams[beamNr][2],
-                         tar_obs_beam_topologies[beamNr],
-                         'Target',
-                         targetBeams[beamNr][2],
-                         targetBeams[beamNr][0],
-                         targetBeams[beamNr][1],
-                         targetBeams[beamNr][3],
-                         settings['flysEye'],
-                         targetBeams[beamNr][5],
-                         targetBeams[beamNr][6],
-                         writeTABXML(settings['targetTAB'][beamNr]),
-                         writeDataProducts(tar_obs_beam_topologies[beamNr],
-                                           settings['correlatedData'],
-                                           coherentStokesData,
-                                           incoherentStokesData,
-                                           settings['cluster']),
-                         status)
-
-            writeXMLObsEnd(ofile)
-
-            if settings['set_starttime']:
-                settings['startTimeObs'] = settings['startTimeObs'] + timedelta(seconds=settings['timeStep1'] + settings['targetDuration_s'])
+            graph.add(writeXMLObs,
+                      tar_obs_name,
+                      tar_obs_name + ' (Target Observation)',
+                      tar_obs_topology_MultiObs,
+                      '',
+                      tar_obs_name,
+                      projectName,
+                      settings.tbbPiggybackAllowed,
+                      settings.aartfaacPiggybackAllowed,
+                      settings.correlatedData,
+                      coherentStokesData,
+                      incoherentStokesData,
+                      settings.antennaMode,
+                      settings.clock,
+                      settings.instrumentFilter,
+                      settings.integrationTime,
+                      settings.channelsPerSubband,
+                      settings.coherentDedisperseChannels,
+                      settings.flysEye,
+                      settings.subbandsPerFileCS,
+                      settings.numberCollapsedChannelsCS,
+                      settings.stokesDownsamplingStepsCS,
+                      settings.whichCS,
+                      settings.subbandsPerFileIS,
+                      settings.numberCollapsedChannelsIS,
+                      settings.stokesDownsamplingStepsIS,
+                      settings.whichIS,
+                      settings.stationList,
+                      startTimeStr,
+                      endTimeStr,
+                      settings.targetDuration_s,
+                      settings.numberOfBitsPerSample,
+                      status)
+
+            targetBeams = settings.targetBeams
+            graph.add(writeXMLBeam,
+                      targetBeams[beamNr].target,
+                      targetBeams[beamNr].target,
+                      tar_obs_beam_topologies[beamNr],
+                      'Target',
+                      targetBeams[beamNr].target,
+                      targetBeams[beamNr].ra,
+                      targetBeams[beamNr].dec,
+                      targetBeams[beamNr].subbands,
+                      settings.flysEye,
+                      targetBeams[beamNr].nrTabRings,
+                      targetBeams[beamNr].tabRingSize,
+                      writeTABXML(settings.targetTAB[beamNr]),
+                      writeDataProducts(tar_obs_beam_topologies[beamNr],
+                                        settings.correlatedData,
+                                        coherentStokesData,
+                                        incoherentStokesData,
+                                        settings.cluster),
+                      status)
+
+            graph.write(writeXMLObsEnd)
+
+            if settings.set_starttime:
+                settings.startTimeObs = settings.startTimeObs + timedelta(seconds=settings.timeStep1 + settings.targetDuration_s)
 
     # Target PIPELINES generation from here on
 
     for beamNr in range(0, nr_beams):
-        targetBeams = settings['targetBeams']
-        create_pipeline = targetBeams[beamNr][7]
+        targetBeams = settings.targetBeams
+        create_pipeline = targetBeams[beamNr].createPipeline
         if create_pipeline:
             tar_pipe_ID = "/TP"
             if processing == 'Imaging':  # imaging modes
@@ -2712,38 +3512,38 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
                 tar_pipe_default_template = "Calibration Pipeline Target"
                 tar_pipe_description = "Prefactor Target"
 
-            if settings['writePackageTag']:
-                tar_pipe_name = settings['packageTag'] + "/" + targetBeams[beamNr][2] + "/" + str(repeatNr) + "." + \
+            if settings.writePackageTag:
+                tar_pipe_name = settings.packageTag + "/" + targetBeams[beamNr].target + "/" + str(repeatNr) + "." + \
                                 str(beamNr) + tar_pipe_ID
             else:
-                tar_pipe_name = targetBeams[beamNr][2] + "/" + str(repeatNr) + "." + str(beamNr) + tar_pipe_ID
+                tar_pipe_name = targetBeams[beamNr].target + "/" + str(repeatNr) + "." + str(beamNr) + tar_pipe_ID
 
             if processing == 'Imaging' or processing == 'LongBaseline':
-                writeXMLTargetPipeline(ofile,
-                                       tar_pipe_topologies[beamNr],
-                                       tar_pipe_predecessor,
-                                       tar_pipe_name,
-                                       tar_pipe_description,
-                                       tar_pipe_default_template,
-                                       settings['flaggingStrategy'],
-                                       targetBeams[beamNr][8],
-                                       settings['targetDemix'][beamNr][0],
-                                       settings['targetBBS'][beamNr][0][1:],
-                                       tar_obs_uv_data_topologies[beamNr],
-                                       tar_obs_uv_data_topologies[beamNr],
-                                       tar_pipe_input_INST_topo,
-                                       tar_pipe_input_INST_topo,
-                                       tar_pipe_topologies[beamNr] + ".uv.dps",
-                                       tar_pipe_topologies[beamNr] + ".uv.dps",
-                                       "","", # No output instrument model
-                                       settings['cluster'],
-                                       status,
-                                       nr_tasks,
-                                       nr_cores_per_task,
-                                       miscParameters)
+                graph.add(writeXMLTargetPipeline,
+                          tar_pipe_topologies[beamNr],
+                          tar_pipe_predecessor,
+                          tar_pipe_name,
+                          tar_pipe_description,
+                          tar_pipe_default_template,
+                          settings.flaggingStrategy,
+                          targetBeams[beamNr].duration,
+                          settings.targetDemix[beamNr][0],
+                          settings.targetBBS[beamNr][0],
+                          tar_obs_uv_data_topologies[beamNr],
+                          tar_obs_uv_data_topologies[beamNr],
+                          tar_pipe_input_INST_topo,
+                          tar_pipe_input_INST_topo,
+                          tar_pipe_topologies[beamNr] + ".uv.dps",
+                          tar_pipe_topologies[beamNr] + ".uv.dps",
+                          "","", # No output instrument model
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task,
+                          miscParameters)
 
             elif processing == 'Preprocessing':
-                targetDemix = settings['targetDemix']
+                targetDemix = settings.targetDemix
                 for i in range(0, len(targetDemix[beamNr])):
                     if len(targetDemix[
                                beamNr]) > 1:  # TODO a cludge right now, but want to refactor how to call the writeXML soon
@@ -2754,141 +3554,120 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
                         tar_pipe_topology_tmp = tar_pipe_topologies[beamNr]
                         tar_pipe_name_tmp = tar_pipe_name
                         tar_pipe_topology_output_MS_tmp = tar_pipe_topologies[beamNr] + ".uv.dps"
-                    writeXMLAvgPipeline(ofile,
-                                        tar_pipe_topology_tmp,
-                                        tar_pipe_predecessor,
-                                        tar_pipe_name_tmp,
-                                        tar_pipe_description,
-                                        tar_pipe_default_template,
-                                        settings['flaggingStrategy'],
-                                        targetBeams[beamNr][8],
-                                        targetDemix[beamNr][i],
-                                        tar_obs_uv_data_topologies[beamNr],
-                                        tar_pipe_topology_output_MS_tmp,
-                                        settings['cluster'],
-                                        status,
-                                        nr_tasks,
-                                        nr_cores_per_task,
-                                        miscParameters)
+                    graph.add(writeXMLAvgPipeline,
+                              tar_pipe_topology_tmp,
+                              tar_pipe_predecessor,
+                              tar_pipe_name_tmp,
+                              tar_pipe_description,
+                              tar_pipe_default_template,
+                              settings.flaggingStrategy,
+                              targetBeams[beamNr].duration,
+                              targetDemix[beamNr][i],
+                              tar_obs_uv_data_topologies[beamNr],
+                              tar_pipe_topology_output_MS_tmp,
+                              settings.cluster,
+                              status,
+                              nr_tasks,
+                              nr_cores_per_task,
+                              miscParameters)
 
             elif processing == 'Calibration':  # TODO currently doesn't work according to Alwin's wiki, why?
-                targetBBS = settings['targetBBS']
-                if targetBBS[beamNr][0][0] == '':
+                targetBBS = settings.targetBBS
+                if targetBBS[beamNr][0].skyModel == '':
                     raise GenException(
                         "BBS SkyModel is not specified for pipeline coupled to target beam " + str(beamNr))
 
-                writeXMLCalPipe(ofile,
-                                tar_pipe_topologies[beamNr],
-                                tar_pipe_predecessor,
-                                tar_pipe_name,
-                                tar_pipe_description,
-                                tar_pipe_default_template,
-                                settings['flaggingStrategy'],
-                                targetBeams[beamNr][8],
-                                targetBBS[beamNr][0][0],
-                                settings['targetDemix'][beamNr][0],
-                                targetBBS[beamNr][0][1:],
-                                tar_obs_uv_data_topologies[beamNr],
-                                tar_pipe_topologies[beamNr] + ".inst.dps",
-                                tar_pipe_topologies[beamNr] + ".inst.dps",
-                                tar_pipe_topologies[beamNr] + ".uv.dps",
-                                settings['cluster'],
-                                status,
-                                nr_tasks,
-                                nr_cores_per_task,
-                                miscParameters)
+                graph.add(writeXMLCalPipe,
+                          tar_pipe_topologies[beamNr],
+                          tar_pipe_predecessor,
+                          tar_pipe_name,
+                          tar_pipe_description,
+                          tar_pipe_default_template,
+                          settings.flaggingStrategy,
+                          targetBeams[beamNr].duration,
+                          targetBBS[beamNr][0].skyModel,
+                          settings.targetDemix[beamNr][0],
+                          targetBBS[beamNr][0],
+                          tar_obs_uv_data_topologies[beamNr],
+                          tar_pipe_topologies[beamNr] + ".inst.dps",
+                          tar_pipe_topologies[beamNr] + ".inst.dps",
+                          tar_pipe_topologies[beamNr] + ".uv.dps",
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task,
+                          miscParameters)
 
             elif processing == 'Prefactor':  # Should work I hope?
-                targetBBS = settings['targetBBS']
-                if targetBBS[beamNr][0][0] == '':
+                targetBBS = settings.targetBBS
+                if targetBBS[beamNr][0].skyModel == '':
                     raise GenException(
                         "BBS SkyModel is not specified for pipeline coupled to target beam " + str(beamNr))
 
-                targetDemix = settings['targetDemix']
+                targetDemix = settings.targetDemix
                 if len(targetDemix[beamNr]) > 1:
                     raise GenException("targetDemix > 1 not supported in Prefactor right now.")
-                writeXMLAvgPipeline(ofile,
-                                    tar_prepipe_topologies[beamNr],
-                                    prepipe_target_predecessor,
-                                    tar_pipe_name[:-1] + "XP", # To work around bug SW-681 in MoM, we should not re-use a topology
-                                    prepipe_target_description,
-                                    tar_prepipe_default_template,
-                                    settings['flaggingStrategy'],
-                                    targetBeams[beamNr][8],
-                                    targetDemix[beamNr][0],
-                                    tar_obs_uv_data_topologies[beamNr],
-                                    tar_prepipe_topologies[beamNr] + ".uv.dps",
-                                    settings['cluster'],
-                                    status,
-                                    nr_tasks,
-                                    nr_cores_per_task,
-                                    miscParameters)
+                graph.add(writeXMLAvgPipeline,
+                          tar_prepipe_topologies[beamNr],
+                          prepipe_target_predecessor,
+                          tar_pipe_name[:-1] + "XP", # To work around bug SW-681 in MoM, we should not re-use a topology
+                          prepipe_target_description,
+                          tar_prepipe_default_template,
+                          settings.flaggingStrategy,
+                          targetBeams[beamNr].duration,
+                          targetDemix[beamNr][0],
+                          tar_obs_uv_data_topologies[beamNr],
+                          tar_prepipe_topologies[beamNr] + ".uv.dps",
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task,
+                          miscParameters)
 
                 tar_pipe_predecessor = tar_prepipe_topologies[beamNr] + ',' + cal_pipe_calibrator_topology
-                writeXMLTargetPipeline(ofile,
-                                       tar_pipe_topologies[beamNr],
-                                       tar_pipe_predecessor,
-                                       tar_pipe_name,
-                                       tar_pipe_description,
-                                       tar_pipe_default_template,
-                                       settings['flaggingStrategy'],
-                                       targetBeams[beamNr][8],
-                                       settings['targetDemix'][beamNr][0],
-                                       settings['targetBBS'][beamNr][0][1:],
-                                       tar_prepipe_topologies[beamNr] + ".uv.dps",
-                                       tar_prepipe_topologies[beamNr] + ".uv.dps",
-                                       tar_pipe_input_INST_topo,
-                                       tar_pipe_input_INST_topo,
-                                       tar_pipe_topologies[beamNr] + ".uv.dps",
-                                       tar_pipe_topologies[beamNr] + ".uv.dps",
-                                       tar_pipe_topologies[beamNr] + ".inst.dps",
-                                       tar_pipe_topologies[beamNr] + ".inst.dps",
-                                       settings['cluster'],
-                                       status,
-                                       nr_tasks,
-                                       nr_cores_per_task,
-                                       miscParameters)
+                graph.add(writeXMLTargetPipeline,
+                          tar_pipe_topologies[beamNr],
+                          tar_pipe_predecessor,
+                          tar_pipe_name,
+                          tar_pipe_description,
+                          tar_pipe_default_template,
+                          settings.flaggingStrategy,
+                          targetBeams[beamNr].duration,
+                          settings.targetDemix[beamNr][0],
+                          settings.targetBBS[beamNr][0],
+                          tar_prepipe_topologies[beamNr] + ".uv.dps",
+                          tar_prepipe_topologies[beamNr] + ".uv.dps",
+                          tar_pipe_input_INST_topo,
+                          tar_pipe_input_INST_topo,
+                          tar_pipe_topologies[beamNr] + ".uv.dps",
+                          tar_pipe_topologies[beamNr] + ".uv.dps",
+                          tar_pipe_topologies[beamNr] + ".inst.dps",
+                          tar_pipe_topologies[beamNr] + ".inst.dps",
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task,
+                          miscParameters)
 
             elif processing == 'Pulsar':
                 # tar_obs_topology_MultiObs = tar_obs_topology + '.' + str(beamNr)
                 tar_pipe_predecessor = tar_obs_topology
-                targetPulsar = settings['targetPulsar']
-                writeXMLPulsarPipe(ofile,
-                                   tar_pipe_topologies[beamNr],
-                                   tar_obs_topology,
-                                   tar_pipe_name,
-                                   tar_pipe_description,
-                                   tar_pipe_default_template,
-                                   targetBeams[beamNr][8],
-                                   tar_obs_bf_data_topologies[beamNr],
-                                   tar_pipe_topologies[beamNr] + ".pu.dps",
-                                   settings['cluster'],
-                                   status,
-                                   nr_tasks,
-                                   nr_cores_per_task,
-                                   pulsar=targetPulsar[beamNr][0][0],
-                                   singlePulse=targetPulsar[beamNr][0][1],
-                                   rawTo8bit=targetPulsar[beamNr][0][2],
-                                   dspsrExtraOpts=targetPulsar[beamNr][0][3],
-                                   prepdataExtraOpts=targetPulsar[beamNr][0][4],
-                                   _8bitConversionSigma=targetPulsar[beamNr][0][5],
-                                   tsubint=targetPulsar[beamNr][0][6],
-                                   norfi=targetPulsar[beamNr][0][7],
-                                   nofold=targetPulsar[beamNr][0][8],
-                                   nopdmp=targetPulsar[beamNr][0][9],
-                                   skipDspsr=targetPulsar[beamNr][0][10],
-                                   rrats=targetPulsar[beamNr][0][11],
-                                   _2bf2fitsExtraOpts=targetPulsar[beamNr][0][12],
-                                   decodeSigma=targetPulsar[beamNr][0][13],
-                                   decodeNblocks=targetPulsar[beamNr][0][14],
-                                   rfifindExtraOpts=targetPulsar[beamNr][0][15],
-                                   prepfoldExtraOpts=targetPulsar[beamNr][0][16],
-                                   prepsubbandExtraOpts=targetPulsar[beamNr][0][17],
-                                   dynamicSpectrumTimeAverage=targetPulsar[beamNr][0][18],
-                                   skipDynamicSpectrum=targetPulsar[beamNr][0][19],
-                                   skipPrepfold=targetPulsar[beamNr][0][20],
-                                   digifilExtraOpts=targetPulsar[beamNr][0][21],
-                                   miscParameters=miscParameters)
+                targetPulsar = settings.targetPulsar
+                graph.add(writeXMLPulsarPipe,
+                          tar_pipe_topologies[beamNr],
+                          tar_obs_topology,
+                          tar_pipe_name,
+                          tar_pipe_description,
+                          tar_pipe_default_template,
+                          targetBeams[beamNr].duration,
+                          tar_obs_bf_data_topologies[beamNr],
+                          tar_pipe_topologies[beamNr] + ".pu.dps",
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task,
+                          miscParameters=miscParameters,
+                          **targetPulsar[beamNr][0].asDict())
 
     # for long baseline processsing an additional (special purpose adapted) preprocessing pipeline is necessary
     if processing == 'LongBaseline':
@@ -2899,97 +3678,256 @@ def writeRepeat(ofile, projectName, blockTopo, repeatNr, settings, imaging_pipe_
         LB_pipeline_description = "Long-Baseline Concat"
 
         for beamNr in range(0, nr_beams):
-            targetBeams = settings['targetBeams']
-            if targetBeams[beamNr][7]:  # create pipelines for this beam
-                if settings['writePackageTag']:
-                    LB_preproc_pipe_name = settings['packageTag'] + "/" + targetBeams[beamNr][2] + "/" + str(repeatNr) + "." + str(
+            targetBeams = settings.targetBeams
+            if targetBeams[beamNr].createPipeline:  # create pipelines for this beam
+                if settings.writePackageTag:
+                    LB_preproc_pipe_name = settings.packageTag + "/" + targetBeams[beamNr].target + "/" + str(repeatNr) + "." + str(
                         beamNr) + "/PP"
-                    LB_pipeline_name = settings['packageTag'] + "/" + targetBeams[beamNr][2] + "/" + str(repeatNr) + "." + str(
+                    LB_pipeline_name = settings.packageTag + "/" + targetBeams[beamNr].target + "/" + str(repeatNr) + "." + str(
                         beamNr) + "/LBP"
                 else:
-                    LB_preproc_pipe_name = targetBeams[beamNr][2] + "/" + str(repeatNr) + "." + str(beamNr) + "/PP"
-                    LB_pipeline_name = targetBeams[beamNr][2] + "/" + str(repeatNr) + "." + str(beamNr) + "/LBP"
-
-                writeXMLAvgPipeline(ofile,
-                                    LB_preproc_pipe_topologies[beamNr],
-                                    LB_preproc_pipe_predecessor[beamNr],
-                                    LB_preproc_pipe_name,
-                                    LB_preproc_pipe_description,
-                                    LB_preproc_pipe_template,
-                                    settings['flaggingStrategy'],
-                                    targetBeams[beamNr][8],
-                                    settings['targetDemix'][beamNr][0],
-                                    tar_pipe_topologies[beamNr] + ".uv.dps",
-                                    LB_preproc_pipe_output_MS_topologies[beamNr],
-                                    settings['cluster'],
-                                    status,
-                                    nr_tasks,
-                                    nr_cores_per_task,
-                                    miscParameters)
+                    LB_preproc_pipe_name = targetBeams[beamNr].target + "/" + str(repeatNr) + "." + str(beamNr) + "/PP"
+                    LB_pipeline_name = targetBeams[beamNr].target + "/" + str(repeatNr) + "." + str(beamNr) + "/LBP"
+
+                graph.add(writeXMLAvgPipeline,
+                          LB_preproc_pipe_topologies[beamNr],
+                          LB_preproc_pipe_predecessor[beamNr],
+                          LB_preproc_pipe_name,
+                          LB_preproc_pipe_description,
+                          LB_preproc_pipe_template,
+                          settings.flaggingStrategy,
+                          targetBeams[beamNr].duration,
+                          settings.targetDemix[beamNr][0],
+                          tar_pipe_topologies[beamNr] + ".uv.dps",
+                          LB_preproc_pipe_output_MS_topologies[beamNr],
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task,
+                          miscParameters)
 
                 # nv 13okt2014: #6716 - Implement Long Baseline Pipeline
-                writeXMLLongBaselinePipe(ofile,
-                                         LB_pipeline_topologies[beamNr],
-                                         LB_pipeline_predecessor[beamNr],
-                                         LB_pipeline_name,
-                                         LB_pipeline_description,
-                                         LB_pipeline_default_template,
-                                         targetBeams[beamNr][8],
-                                         settings['subbandsPerSubbandGroup'],
-                                         settings['subbandGroupsPerMS'],
-                                         LB_pipeline_input_uv_topologies[beamNr],
-                                         LB_pipeline_output_uv_topologies[beamNr],
-                                         settings['cluster'],
-                                         status,
-                                         nr_tasks,
-                                         nr_cores_per_task)
-
-    return imaging_pipe_inputs, imaging_pipe_predecessors, settings['startTimeObs']
+                graph.add(writeXMLLongBaselinePipe,
+                          LB_pipeline_topologies[beamNr],
+                          LB_pipeline_predecessor[beamNr],
+                          LB_pipeline_name,
+                          LB_pipeline_description,
+                          LB_pipeline_default_template,
+                          targetBeams[beamNr].duration,
+                          settings.subbandsPerSubbandGroup,
+                          settings.subbandGroupsPerMS,
+                          LB_pipeline_input_uv_topologies[beamNr],
+                          LB_pipeline_output_uv_topologies[beamNr],
+                          settings.cluster,
+                          status,
+                          nr_tasks,
+                          nr_cores_per_task)
 
+    return imaging_pipe_inputs, imaging_pipe_predecessors, settings.startTimeObs
 
-def writeBlock(ofile, settings, projectName, blockNr, status):
-    defaults = {
-        "subbandsPerFileCS": '',
-        "numberCollapsedChannelsCS": '',
-        "stokesDownsamplingStepsCS": '',
-        "whichCS": '',
-        "subbandsPerFileIS": '',
-        "numberCollapsedChannelsIS": '',
-        "stokesDownsamplingStepsIS": '',
-        "whichIS": '',
-        "tbbPiggybackAllowed": True,
-        "aartfaacPiggybackAllowed": True,
-        "imagingBBS": '',
-        "cluster": 'CEP4'}
-    defaults.update(settings)  # FIXME somewhat dirty hack, to be solved better later.
-    settings = defaults
-    if 'nr_tasks' in settings:  # We can set a (different) number per BLOCK
-        nr_tasks = settings['nr_tasks']
-        nr_cores_per_task = settings['nr_cores_per_task']
+
+REPEAT_NUMBER = '\x00R\x00'  # stands in for the repeat number while a RepeatTemplate is rendered
+
+
+class SymbolicTime(object):
+    '''
+    Stands in for the start time of a repeat while a RepeatTemplate is rendered. It keeps the offset from the start of
+    the repeat; strftime returns a field that TemplateText.fill replaces by the actual time.
+    '''
+    __slots__ = ('offset',)
+
+    def __init__(self, offset=timedelta(0)):
+        self.offset = offset
+
+    def __add__(self, delta):
+        return SymbolicTime(self.offset + delta)
+
+    def strftime(self, format):
+        return '\x00T%i\x01%s\x00' % (self.offset // timedelta(microseconds=1), format)
+
+
+class TemplateText(object):
+    '''
+    A text with REPEAT_NUMBER and SymbolicTime fields, split once into the literal parts and the fields so that
+    filling it in for a repeat is a single join
+    '''
+    FIELD = re.compile('\x00(R|T-?\\d+\x01[^\x00]*)\x00')
+
+    def __init__(self, text):
+        self.parts = self.FIELD.split(text)
+        self.keys = []  # the distinct fields: the offset and format of a time field or None for the repeat number
+        self.fields = []  # index in keys of each field, the odd parts
+        indices = {}
+        for field in self.parts[1::2]:
+            if field not in indices:
+                indices[field] = len(self.keys)
+                if field == 'R':
+                    self.keys.append(None)
+                else:
+                    offset, format = field[1:].split('\x01', 1)
+                    self.keys.append((timedelta(microseconds=int(offset)), format))
+            self.fields.append(indices[field])
+
+    def fill(self, repeatNr, startTime):
+        if not self.fields:
+            return self.parts[0]
+        # A repeat has only a few distinct times, that are used by many fields
+        values = [str(repeatNr) if key is None else (startTime + key[0]).strftime(key[1]) for key in self.keys]
+        parts = list(self.parts)
+        parts[1::2] = [values[index] for index in self.fields]
+        return ''.join(parts)
+
+
+def compileTemplateValue(value):
+    '''
+    Returns value, a string or a list of strings, with the strings that have fields replaced by TemplateTexts
+    '''
+    if isinstance(value, list):
+        return [compileTemplateValue(item) for item in value]
+    return TemplateText(value) if isinstance(value, str) and '\x00' in value else value
+
+
+def fillTemplateValue(value, repeatNr, startTime):
+    '''
+    Fill in a value compiled by compileTemplateValue
+    '''
+    if isinstance(value, list):
+        return [fillTemplateValue(item, repeatNr, startTime) for item in value]
+    return value.fill(repeatNr, startTime) if isinstance(value, TemplateText) else value
+
+
+def writeTemplateText(ofile, text, repeatNr, startTime):
+    ofile.write(text.fill(repeatNr, startTime))
+
+
+def replayTemplateText(ofile, text, repeatNr, startTime):
+    '''
+    Print the messages that writing the XML of a repeat printed, as a step of TaskGraph.serialize
+    '''
+    logFile().write(text.fill(repeatNr, startTime))
+
+
+class RepeatTemplate(object):
+    '''
+    A repeat of a BLOCK rendered once by writeRepeat, with REPEAT_NUMBER as the repeat number and a SymbolicTime as
+    the start time. Only the repeat number (in the topologies and names) and the start and end times differ between
+    the repeats of a BLOCK, so write() adds each repeat by filling in the template instead of building, checking and
+    formatting its nodes again.
+    '''
+
+    # The topology, kind, name, predecessors, inputs and outputs of all nodes are kept as a single TemplateText, with
+    # the fields separated by NODE_SEPARATOR and the items of the lists by LIST_SEPARATOR, so that a repeat fills in
+    # its nodes with one join and split
+    NODE_SEPARATOR = '\x02'
+    LIST_SEPARATOR = '\x03'
+
+    def __init__(self, graph, xml, log, serializeLog, imagingInputs, imagingPredecessors, duration):
+        fields = []
+        for node in graph.nodes.values():
+            fields += [node.topology, node.kind, node.name, self.LIST_SEPARATOR.join(node.predecessors),
+                       self.LIST_SEPARATOR.join(node.inputs), self.LIST_SEPARATOR.join(node.outputs)]
+        self.nodes = TemplateText(self.NODE_SEPARATOR.join(fields))
+        self.xml = xml
+        self.log = log
+        self.serializeLog = serializeLog
+        self.imagingInputs = compileTemplateValue(imagingInputs)
+        self.imagingPredecessors = compileTemplateValue(imagingPredecessors)
+        self.duration = duration  # of a repeat, None if the BLOCK has no start time
+
+    @classmethod
+    def splitList(cls, text):
+        return text.split(cls.LIST_SEPARATOR) if text else []
+
+    @classmethod
+    def render(cls, blockNr, projectName, blockTopo, settings, status, nr_tasks, nr_cores_per_task, miscParameters):
+        '''
+        Render the template for the repeats of a BLOCK. Returns None if that fails; the repeats are then written one by
+        one, which reports the error for the actual repeat.
+        '''
+        startTimeObs = settings.startTimeObs
+        graph = TaskGraph(blockNr)
+        log = StringIO()
+        serializeLog = StringIO()
+        xml = StringIO()
+        try:
+            if settings.set_starttime:
+                settings.startTimeObs = SymbolicTime()
+            with logTo(log):
+                imagingInputs, imagingPredecessors, endTime = writeRepeat(
+                    graph, projectName, blockTopo, REPEAT_NUMBER, settings, [[] for i in range(settings.nr_beams)],
+                    [[] for i in range(settings.nr_beams)], status, nr_tasks, nr_cores_per_task, miscParameters)
+            with logTo(serializeLog), XMLEmitter(xml) as emitter:
+                graph.serialize(emitter)
+        except Exception:
+            return None
+        finally:
+            settings.startTimeObs = startTimeObs
+        return cls(graph, TemplateText(xml.getvalue()), TemplateText(log.getvalue()),
+                   TemplateText(serializeLog.getvalue()), imagingInputs, imagingPredecessors,
+                   endTime.offset if settings.set_starttime else None)
+
+    def write(self, graph, repeatNr, startTimeObs, imaging_pipe_inputs, imaging_pipe_predecessors):
+        '''
+        Add repeat repeatNr, starting at startTimeObs, to graph, like writeRepeat does
+        '''
+        logFile().write(self.log.fill(repeatNr, startTimeObs))
+        fields = self.nodes.fill(repeatNr, startTimeObs).split(self.NODE_SEPARATOR)
+        for index in range(0, len(fields), 6):
+            topology, kind, name, predecessors, inputs, outputs = fields[index:index + 6]
+            graph.insert(TaskNode(topology, kind, name, self.splitList(predecessors), self.splitList(inputs),
+                                  self.splitList(outputs)))
+        graph.write(writeTemplateText, self.xml, repeatNr, startTimeObs)
+        if self.serializeLog.parts[0] or self.serializeLog.fields:
+            graph.write(replayTemplateText, self.serializeLog, repeatNr, startTimeObs)
+        for beamNr in range(len(self.imagingInputs)):
+            imaging_pipe_inputs[beamNr] += fillTemplateValue(self.imagingInputs[beamNr], repeatNr, startTimeObs)
+            imaging_pipe_predecessors[beamNr] += fillTemplateValue(self.imagingPredecessors[beamNr], repeatNr,
+                                                                   startTimeObs)
+        if self.duration is None:
+            return imaging_pipe_inputs, imaging_pipe_predecessors, startTimeObs
+        return imaging_pipe_inputs, imaging_pipe_predecessors, startTimeObs + self.duration
+
+
+def buildBlockGraph(settings, projectName, blockNr, status):
+    '''
+    Build the TaskGraph of a checked BLOCK, without writing anything yet
+    '''
+    graph = TaskGraph(blockNr)
+    if settings.nr_tasks is not None:  # We can set a (different) number per BLOCK
+        nr_tasks = settings.nr_tasks
+        nr_cores_per_task = settings.nr_cores_per_task
     else:
         nr_tasks = 10 * DEFAULT_TASKS_PER_NODE
         nr_cores_per_task = DEFAULT_CORES_PER_TASK
 
     # There's a lot of stuff in settings that's only relevant to the imaging pipelines
-    # otherSettings = { key: settings[key] for key not in imagingPipelineKeys }
+    # otherSettings = { key: getattr(settings, key) for key not in imagingPipelineKeys }
 
-    writeFolderStart(ofile, blockNr - 1, settings["packageName"], settings["packageDescription"],
-                     settings["processing"])
+    graph.write(writeFolderStart, blockNr - 1, settings.packageName, settings.packageDescription,
+                settings.processing)
 
-    if settings["set_starttime"]:
-        settings["startTimeObs"] = settings["startTime"]
+    if settings.set_starttime:
+        settings.startTimeObs = settings.startTime
     else:
-        settings["startTimeObs"] = 0
+        settings.startTimeObs = 0
 
-    imaging_pipe_inputs = [[] for i in range(settings["nr_beams"])]
-    imaging_pipe_predecessors = [[] for i in range(settings["nr_beams"])]
+    imaging_pipe_inputs = [[] for i in range(settings.nr_beams)]
+    imaging_pipe_predecessors = [[] for i in range(settings.nr_beams)]
 
     miscParametersKeys = ["storagemanager"]
-    miscParameters = {key: value for (key, value) in list(settings.items()) if key in miscParametersKeys}
+    miscParameters = {key: getattr(settings, key) for key in miscParametersKeys if getattr(settings, key) is not None}
 
     blockTopo = "B%i." % (blockNr - 1,)
-    for repeatNr in range(1, settings["nrRepeats"] + 1):
-        imaging_pipe_inputs, imaging_pipe_predecessors, settings["startTimeObs"] = writeRepeat(ofile,
+    template = None
+    if settings.nrRepeats > 1:  # all repeats are the same except for their number and start time
+        template = RepeatTemplate.render(blockNr, projectName, blockTopo, settings, status, nr_tasks,
+                                         nr_cores_per_task, miscParameters)
+    for repeatNr in range(1, settings.nrRepeats + 1):
+        if template is not None:
+            imaging_pipe_inputs, imaging_pipe_predecessors, settings.startTimeObs = template.write(
+                graph, repeatNr, settings.startTimeObs, imaging_pipe_inputs, imaging_pipe_predecessors)
+            continue
+        imaging_pipe_inputs, imaging_pipe_predecessors, settings.startTimeObs = writeRepeat(graph,
                                                                                                projectName, blockTopo,
                                                                                                repeatNr, settings,
                                                                                                imaging_pipe_inputs,
@@ -2998,66 +3936,651 @@ def writeBlock(ofile, settings, projectName, blockNr, status):
                                                                                                nr_cores_per_task,
                                                                                                miscParameters)
 
-    if settings["do_imaging"]:
+    if settings.do_imaging:
         imagingPipelineKeys = ["imaging_pipe_type", "imaging_pipe_default_template", "imaging_pipe_duration",
                                "nrSubbandsPerImage", "maxBaseline", "fieldOfView", "weightingScheme",
                                "robustParameter", "nrOfIterations", "cleaningThreshold",
                                "uvMin", "uvMax", "stokesToImage"]
         for key in imagingPipelineKeys:  # Can this be done with list comprehension as well?
-            if key not in list(settings.keys()):
-                settings[key] = ''
-        ##imagingPipelineSettings = { key: settings[key] for key in imagingPipelineKeys }
+            if getattr(settings, key) is None:
+                setattr(settings, key, '')
+        ##imagingPipelineSettings = { key: getattr(settings, key) for key in imagingPipelineKeys }
         imagingPipelineSettings = {}
         for key in imagingPipelineKeys:
-            imagingPipelineSettings[key] = settings[key]
-        writeImagingPipeline(ofile,
-                             settings["nr_beams"],
-                             settings["targetBeams"],
+            imagingPipelineSettings[key] = getattr(settings, key)
+        writeImagingPipeline(graph,
+                             settings.nr_beams,
+                             settings.targetBeams,
                              blockTopo,
-                             settings["nrRepeats"],
+                             settings.nrRepeats,
                              imaging_pipe_inputs,
                              imaging_pipe_predecessors,
-                             settings["writePackageTag"],
-                             settings["packageTag"],
-                             settings["nrImages"],
+                             settings.writePackageTag,
+                             settings.packageTag,
+                             settings.nrImages,
                              imagingPipelineSettings,
-                             settings["imagingBBS"],
-                             settings["cluster"],
+                             settings.imagingBBS,
+                             settings.cluster,
                              status, nr_tasks,
                              nr_cores_per_task,
                              miscParameters)
-    writeFolderEnd(ofile)
+    graph.write(writeFolderEnd)
+    return graph
 
 
-def main(argv):
-    try:
-        inputfile, outputfile, status = parseOptions(argv)
-        ofile = open(outputfile, 'w')
+def writeBlock(ofile, settings, projectName, blockNr, status):
+    '''
+    Build the TaskGraph of a checked BLOCK, validate it and write its XML to ofile. Returns the graph.
+    '''
+    graph = buildBlockGraph(settings, projectName, blockNr, status)
+    graph.validate()
+    graph.serialize(ofile)
+    return graph
+
 
-        header, blocks = processInput(inputfile)
+def renderBlock(block, projectName, blockNr, status):
+    """
+    Read, check and write a single BLOCK into a string. This runs in the
+    worker processes of writeBlocksParallel. Returns the XML, the graph of
+    the BLOCK as a dict, the messages printed while processing the BLOCK and
+    the exception raised, if any, so that the parent can output them in
+    block order.
+    """
+    log = StringIO()
+    xml = StringIO()
+    graph = None
+    error = None
+    with logTo(log):
+        try:
+            printMessage("\nProcessing BLOCK %i" % blockNr)
+            settings = readBlock(block, projectName, blockNr)
+            settings = checkSettings(settings, blockNr)
+            with XMLEmitter(xml) as emitter:
+                graph = writeBlock(emitter, settings, projectName, blockNr, status).toDict()
+        except Exception as ex:
+            error = ex
+    return xml.getvalue(), graph, log.getvalue(), error
+
+
+class InlineExecutor(object):
+    '''
+    Stands in for a ProcessPoolExecutor when the BLOCKs are rendered in the main process
+    '''
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
 
+
+def defaultCacheDir():
+    return os.environ.get('XMLGEN_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'xmlgen')
+
+
+class BlockCache(object):
+    '''
+    An on-disk cache of rendered BLOCKs, so that only the BLOCKs that were edited since the last run are parsed and
+    rendered again. An entry holds the XML, the graph and the messages of a BLOCK and is keyed by a hash of the lines
+    of the BLOCK, its number, the project name, the status and VERSION. When the cache is larger than maxSize bytes,
+    prune() removes the least recently used entries.
+    '''
+
+    def __init__(self, directory=None, maxSize=256 * 1024 * 1024):
+        self.directory = directory or defaultCacheDir()
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, block, projectName, blockNr, status):
+        digest = hashlib.sha256()
+        for part in [VERSION, projectName, str(blockNr), status] + list(block):
+            digest.update(part.encode('utf-8') + b'\n')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        '''
+        Returns the (xml, graph, log) of a cached BLOCK, or None if it is not in the cache
+        '''
+        path = self.path(key)
+        try:
+            with open(path, 'r') as entryFile:
+                entry = json.load(entryFile)
+            result = (entry['xml'], entry['graph'], entry['log'])
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, xml, graph, log):
+        path = self.path(key)
+        tmpPath = "%s.%i.tmp" % (path, os.getpid())
+        try:
+            with open(tmpPath, 'w') as entryFile:
+                json.dump({'xml': xml, 'graph': graph, 'log': log}, entryFile)
+            os.replace(tmpPath, path)  # readers never see a partial entry
+        except OSError as ex:
+            printWarning("could not write to the BLOCK cache: %s" % ex)
+
+    def prune(self):
+        '''
+        Remove the least recently used entries until the cache is no larger than maxSize bytes
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entrySize, path in sorted(entries):
+            if size <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entrySize
+
+
+def writeBlocksParallel(ofile, blocks, projectName, status, jobs, graphs=None, cache=None):
+    """
+    Render the BLOCKs on a pool of jobs processes (in this process if jobs is
+    1) and write them to ofile in block order. At most 2*jobs BLOCKs are in
+    flight at any time, so that a streamed input still only needs a bounded
+    amount of memory. The graphs of the BLOCKs are appended to graphs, if
+    given, as dicts. BLOCKs found in cache, a BlockCache, are not rendered
+    again; the others are added to it.
+    """
+    pending = deque()
+
+    def writeNext():
+        key, future = pending.popleft()
+        xml, graph, log, error = future.result()
+        logFile().write(log)
+        if error is not None:
+            raise error
+        if key is not None:
+            cache.put(key, xml, graph, log)
+        ofile.write(xml)
+        if graphs is not None:
+            graphs.append(graph)
+
+    with ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else InlineExecutor() as pool:
+        for index, block in enumerate(blocks):
+            key = cached = None
+            if cache is not None:
+                key = cache.key(block, projectName, index + 1, status)
+                cached = cache.get(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached + (None,))
+                pending.append((None, future))
+            else:
+                pending.append((key, pool.submit(renderBlock, block, projectName, index + 1, status)))
+            if len(pending) >= 2 * jobs:
+                writeNext()
+        while pending:
+            writeNext()
+
+
+def parallelJobs(blocks, jobs):
+    """
+    Returns the BLOCKs and the number of processes to render them with for
+    -j jobs: at most one per CPU core, and 1 (serial) if there are fewer
+    than PARALLEL_MIN_BLOCKS BLOCKs. Only the first PARALLEL_MIN_BLOCKS
+    BLOCKs of a streamed input are read ahead to count them.
+    """
+    jobs = min(jobs, os.cpu_count() or 1)
+    if jobs > 1:
+        blocks = iter(blocks)
+        head = list(itertools.islice(blocks, PARALLEL_MIN_BLOCKS))
+        if len(head) < PARALLEL_MIN_BLOCKS:
+            jobs = 1
+        blocks = itertools.chain(head, blocks)
+    return blocks, jobs
+
+
+def writeXML(ofile, header, blocks, status="opened", jobs=1, graphs=None, cache=None, layout=None, log=None):
+    """
+    Write the XML for a parsed input to ofile. header and blocks are as
+    returned by splitBlocks; blocks can also be an iterator, such as the one
+    from iterBlocks, in which case each BLOCK is read, checked and written
+    before the next one is read. With jobs > 1, the BLOCKs are rendered in
+    parallel on a pool of worker processes if there are enough of them (see parallelJobs); the output is the same.
+    ofile can be a file, a pipe, an io.StringIO or an
+    XMLEmitter. If graphs is a list, the TaskGraph of each BLOCK is appended to it as a dict (see TaskGraph.toDict).
+    BLOCKs that are in cache, a BlockCache, are copied from it instead of being rendered again. layout is None to
+    keep the indentation of the templates, 'compact' or 'pretty' (see XMLEmitter). The messages are written to log, a
+    file-like object, if given, and to sys.stdout otherwise. Raises GenException on invalid input.
+    """
+    if not isinstance(ofile, XMLEmitter):
+        ofile = XMLEmitter(ofile, layout=layout)
+    with logTo(log), ofile:
         projectName, mainFolderName, mainFolderDescription = processHeader(header)
         writeProjectStart(ofile, VERSION, projectName)
         if mainFolderName:
             writeMainFolderStart(ofile, mainFolderName, mainFolderDescription)
-        for index, block in enumerate(blocks):
-            printMessage("\nProcessing BLOCK %i" % (index + 1))
-            settings = readBlock(block, projectName, index + 1)
-            settings = checkSettings(settings, index + 1)
-            writeBlock(ofile, settings, projectName, index + 1, status)
+        if jobs > 1:
+            blocks, jobs = parallelJobs(blocks, jobs)
+        if jobs > 1 or cache is not None:
+            writeBlocksParallel(ofile, blocks, projectName, status, jobs, graphs, cache)
+        else:
+            for index, block in enumerate(blocks):
+                printMessage("\nProcessing BLOCK %i" % (index + 1))
+                settings = readBlock(block, projectName, index + 1)
+                settings = checkSettings(settings, index + 1)
+                graph = writeBlock(ofile, settings, projectName, index + 1, status)
+                if graphs is not None:
+                    graphs.append(graph.toDict())
         if mainFolderName:
             writeMainFolderEnd(ofile)
         writeProjectEnd(ofile)
-        # TODO make things not write to the ofile directly
-        # for b in block:
-        #   output += generateBlock()
-        #  ofile.write(output)
-        ofile.close()
+        if cache is not None:
+            cache.prune()
+            printInfo("reused %i of %i BLOCKs from the cache in %s" % (cache.hits, cache.hits + cache.misses,
+                                                                        cache.directory))
+
+
+def generate(text, ofile=None, status="opened", jobs=1, cache=None, layout=None, log=None):
+    """
+    Convert an input text (a string or a list of lines) to XML. The XML is
+    written to ofile if given, otherwise it is returned as a string. This is
+    the entry point for using xmlgen as a library; it raises GenException
+    instead of exiting on invalid input. cache is an optional BlockCache,
+    layout is None, 'compact' or 'pretty'. The messages go to log, a
+    file-like object, if given, and to sys.stdout otherwise.
+    """
+    if isinstance(text, str):
+        text = text.splitlines()
+    with logTo(log):
+        blocks = iterBlocks(text)
+        header = next(blocks)
+        if ofile is not None:
+            writeXML(ofile, header, blocks, status, jobs, cache=cache, layout=layout)
+            return None
+        output = StringIO()
+        writeXML(output, header, blocks, status, jobs, cache=cache, layout=layout)
+    return output.getvalue()
+
+
+def convertFile(inputfile, outputfile, status="opened", jobs=1, graphfile=None, cache=None, layout=None, log=None):
+    """
+    Convert the input text file inputfile to the XML file outputfile. The
+    input is streamed one BLOCK at a time. outputfile is only written if the
+    conversion succeeds. Either file can be compressed, see openFile. If graphfile is given, the graphs
+    of the BLOCKs are also exported to it as JSON. cache is an optional
+    BlockCache, layout is None, 'compact' or 'pretty'. The messages go to
+    log, a file-like object, if given, and to sys.stdout otherwise. Raises
+    GenException on invalid input.
+    """
+    graphs = [] if graphfile else None
+    with logTo(log):
+        with openFile(inputfile, 'r') as ifile:
+            blocks = iterBlocks(ifile)
+            header = next(blocks)
+            with writeOnSuccess(outputfile) as tmpfile, openFile(tmpfile, 'w') as ofile:
+                writeXML(ofile, header, blocks, status, jobs, graphs, cache, layout)
+        if graphfile:
+            with openFile(graphfile, 'w') as gfile:
+                json.dump({"version": VERSION, "input": inputfile, "blocks": graphs}, gfile, indent=1)
+            printInfo("wrote the observation graph to %s" % graphfile)
+
+
+def findBatchInputs(pattern):
+    """
+    Returns the input files for --batch: the .txt files (also compressed) in
+    the directory pattern, or the files matching the glob pattern, sorted by
+    name.
+    """
+    if os.path.isdir(pattern):
+        patterns = [os.path.join(pattern, '*.txt' + extension) for extension in [''] + list(COMPRESSION_MODULES)]
+    else:
+        patterns = [pattern]
+    inputfiles = sorted(path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path))
+    if not inputfiles:
+        raise GenException("No input files found for --batch " + pattern)
+    return inputfiles
+
+
+def defaultManifestName(inputfiles, outputdir=None):
+    """
+    Returns the name of the manifest for --batch when none is given:
+    manifest.json in outputdir, or, without outputdir, in the directory that
+    contains all inputfiles, as the XML files are written next to them.
+    """
+    if not outputdir:
+        outputdir = os.path.commonpath([os.path.dirname(os.path.abspath(inputfile)) for inputfile in inputfiles])
+    return os.path.join(outputdir, 'manifest.json')
+
+
+def convertBatchFile(inputfile, outputfile, status="opened", cachedir=None, layout=None):
+    """
+    Convert a single file of a batch. This runs in the worker processes of
+    convertBatch; the messages of xmlgen are captured instead of printed.
+    Returns a dictionary that summarises the result for the manifest.
+    """
+    startTime = time.time()
+    result = {'input': inputfile, 'output': outputfile, 'status': 'ok', 'size': None, 'warnings': [],
+              'error': None}
+    log = StringIO()
+    with logTo(log):
+        try:
+            cache = BlockCache(cachedir) if cachedir else None
+            convertFile(inputfile, outputfile, status, cache=cache, layout=layout)
+            result['size'] = os.path.getsize(outputfile)
+        except Exception as ex:
+            result['status'] = 'failed'
+            if isinstance(ex, GenException):
+                result['error'] = ex.message
+            else:
+                result['error'] = "%s: %s" % (type(ex).__name__, ex)
+    result['warnings'] = [line.split('WARNING: ', 1)[1].replace(NO_COLOR, '')
+                          for line in log.getvalue().splitlines() if 'WARNING: ' in line]
+    result['wallTime'] = time.time() - startTime
+    return result
+
+
+def findOutputCollisions(outputfiles):
+    '''
+    Returns {index: first index} for the files of a batch that would write the same XML file as an earlier one, like
+    a.txt and a.txt.gz in the same directory
+    '''
+    first = {}
+    collisions = {}
+    for index, outputfile in enumerate(outputfiles):
+        path = os.path.normcase(os.path.abspath(outputfile))
+        if path in first:
+            collisions[index] = first[path]
+        else:
+            first[path] = index
+    return collisions
+
+
+def convertBatch(inputfiles, outputdir=None, status="opened", jobs=None, cachedir=None, manifest=None, layout=None):
+    """
+    Convert all inputfiles in one run, on a pool of jobs worker processes
+    (one per CPU core by default). Each XML file is written next to its
+    input file, or to outputdir if given. A file that fails does not stop
+    the others. A file that would write the same XML file as an earlier one,
+    like a.txt and a.txt.gz, fails without being converted. The per-file results are written to the JSON file manifest,
+    if given. Returns the list of results in the order of inputfiles.
+    """
+    startTime = time.time()
+    if outputdir:
+        os.makedirs(outputdir, exist_ok=True)
+    outputfiles = [defaultOutputName(inputfile, outputdir) for inputfile in inputfiles]
+    nFiles = len(inputfiles)
+    # Files that would overwrite the XML of an earlier file fail, instead of racing it in the pool
+    collisions = findOutputCollisions(outputfiles)
+    converted = [index for index in range(nFiles) if index not in collisions]
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        outcomes = pool.map(convertBatchFile, [inputfiles[index] for index in converted],
+                            [outputfiles[index] for index in converted], [status] * len(converted),
+                            [cachedir] * len(converted), [layout] * len(converted))
+        for index in range(nFiles):
+            if index in collisions:
+                result = {'input': inputfiles[index], 'output': outputfiles[index], 'status': 'failed', 'size': None,
+                          'warnings': [], 'error': "writes the same XML file as %s" % inputfiles[collisions[index]],
+                          'wallTime': 0.}
+            else:
+                result = next(outcomes)
+            if result['status'] == 'ok':
+                printMessage("%s -> %s (%i bytes, %.2f s)" % (result['input'], result['output'], result['size'],
+                                                              result['wallTime']))
+            else:
+                printError("%s: %s" % (result['input'], result['error']))
+            for warning in result['warnings']:
+                printWarning("%s: %s" % (result['input'], warning))
+            results.append(result)
+
+    nFailed = len([result for result in results if result['status'] != 'ok'])
+    summary = {'version': VERSION, 'files': nFiles, 'failed': nFailed, 'wallTime': time.time() - startTime,
+               'results': results}
+    printInfo("Converted %i files in %.1f s, %i failed" % (nFiles, summary['wallTime'], nFailed))
+    if manifest:
+        with open(manifest, 'w') as mfile:
+            json.dump(summary, mfile, indent=2)
+        printInfo("Manifest written to " + manifest)
+    return results
+
+
+def convertText(text, status="opened", cachedir=None, layout=None):
+    """
+    Convert an input text to XML for the conversion server. This runs in its
+    worker processes; the messages of xmlgen are captured instead of printed.
+    Returns the XML (None on failure), the HTTP status code, the error message
+    and the warnings.
+    """
+    log = StringIO()
+    xml, code, error = None, 200, None
+    with logTo(log):
+        try:
+            xml = generate(text, status=status, cache=BlockCache(cachedir) if cachedir else None, layout=layout)
+        except GenException as ex:
+            code, error = 400, ex.message
+        except Exception as ex:
+            code, error = 500, "%s: %s" % (type(ex).__name__, ex)
+    warnings = [line.split('WARNING: ', 1)[1].replace(NO_COLOR, '')
+                for line in log.getvalue().splitlines() if 'WARNING: ' in line]
+    return xml, code, error, warnings
+
+
+def ignoreInterrupts():
+    '''
+    Initializer of the server workers: only the server itself handles Ctrl-C
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ServerMetrics(object):
+    '''
+    Request counters of the conversion server and the latencies of its last window conversions. The handler threads
+    update it concurrently, hence the lock.
+    '''
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.startTime = time.time()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.active = 0
+        self.codes = {}
+
+    def start(self):
+        with self.lock:
+            self.active += 1
+
+    def record(self, code, latency):
+        with self.lock:
+            self.active -= 1
+            self.requests += 1
+            self.codes[code] = self.codes.get(code, 0) + 1
+            self.latencies.append(latency)
+
+    def toDict(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            metrics = {"version": VERSION, "uptime": time.time() - self.startTime, "requests": self.requests,
+                       "active": self.active, "status": {str(code): n for code, n in sorted(self.codes.items())}}
+        if latencies:
+            percentile = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+            metrics["latency_ms"] = {"window": len(latencies), "mean": round(sum(latencies) * 1000 / len(latencies), 3),
+                                     "p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99),
+                                     "max": round(latencies[-1] * 1000, 3)}
+        return metrics
+
+
+def makeServer(pool, metrics, port=DEFAULT_SERVER_PORT, socketPath=None, cachedir=None, threads=8, layout=None,
+               idleTimeout=SERVER_IDLE_TIMEOUT):
+    """
+    Create the HTTP server of --serve, on localhost:port or on the UNIX
+    socket socketPath. layout is the default of the ?layout= parameter. Requests are handled by a pool of threads threads,
+    the conversions run on the process pool pool so that each worker keeps
+    xmlgen loaded between requests. A connection is closed when the client
+    sends nothing for idleTimeout seconds. http.server is imported here because it
+    takes longer to load than the rest of xmlgen.
+    """
+    import socketserver
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+
+    class ConversionHandler(BaseHTTPRequestHandler):
+        server_version = "xmlgen/" + VERSION
+        protocol_version = "HTTP/1.1"
+        timeout = idleTimeout  # a keep-alive connection occupies a thread of the pool until it is closed
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == '/metrics':
+                self.reply(200, 'application/json', json.dumps(metrics.toDict(), indent=1) + '\n')
+            elif path == '/':
+                self.reply(200, 'text/plain', 'xmlgen %s: POST an input text to / to convert it\n' % VERSION)
+            else:
+                self.reply(404, 'text/plain', 'Not found: %s\n' % path)
+
+        def do_POST(self):
+            startTime = time.perf_counter()
+            metrics.start()
+            url = urlsplit(self.path)
+            code, warnings = 200, []
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                text = self.rfile.read(length).decode('utf-8')
+                if url.path not in ('/', '/convert'):
+                    code, body = 404, 'Not found: %s\n' % url.path
+                else:
+                    query = parse_qs(url.query)
+                    status = "approved" if query.get('status') == ['approved'] else "opened"
+                    requestLayout = query.get('layout', [layout])[0] or None
+                    if requestLayout not in (None, 'none') and requestLayout not in LAYOUT_FILTERS:
+                        raise ValueError("unknown layout '%s'" % requestLayout)
+                    if requestLayout == 'none':
+                        requestLayout = None
+                    xml, code, error, warnings = pool.submit(convertText, text, status, cachedir,
+                                                             requestLayout).result()
+                    body = xml if code == 200 else error + '\n'
+            except (ValueError, UnicodeDecodeError) as ex:
+                code, body = 400, 'Invalid request: %s\n' % ex
+            except Exception as ex:
+                code, body = 500, '%s: %s\n' % (type(ex).__name__, ex)
+            try:
+                self.reply(code, 'application/xml' if code == 200 else 'text/plain', body, warnings)
+            finally:
+                metrics.record(code, time.perf_counter() - startTime)
+
+        def reply(self, code, contentType, body, warnings=()):
+            data = body.encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', contentType + '; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            for warning in warnings:
+                self.send_header('X-Xmlgen-Warning', warning)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def address_string(self):
+            # The clients of a UNIX socket have no address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    if socketPath:
+        base = socketserver.UnixStreamServer
+        address = socketPath
+        if os.path.exists(socketPath):
+            if not stat.S_ISSOCK(os.stat(socketPath).st_mode):
+                raise GenException("%s exists and is not a socket" % socketPath)
+            os.remove(socketPath)  # left behind by a server that did not stop cleanly
+    else:
+        base = HTTPServer
+        address = ('127.0.0.1', port)
+
+    class ConversionServer(socketserver.ThreadingMixIn, base):
+        def process_request(self, request, client_address):
+            self.threads.submit(self.process_request_thread, request, client_address)
+
+        def server_close(self):
+            super().server_close()
+            self.threads.shutdown()
+
+    server = ConversionServer(address, ConversionHandler)
+    server.threads = ThreadPoolExecutor(max_workers=threads)
+    return server
+
+
+def serve(port=DEFAULT_SERVER_PORT, socketPath=None, jobs=None, cachedir=None, layout=None):
+    """
+    Run a conversion server on localhost:port or on the UNIX socket
+    socketPath until it is interrupted. Up to jobs requests (one per CPU core
+    by default) are converted in parallel; the worker processes are started
+    before the first request, so a request does not pay for loading Python.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    metrics = ServerMetrics()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=ignoreInterrupts) as pool:
+        for future in [pool.submit(os.getpid) for i in range(jobs)]:
+            future.result()
+        server = makeServer(pool, metrics, port, socketPath, cachedir, threads=4 * jobs, layout=layout)
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, stop)
+        if socketPath:
+            printInfo("serving on %s with %i workers" % (socketPath, jobs))
+        else:
+            printInfo("serving on http://%s:%i/ with %i workers" % (server.server_address[0],
+                                                                    server.server_address[1], jobs))
+        sys.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if socketPath and os.path.exists(socketPath):
+                os.remove(socketPath)
+    printInfo("served %i requests" % metrics.requests)
+
+
+def main(argv):
+    failed = False
+    try:
+        options = parseOptions(argv)
+        if options.serve:
+            serve(options.port, options.socket, options.jobs, options.cachedir, options.layout)
+        elif options.batch:
+            inputfiles = findBatchInputs(options.batch)
+            manifest = options.manifest or defaultManifestName(inputfiles, options.outputfile)
+            results = convertBatch(inputfiles, options.outputfile, options.status, options.jobs, options.cachedir,
+                                   manifest, options.layout)
+            failed = any(result['status'] != 'ok' for result in results)
+        else:
+            cache = BlockCache(options.cachedir) if options.cachedir else None
+            convertFile(options.inputfile, options.outputfile, options.status, options.jobs, options.graphfile, cache,
+                        options.layout)
     except:
         import traceback
         traceback.print_exc(file=sys.stdout)
         print("something went wrong here, now aborting")
         exit(1)
+    if failed:
+        exit(1)
 
 
 if __name__ == "__main__":